@@ -0,0 +1,4 @@
+"""Performance benchmarks for mockfs.
+
+Each module can be run directly, e.g. ``python -m benchmarks.lookup``.
+"""
@@ -0,0 +1,41 @@
+"""Measure the throughput of MockFS.add_entries() for large fixture trees.
+
+The documented target is about one second for 1M sorted entries.
+
+Usage: ``python -m benchmarks.add_entries``
+"""
+
+import random
+import time
+
+import mockfs
+
+COUNTS = (10000, 100000, 1000000)
+
+
+def make_entries(count):
+    """Return sorted (path, content) pairs spread over 100 entries per directory"""
+    return [
+        ('/src/pkg%d/mod%d/file%d.py' % (idx // 10000, idx // 100 % 100, idx), '')
+        for idx in range(count)
+    ]
+
+
+def load(entries):
+    """Return the time taken to load 'entries' into a new MockFS"""
+    start = time.perf_counter()
+    mockfs.MockFS(entries=iter(entries))
+    return time.perf_counter() - start
+
+
+def main():
+    print('%10s %10s %14s' % ('entries', 'order', 'entries/sec'))
+    for count in COUNTS:
+        entries = make_entries(count)
+        print('%10d %10s %14.0f' % (count, 'sorted', count / load(entries)))
+        random.shuffle(entries)
+        print('%10d %10s %14.0f' % (count, 'shuffled', count / load(entries)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare building a fixture tree with add_entries() and loading it from an image.
+
+A tree of ``--files`` files is built from (path, content) pairs, saved with
+``MockFS.save_image()`` and loaded back with ``MockFS.load_image()``. The
+load is timed on its own and together with reading a sample of files.
+
+Usage: ``python -m benchmarks.image [--files N]``
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import mockfs
+
+# Files in each directory
+FANOUT = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=400000)
+    args = parser.parse_args()
+
+    entries = [
+        ('/src/d%d/f%d.py' % (idx // FANOUT, idx), 'content %d\n' % idx)
+        for idx in range(args.files)
+    ]
+    sample = random.Random(0).sample(entries, min(len(entries), 1000))
+
+    start = time.perf_counter()
+    mfs = mockfs.MockFS(entries=entries)
+    built = time.perf_counter() - start
+
+    fd, path = tempfile.mkstemp(suffix='.img')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        mfs.save_image(path)
+        saved = time.perf_counter() - start
+
+        mfs = mockfs.MockFS()
+        start = time.perf_counter()
+        mfs.load_image(path)
+        loaded = time.perf_counter() - start
+        for name, content in sample:
+            assert mfs.read(name) == content
+        sampled = time.perf_counter() - start
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+    print('%-24s %10.3f s' % ('add_entries', built))
+    print('%-24s %10.3f s (%d bytes)' % ('save_image', saved, size))
+    print('%-24s %10.6f s' % ('load_image', loaded))
+    print('%-24s %10.3f s' % ('load_image + %d reads' % len(sample), sampled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Compare path lookups through the flat index against walking the tree.
+
+Usage: ``python -m benchmarks.lookup [--number N]``
+"""
+
+import argparse
+import timeit
+
+import mockfs
+
+DEPTHS = (5, 20, 50)
+
+
+def build(depth):
+    """Return a MockFS with a single chain of directories 'depth' levels deep"""
+    dirname = ''.join('/d%d' % idx for idx in range(depth))
+    path = dirname + '/file'
+    return mockfs.MockFS(entries={path: 'content'}), path
+
+
+def nested_lookup(mfs, path):
+    """Resolve a path by walking the nested entries from the root"""
+    path = mfs.abspath(path)
+    current = mfs._entries
+    for name in path.split('/')[1:]:
+        if name not in current:
+            return None
+        current = current[name]
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    print('%6s %14s %14s %8s' % ('depth', 'nested (us)', 'index (us)', 'speedup'))
+    for depth in DEPTHS:
+        mfs, path = build(depth)
+        nested = timeit.timeit(
+            lambda mfs=mfs, path=path: nested_lookup(mfs, path), number=args.number
+        )
+        index = timeit.timeit(
+            lambda mfs=mfs, path=path: mfs._direntry(path), number=args.number
+        )
+        print(
+            '%6d %14.3f %14.3f %7.1fx'
+            % (
+                depth,
+                nested / args.number * 1e6,
+                index / args.number * 1e6,
+                nested / index,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Report the memory used per entry by fixture-like trees.
+
+The fixture mimics a large source tree: every directory holds an empty
+``__init__.py``, a licence file, generated stubs with identical contents
+and modules with unique contents. Contents are built separately for each
+file, as if they had been read from disk.
+
+Each layout is measured with :mod:`tracemalloc` in a fresh tree:
+
+* ``nested``: plain nested dicts, the layout used before MockFS 2.1
+* ``mockfs``: a MockFS, whose names are interned
+* ``dedup``: a MockFS with ``dedup_contents=True``
+
+Build times include the tracing overhead.
+
+Usage: ``python -m benchmarks.memory [--entries N]``
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+import mockfs
+
+# Entries per directory
+FANOUT = 100
+LICENSE = '# Licensed under the MIT license. See LICENSE for details.\n' * 8
+STUB = 'def generated(*args, **kwargs): ...\n' * 4
+
+
+def _copy(text):
+    """Return an equal but distinct string"""
+    return (text + '.')[:-1]
+
+
+def entries(count):
+    """Yield (path, content) pairs for a fixture-like tree"""
+    for idx in range(count):
+        dirname = '/src/pkg%d/sub' % (idx // FANOUT)
+        slot = idx % FANOUT
+        if slot == 0:
+            yield dirname + '/__init__.py', ''
+        elif slot == 1:
+            yield dirname + '/LICENSE', _copy(LICENSE)
+        elif slot < FANOUT // 2:
+            yield dirname + '/stub%02d.pyi' % slot, _copy(STUB)
+        else:
+            yield dirname + '/mod%02d.py' % slot, 'VALUE = %d\n' % idx
+
+
+def nested(count):
+    """Build plain nested dicts without interning"""
+    root = {}
+    for path, content in entries(count):
+        current = root
+        names = path.split('/')[1:]
+        for name in names[:-1]:
+            current = current.setdefault(name, {})
+        current[names[-1]] = content
+    return root
+
+
+def build_mockfs(count, **kwargs):
+    mfs = mockfs.MockFS(**kwargs)
+    mfs.add_entries(entries(count))
+    return mfs
+
+
+LAYOUTS = (
+    ('nested', nested),
+    ('mockfs', build_mockfs),
+    ('dedup', lambda count: build_mockfs(count, dedup_contents=True)),
+)
+
+
+def measure(build, count):
+    """Return the traced bytes held by the result of build(count) and the time"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(count)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print('%-8s %12s %12s %10s' % ('layout', 'total (MB)', 'bytes/entry', 'build (s)'))
+    for name, build in LAYOUTS:
+        result, size, elapsed = measure(build, args.entries)
+        print(
+            '%-8s %12.1f %12.1f %10.2f'
+            % (name, size / 1e6, size / float(args.entries), elapsed)
+        )
+        if name == 'dedup':
+            info = result.content_info()
+            print(
+                'content store: %d distinct contents, %d references, %d bytes'
+                % (info.distinct, info.references, info.size)
+            )
+        del result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure os.stat() throughput on a MockFS and on a real directory.
+
+A tree of ``--files`` files is built in a MockFS and, up to ``--real-max``
+files, in a temporary directory, preferably on tmpfs. The same sampled
+paths are then passed to ``os.stat()`` ``--calls`` times: directly on the
+MockFS, through the replaced ``os.stat()``, and on the real directory.
+
+Usage: ``python -m benchmarks.stat [--files N] [--calls N] [--real-dir DIR]``
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import mockfs
+
+# Files in each directory
+FANOUT = 100
+
+
+def paths(root, count):
+    return ['%s/d%d/f%d' % (root, idx // FANOUT, idx) for idx in range(count)]
+
+
+def run(stat, sample, calls):
+    """Return the number of stat() calls per second"""
+    rounds, rest = divmod(calls, len(sample))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in sample:
+            stat(path)
+    for path in sample[:rest]:
+        stat(path)
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--calls', type=int, default=1000000)
+    parser.add_argument('--real-max', type=int, default=10000)
+    parser.add_argument('--real-dir', default=None)
+    args = parser.parse_args()
+
+    files = paths('/data', args.files)
+    sample = random.Random(0).sample(files, min(len(files), 10000))
+    mfs = mockfs.MockFS(entries=((path, 'content') for path in files))
+
+    print('%-12s %14s %10s' % ('target', 'stats/s', 'us/stat'))
+    results = [('MockFS.stat', run(mfs.stat, sample, args.calls))]
+    with mfs:
+        results.append(('os.stat', run(os.stat, sample, args.calls)))
+
+    root = tempfile.mkdtemp(dir=args.real_dir)
+    try:
+        real = paths(root, min(args.files, args.real_max))
+        for path in real:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as fh:
+                fh.write('content')
+        real_sample = random.Random(0).sample(real, min(len(real), 10000))
+        results.append(('real os.stat', run(os.stat, real_sample, args.calls)))
+    finally:
+        shutil.rmtree(root)
+
+    for name, rate in results:
+        print('%-12s %14.0f %10.3f' % (name, rate, 1e6 / rate))
+
+
+if __name__ == '__main__':
+    main()
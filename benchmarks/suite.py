@@ -0,0 +1,263 @@
+"""Benchmark MockFS operations across synthetic trees of varying size and depth.
+
+Every operation is written against the standard :mod:`os`, :mod:`glob`,
+:mod:`shutil` and :func:`open` functions so that the exact same code runs
+against a MockFS (with the builtins replaced) and against a real directory,
+preferably on tmpfs.
+
+Results are written as JSON for regression tracking, and a progress table
+is written to stderr.
+
+Usage::
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --sizes 1000 10000 --depths 2 20 --real-dir /dev/shm
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import mockfs
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_DEPTHS = (2, 5, 20, 50)
+# Real trees are slow to create, so they are only built up to this size
+DEFAULT_REAL_MAX = 10000
+# Number of files in each leaf directory
+FANOUT = 100
+# Number of paths sampled for the per-path operations
+SAMPLES = 1000
+LINE = 'INFO request handled\n'
+LINES = 20000
+
+
+class Tree(object):
+    """A synthetic tree of 'size' files in leaf directories 'depth' levels deep"""
+
+    def __init__(self, root, size, depth):
+        self.root = root
+        self.size = size
+        self.depth = depth
+        leaves = max(1, size // FANOUT)
+        chain = ''.join('/l%d' % level for level in range(depth - 1))
+        self.dirs = [root + '/p%d' % idx + chain for idx in range(leaves)]
+        self.files = [
+            '%s/f%d.txt' % (self.dirs[idx % leaves], idx) for idx in range(size)
+        ]
+        self.files.sort()
+
+    def entries(self):
+        """Yield (path, content) pairs for MockFS.add_entries()"""
+        for path in self.files:
+            yield path, ''
+
+    def sample(self, paths):
+        rng = random.Random(self.size * 100 + self.depth)
+        return [rng.choice(paths) for _ in range(SAMPLES)]
+
+
+def build_real(tree):
+    """Create the tree on disk"""
+    for dirname in tree.dirs:
+        os.makedirs(dirname)
+    for path in tree.files:
+        with open(path, 'w'):
+            pass
+
+
+def bench_exists(tree):
+    paths = tree.sample(tree.files) + [
+        path + '.missing' for path in tree.sample(tree.files)
+    ]
+    exists = os.path.exists
+    start = time.perf_counter()
+    for path in paths:
+        exists(path)
+    return len(paths), time.perf_counter() - start
+
+
+def bench_isdir(tree):
+    paths = tree.sample(tree.dirs)
+    isdir = os.path.isdir
+    start = time.perf_counter()
+    for path in paths:
+        isdir(path)
+    return len(paths), time.perf_counter() - start
+
+
+def bench_listdir(tree):
+    paths = tree.sample(tree.dirs)
+    listdir = os.listdir
+    start = time.perf_counter()
+    for path in paths:
+        listdir(path)
+    return len(paths), time.perf_counter() - start
+
+
+def bench_walk(tree):
+    start = time.perf_counter()
+    count = sum(1 for _ in os.walk(tree.root))
+    return count, time.perf_counter() - start
+
+
+def bench_glob(tree):
+    pattern = tree.root + '/**/f1*.txt'
+    start = time.perf_counter()
+    count = len(glob.glob(pattern, recursive=True))
+    return count, time.perf_counter() - start
+
+
+def bench_write(tree):
+    path = tree.root + '/write.log'
+    start = time.perf_counter()
+    with open(path, 'w') as fh:
+        for _ in range(LINES):
+            fh.write(LINE)
+    return LINES, time.perf_counter() - start
+
+
+def bench_read(tree):
+    path = tree.root + '/write.log'
+    start = time.perf_counter()
+    for _ in range(100):
+        with open(path, 'r') as fh:
+            fh.read()
+    return 100, time.perf_counter() - start
+
+
+def bench_readline(tree):
+    path = tree.root + '/write.log'
+    start = time.perf_counter()
+    with open(path, 'r') as fh:
+        count = sum(1 for _ in fh)
+    return count, time.perf_counter() - start
+
+
+def bench_rmtree(tree):
+    start = time.perf_counter()
+    shutil.rmtree(tree.root)
+    return 1, time.perf_counter() - start
+
+
+# Operations that run on both backends, in order. rmtree must be last.
+OPERATIONS = (
+    ('exists', bench_exists),
+    ('isdir', bench_isdir),
+    ('listdir', bench_listdir),
+    ('walk', bench_walk),
+    ('glob', bench_glob),
+    ('open-write', bench_write),
+    ('open-read', bench_read),
+    ('readline', bench_readline),
+    ('rmtree', bench_rmtree),
+)
+
+
+def record(results, backend, tree, op, count, elapsed):
+    results.append({
+        'backend': backend,
+        'size': tree.size,
+        'depth': tree.depth,
+        'op': op,
+        'count': count,
+        'seconds': elapsed,
+        'us_per_op': elapsed / max(count, 1) * 1e6,
+    })
+    sys.stderr.write(
+        '%-8s %8d %6d %-16s %10d %12.4f %12.3f\n'
+        % (backend, tree.size, tree.depth, op, count, elapsed, results[-1]['us_per_op'])
+    )
+
+
+def run_mockfs(results, size, depth):
+    tree = Tree('/bench', size, depth)
+    mfs = mockfs.MockFS()
+    start = time.perf_counter()
+    mfs.add_entries(tree.entries())
+    record(results, 'mockfs', tree, 'add_entries', size, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(100):
+        mockfs.replace_builtins(context=mfs)
+        mockfs.restore_builtins()
+    record(results, 'mockfs', tree, 'replace+restore', 100, time.perf_counter() - start)
+
+    mockfs.replace_builtins(context=mfs)
+    try:
+        for op, func in OPERATIONS:
+            count, elapsed = func(tree)
+            record(results, 'mockfs', tree, op, count, elapsed)
+    finally:
+        mockfs.restore_builtins()
+
+
+def run_real(results, size, depth, real_dir):
+    tmpdir = tempfile.mkdtemp(prefix='mockfs-bench-', dir=real_dir)
+    try:
+        tree = Tree(os.path.join(tmpdir, 'bench'), size, depth)
+        start = time.perf_counter()
+        build_real(tree)
+        record(results, 'real', tree, 'add_entries', size, time.perf_counter() - start)
+        for op, func in OPERATIONS:
+            count, elapsed = func(tree)
+            record(results, 'real', tree, op, count, elapsed)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def default_real_dir():
+    """Prefer tmpfs for the real filesystem comparison"""
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--depths', type=int, nargs='+', default=DEFAULT_DEPTHS)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--real-dir', default=default_real_dir())
+    parser.add_argument(
+        '--real-max',
+        type=int,
+        default=DEFAULT_REAL_MAX,
+        help='largest tree to create on the real filesystem (0 disables it)',
+    )
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for depth in args.depths:
+            run_mockfs(results, size, depth)
+            if size <= args.real_max:
+                run_real(results, size, depth, args.real_dir)
+
+    report = {
+        'mockfs': mockfs.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'real_dir': args.real_dir,
+        'timestamp': time.time(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Measure read throughput of a thread-safe MockFS as threads are added.
+
+Every thread runs the same mix of exists(), listdir() and read() calls on
+sampled paths. With ``--writers`` additional threads keep creating and
+removing files at the same time.
+
+Readers never wait for each other, but CPython runs Python code in one
+thread at a time, so the aggregate throughput only scales on a
+free-threaded interpreter. On other builds a flat curve shows that the
+lock itself does not serialize readers.
+
+Usage: ``python -m benchmarks.threads [--files N] [--ops N] [--writers N]``
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import mockfs
+
+THREADS = (1, 2, 4, 8, 16)
+
+
+def build(files, thread_safe):
+    entries = [('/data/d%d/f%d' % (idx % 100, idx), 'content') for idx in range(files)]
+    entries.sort()
+    mfs = mockfs.MockFS(thread_safe=thread_safe)
+    mfs.add_entries(entries)
+    return mfs, [path for path, _ in entries]
+
+
+def reader(mfs, paths, ops, seed):
+    rng = random.Random(seed)
+    for _ in range(ops // 3):
+        path = rng.choice(paths)
+        mfs.exists(path)
+        mfs.listdir(path.rsplit('/', 1)[0])
+        mfs.read(path)
+
+
+def writer(mfs, stop, seed):
+    count = 0
+    while not stop.is_set():
+        path = '/scratch/w%d/f%d' % (seed, count % 100)
+        mfs.add_entries({path: 'x'})
+        mfs.remove(path)
+        count += 1
+
+
+def run(mfs, paths, threads, ops, writers):
+    stop = threading.Event()
+    background = [
+        threading.Thread(target=writer, args=(mfs, stop, idx)) for idx in range(writers)
+    ]
+    workers = [
+        threading.Thread(target=reader, args=(mfs, paths, ops, idx))
+        for idx in range(threads)
+    ]
+    for thread in background:
+        thread.start()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in background:
+        thread.join()
+    return threads * (ops // 3) * 3 / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--ops', type=int, default=60000)
+    parser.add_argument('--writers', type=int, default=0)
+    args = parser.parse_args()
+
+    mfs, paths = build(args.files, thread_safe=False)
+    baseline = run(mfs, paths, 1, args.ops, 0)
+    print('unlocked, 1 thread: %.0f ops/s' % baseline)
+
+    mfs, paths = build(args.files, thread_safe=True)
+    print('%8s %14s %10s' % ('threads', 'ops/s', 'vs 1'))
+    single = None
+    for threads in THREADS:
+        throughput = run(mfs, paths, threads, args.ops, args.writers)
+        if single is None:
+            single = throughput
+        print('%8d %14.0f %9.2fx' % (threads, throughput, throughput / single))
+
+
+if __name__ == '__main__':
+    main()
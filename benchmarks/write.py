@@ -0,0 +1,42 @@
+"""Measure the cost of appending records to a mock file.
+
+The time per byte should stay flat as the number of records grows.
+
+Usage: ``python -m benchmarks.write``
+"""
+
+import time
+
+import mockfs
+
+RECORD = b'2024-01-01T00:00:00 INFO request handled in 3ms\n'
+COUNTS = (10000, 100000, 1000000)
+
+
+def append(mfs, count):
+    """Append 'count' records to a new mock file and return the elapsed time"""
+    start = time.perf_counter()
+    with open('/var/log/app.log', 'ab') as fh:
+        for _ in range(count):
+            fh.write(RECORD)
+    elapsed = time.perf_counter() - start
+    mfs.remove('/var/log/app.log')
+    return elapsed
+
+
+def main():
+    mfs = mockfs.replace_builtins({'/var/log': {}})
+    try:
+        print('%10s %12s %12s %10s' % ('records', 'bytes', 'seconds', 'ns/byte'))
+        for count in COUNTS:
+            elapsed = append(mfs, count)
+            size = count * len(RECORD)
+            print(
+                '%10d %12d %12.3f %10.2f' % (count, size, elapsed, elapsed / size * 1e9)
+            )
+    finally:
+        mockfs.restore_builtins()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from .mfs import MockFS, replace_builtins, restore_builtins
+from .nodes import Symlink
 
-__all__ = ('MockFS', 'replace_builtins', 'restore_builtins')
+__all__ = ('MockFS', 'Symlink', 'replace_builtins', 'restore_builtins')
 __version__ = '2.0.0'
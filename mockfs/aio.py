@@ -0,0 +1,203 @@
+"""Awaitable file and :mod:`os` operations backed by MockFS.
+
+The functions follow the aiofiles interface::
+
+    from mockfs import aio
+
+    async with aio.open('/data/log', 'w') as fh:
+        await fh.write('started\n')
+    names = await aio.listdir('/data')
+
+Calls go to the MockFS bound to the current context, or installed with
+:func:`mockfs.replace_builtins`, and to the real functions otherwise.
+The operations run in memory, so they complete without a thread pool and
+without suspending. :func:`set_yield_every` makes them yield to the event
+loop periodically so that fairness between tasks can be tested.
+
+"""
+
+import asyncio
+import itertools
+
+from . import mfs
+
+# Yield to the event loop once every this many operations. 0 never yields.
+_yield_every = 0
+_operations = itertools.count(1)
+
+
+def set_yield_every(count):
+    """Yield to the event loop once every 'count' operations, or never if 0"""
+    global _yield_every
+    if count < 0:
+        raise ValueError('count must not be negative: %r' % count)
+    _yield_every = count
+
+
+async def _checkpoint():
+    """Yield to the event loop when an artificial yield is due"""
+    if _yield_every and not next(_operations) % _yield_every:
+        await asyncio.sleep(0)
+
+
+def _operation(name):
+    """Return an awaitable version of the replaced function 'name'"""
+    dispatch = mfs._dispatchers[name]
+
+    async def operation(*args, **kwargs):
+        await _checkpoint()
+        return dispatch(*args, **kwargs)
+
+    operation.__name__ = name.rsplit('.', 1)[1]
+    operation.__doc__ = 'Awaitable :func:`%s`' % name
+    return operation
+
+
+exists = _operation('os.path.exists')
+getatime = _operation('os.path.getatime')
+getctime = _operation('os.path.getctime')
+getmtime = _operation('os.path.getmtime')
+getsize = _operation('os.path.getsize')
+isdir = _operation('os.path.isdir')
+isfile = _operation('os.path.isfile')
+islink = _operation('os.path.islink')
+lexists = _operation('os.path.lexists')
+listdir = _operation('os.listdir')
+lstat = _operation('os.lstat')
+makedirs = _operation('os.makedirs')
+move = _operation('shutil.move')
+readlink = _operation('os.readlink')
+realpath = _operation('os.path.realpath')
+remove = _operation('os.remove')
+rename = _operation('os.rename')
+replace = _operation('os.replace')
+rmdir = _operation('os.rmdir')
+rmtree = _operation('shutil.rmtree')
+stat = _operation('os.stat')
+symlink = _operation('os.symlink')
+unlink = _operation('os.unlink')
+
+
+async def scandir(path='.'):
+    """Asynchronously iterate over the entries of :func:`os.scandir`"""
+    await _checkpoint()
+    with mfs._dispatchers['os.scandir'](path) as entries:
+        for entry in entries:
+            await _checkpoint()
+            yield entry
+
+
+async def walk(top, topdown=True, onerror=None, followlinks=False):
+    """
+    Asynchronously iterate over the directories of :func:`os.walk`
+
+    With 'topdown', the yielded directory names can be pruned in place.
+
+    """
+    await _checkpoint()
+    for item in mfs._dispatchers['os.walk'](top, topdown, onerror, followlinks):
+        yield item
+        await _checkpoint()
+
+
+def open(name, mode='r', buffering=-1, encoding=None, errors=None, newline=None):
+    """
+    Open a file and return an :class:`AsyncFile`
+
+    The result can be awaited or used with ``async with``.
+
+    """
+    return _Opener(name, mode, buffering, encoding, errors, newline)
+
+
+class _Opener(object):
+    """Awaitable and asynchronous context manager returned by :func:`open`"""
+
+    def __init__(self, name, mode, buffering, encoding, errors, newline):
+        self._args = (name, mode, buffering)
+        self._kwargs = {'encoding': encoding, 'errors': errors, 'newline': newline}
+        self._file = None
+
+    async def _open(self):
+        await _checkpoint()
+        fh = mfs._dispatchers['builtins.open'](*self._args, **self._kwargs)
+        return AsyncFile(fh)
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self):
+        self._file = await self._open()
+        return self._file
+
+    async def __aexit__(self, *excinfo):
+        await self._file.close()
+
+
+class AsyncFile(object):
+    """Awaitable wrapper around a file object"""
+
+    def __init__(self, fh):
+        self._file = fh
+
+    @property
+    def name(self):
+        return self._file.name
+
+    @property
+    def mode(self):
+        return self._file.mode
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def __repr__(self):
+        return '<AsyncFile %r>' % self._file
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await _checkpoint()
+        line = self._file.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excinfo):
+        await self.close()
+
+
+def _awaitable(name):
+    """Return an awaitable method that calls the file method 'name'"""
+
+    async def method(self, *args, **kwargs):
+        await _checkpoint()
+        return getattr(self._file, name)(*args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = 'Awaitable file.%s()' % name
+    return method
+
+
+for _name in (
+    'close',
+    'flush',
+    'read',
+    'readline',
+    'readlines',
+    'seek',
+    'tell',
+    'truncate',
+    'write',
+    'writelines',
+):
+    setattr(AsyncFile, _name, _awaitable(_name))
+del _name
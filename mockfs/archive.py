@@ -0,0 +1,172 @@
+"""Zip and tar archives mounted into a MockFS."""
+
+import posixpath
+import sys
+import tarfile
+import threading
+import time
+import weakref
+import zipfile
+
+from . import storage, util
+from .nodes import Directory, LazyFile, Symlink
+
+# The real open() is captured before replace_builtins() can swap it.
+_open = storage.original_open
+
+# Number of extracted members remembered by each mounted archive
+CACHE_SIZE = 16
+
+
+class Archive(object):
+    """
+    An open zip or tar archive whose members are extracted on demand
+
+    Extracted members are kept in an LRU of 'cache_size' members, so that
+    reading a member again does not decompress it again. A 'cache_size' of
+    0 disables the cache. The archive file stays open until :meth:`close`
+    is called or the archive is garbage collected.
+
+    """
+
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cache = util.LRUCache(cache_size)
+        fh = _open(path, 'rb')
+        try:
+            if zipfile.is_zipfile(fh):
+                fh.seek(0)
+                self._zip = zipfile.ZipFile(fh)
+                self._tar = None
+            else:
+                fh.seek(0)
+                self._zip = None
+                self._tar = tarfile.open(fileobj=fh, mode='r:*')
+        except Exception:
+            fh.close()
+            raise
+        self._fh = fh
+        # Close the file once the mounted entries no longer use the archive
+        self._finalizer = weakref.finalize(self, fh.close)
+
+    @property
+    def closed(self):
+        """True if the archive file is closed"""
+        return self._fh.closed
+
+    def close(self):
+        """Close the archive file. Reading members then raises ValueError."""
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+        self._finalizer()
+
+    def members(self):
+        """
+        Iterate over (path, member) pairs from the archive index
+
+        Members are zipfile.ZipInfo or tarfile.TarInfo objects. Paths are
+        normalized relative to the root of the archive, so members cannot
+        be placed outside of it. Reading the index of a tar archive scans
+        it once.
+
+        """
+        if self._zip is not None:
+            members = ((info.filename, info) for info in self._zip.infolist())
+        else:
+            members = ((info.name, info) for info in self._tar.getmembers())
+        for name, info in members:
+            path = posixpath.normpath('/' + name).lstrip('/')
+            if path:
+                yield path, info
+
+    def link_size(self, member):
+        """Return the size of the file a tar hard link member points to"""
+        return self._tar.getmember(member.linkname).size
+
+    def read(self, member):
+        """Return the contents of 'member', extracting it if needed"""
+        if self._fh.closed:
+            raise ValueError('I/O operation on closed archive: %r' % self.path)
+        data = self._cache.get(member)
+        if data is None:
+            # Archive files have a single file position
+            with self._lock:
+                if self._zip is not None:
+                    data = self._zip.read(member)
+                else:
+                    data = self._tar.extractfile(member).read()
+            self._cache[member] = data
+        return data
+
+    def info(self):
+        """Return a :class:`mockfs.util.CacheInfo` for the extracted members"""
+        return self._cache.info()
+
+
+class ArchiveFile(LazyFile):
+    """A file whose contents are extracted from an archive when it is read"""
+
+    __slots__ = ('archive', 'member')
+
+    def __init__(self, archive, member, size):
+        LazyFile.__init__(self, size)
+        self.archive = archive
+        self.member = member
+
+    def load(self):
+        return self.archive.read(self.member)
+
+
+def build_tree(archive, owner, now):
+    """
+    Return the directory tree listed in the index of 'archive'
+
+    Returns the root directory and whether the tree has symbolic links.
+    Directories missing from the index are created with the time 'now'.
+    Members record their modification times from the archive.
+
+    """
+    intern = sys.intern
+    root = Directory(owner=owner, mtimes={None: now})
+    symlinks = False
+    for path, info in archive.members():
+        dirname, _, name = path.rpartition('/')
+        name = intern(name)
+        parent = root
+        if dirname:
+            for part in dirname.split('/'):
+                child = parent.get(part)
+                if not util.is_dir(child):
+                    child = Directory(owner=owner, mtimes={None: now})
+                    parent[intern(part)] = child
+                parent = child
+        if isinstance(info, zipfile.ZipInfo):
+            if info.is_dir():
+                entry = Directory(owner=owner, mtimes={None: now})
+            else:
+                entry = ArchiveFile(archive, info, info.file_size)
+            mtime = int(time.mktime(info.date_time + (0, 0, -1)) * 1e9)
+        else:
+            if info.isdir():
+                entry = Directory(owner=owner, mtimes={None: now})
+            elif info.issym():
+                entry = Symlink(info.linkname)
+                symlinks = True
+            elif info.isfile():
+                entry = ArchiveFile(archive, info, info.size)
+            elif info.islnk():
+                entry = ArchiveFile(archive, info, archive.link_size(info))
+            else:
+                # Devices and fifos
+                continue
+            mtime = int(info.mtime * 1e9)
+        current = parent.get(name)
+        if util.is_dir(current) and util.is_dir(entry):
+            # Keep the members already listed below the directory
+            entry = current
+        parent[name] = entry
+        parent.mtimes[name] = mtime
+    return root, symlinks
@@ -8,8 +8,10 @@ if PY2:
 
     int_types = (int, long)  # noqa
     string_types = (str, unicode)  # noqa
+    file_types = string_types
 else:
     import builtins  # noqa
 
     int_types = (int,)
     string_types = (str,)
+    file_types = (str, bytes)
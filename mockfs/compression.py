@@ -0,0 +1,153 @@
+"""Compressed storage for large file contents."""
+
+import time
+import zlib
+
+from . import util
+from .nodes import LazyFile
+
+# Contents are compressed in independent blocks of this many characters or
+# bytes so that reads only decompress the blocks they touch.
+BLOCK_SIZE = 256 * 1024
+
+# Number of decompressed blocks remembered by each MockFS
+BLOCK_CACHE_SIZE = 16
+
+DEFAULT_LEVEL = 6
+
+
+class BlockCache(object):
+    """
+    LRU of decompressed blocks shared by the compressed files of a MockFS
+
+    Decompression times are recorded as the 'decompress' operation when
+    'stats' is set to a :class:`mockfs.stats.Stats`.
+
+    """
+
+    def __init__(self, maxsize=BLOCK_CACHE_SIZE):
+        self._cache = util.LRUCache(maxsize)
+        self.stats = None
+
+    def get(self, node, idx):
+        """Return block 'idx' of a compressed file, decompressing it if needed"""
+        key = (node, idx)
+        data = self._cache.get(key)
+        if data is None:
+            data = self._cache[key] = self.decompress(node, idx)
+        return data
+
+    def decompress(self, node, idx):
+        """Decompress block 'idx' of a compressed file without caching it"""
+        stats = self.stats
+        if stats is None:
+            return node.decompress(idx)
+        start = time.perf_counter()
+        data = node.decompress(idx)
+        stats.record('decompress', time.perf_counter() - start)
+        return data
+
+    def info(self):
+        """Return a :class:`mockfs.util.CacheInfo` for the decompressed blocks"""
+        return self._cache.info()
+
+
+class CompressedFile(LazyFile):
+    """
+    A file whose contents are kept zlib-compressed in independent blocks
+
+    Text contents are compressed as UTF-8 and blocks hold 'block_size'
+    characters, so character offsets map directly onto blocks.
+    :meth:`read` and :meth:`find` only decompress the blocks they need.
+
+    """
+
+    __slots__ = ('blocks', 'block_size', 'text', 'has_cr', 'cache')
+
+    def __init__(self, value, level=DEFAULT_LEVEL, cache=None, block_size=None):
+        LazyFile.__init__(self, len(value))
+        if block_size is None:
+            block_size = BLOCK_SIZE
+        self.text = util.is_string(value)
+        # Text with carriage returns needs newline translation when read
+        self.has_cr = self.text and '\r' in value
+        self.block_size = block_size
+        self.cache = cache
+        blocks = []
+        for start in range(0, len(value), block_size):
+            chunk = value[start : start + block_size]
+            if self.text:
+                chunk = chunk.encode('utf-8', 'surrogatepass')
+            blocks.append(zlib.compress(chunk, level))
+        self.blocks = blocks
+
+    @property
+    def compressed_size(self):
+        """Number of bytes used by the compressed blocks"""
+        return sum(len(block) for block in self.blocks)
+
+    def decompress(self, idx):
+        """Return the contents of block 'idx'"""
+        data = zlib.decompress(self.blocks[idx])
+        if self.text:
+            data = data.decode('utf-8', 'surrogatepass')
+        return data
+
+    def block(self, idx):
+        """Return the contents of block 'idx' through the block cache"""
+        if self.cache is None:
+            return self.decompress(idx)
+        return self.cache.get(self, idx)
+
+    def load(self):
+        empty = '' if self.text else b''
+        if self.cache is None:
+            decompress = self.decompress
+        else:
+            cache = self.cache
+
+            def decompress(idx):
+                return cache.decompress(self, idx)
+
+        return empty.join([decompress(idx) for idx in range(len(self.blocks))])
+
+    def read(self, position, size=-1):
+        """Return up to 'size' characters or bytes starting at 'position'"""
+        end = self.size
+        if size >= 0:
+            end = min(end, position + size)
+        if position >= end:
+            return '' if self.text else b''
+        block_size = self.block_size
+        parts = []
+        for idx in range(position // block_size, (end - 1) // block_size + 1):
+            base = idx * block_size
+            parts.append(self.block(idx)[max(position - base, 0) : end - base])
+        if len(parts) == 1:
+            return parts[0]
+        return parts[0][:0].join(parts)
+
+    def readline(self, position, sep, size=-1):
+        """Return the line starting at 'position', ending with 'sep' if found"""
+        if position < self.size:
+            # Most lines end in the block they start in
+            offset = position % self.block_size
+            data = self.block(position // self.block_size)
+            end = data.find(sep, offset)
+            if end != -1 and (size < 0 or end - offset < size):
+                return data[offset : end + 1]
+        end = self.find(sep, position)
+        end = self.size if end == -1 else end + 1
+        if size >= 0:
+            end = min(end, position + size)
+        return self.read(position, max(end - position, 0))
+
+    def find(self, sub, start=0):
+        """Return the offset of the single character 'sub' from 'start', or -1"""
+        block_size = self.block_size
+        for idx in range(start // block_size, len(self.blocks)):
+            base = idx * block_size
+            offset = self.block(idx).find(sub, max(start - base, 0))
+            if offset != -1:
+                return base + offset
+        return -1
@@ -0,0 +1,273 @@
+"""Binary images of whole MockFS trees.
+
+An image is a single file laid out as::
+
+    header | contents | names | nodes
+
+The header locates the other regions. Contents holds the file contents and
+link targets back to back, and names holds the entry names. Nodes is a
+table of fixed-size records in breadth-first order, so the children of a
+directory are consecutive records. A directory record gives the index of
+its first child and the number of children, and a file or link record
+gives the offset and length of its contents. Every record also holds the
+entry's name and modification time in nanoseconds.
+
+Loaded images are memory-mapped. Directories are listed from the node
+table on first use and file contents are copied out of the map when a
+file is read, so opening an image costs the same whatever its size and
+processes that load the same image share its pages.
+
+"""
+
+import collections
+import mmap
+import struct
+
+from . import storage, util
+from .nodes import LazyDirectory, LazyFile, Symlink
+
+# The real functions are captured before replace_builtins() can swap them.
+_open = storage.original_open
+_mmap = mmap.mmap
+
+MAGIC = b'MOCKFSIM'
+VERSION = 1
+
+# magic, version, flags, node count, names offset, names size, nodes offset
+_HEADER = struct.Struct('<8sIIQQQQ')
+# kind, name size, name offset, first child or contents offset,
+# child count or contents size, size in characters, mtime in ns
+_NODE = struct.Struct('<B3xIQQQQq')
+
+# Header flags
+_HAS_SYMLINKS = 1
+
+# Node kinds
+_DIR = 0
+_BYTES = 1
+_TEXT = 2
+_LINK = 3
+
+
+def save(root, path, mtime):
+    """
+    Write the tree below the directory 'root' to an image at 'path'
+
+    'mtime' is called with a directory and the name of one of its children
+    and returns the child's modification time in nanoseconds. The image is
+    written with the real :func:`open` even when the builtins are replaced.
+
+    """
+    records = [[_DIR, 0, 0, 0, 0, 0, 0]]
+    names = bytearray()
+    flags = 0
+    queue = collections.deque([(root, records[0])])
+    with _open(path, 'wb') as fh:
+        fh.write(b'\0' * _HEADER.size)
+        offset = _HEADER.size
+        while queue:
+            directory, record = queue.popleft()
+            record[3] = len(records)
+            record[4] = len(directory)
+            for name, entry in directory.items():
+                encoded = _encode(name)
+                child = [
+                    _DIR,
+                    len(encoded),
+                    len(names),
+                    0,
+                    0,
+                    0,
+                    mtime(directory, name),
+                ]
+                names += encoded
+                records.append(child)
+                if util.is_dir(entry):
+                    queue.append((entry, child))
+                    continue
+                if type(entry) is Symlink:
+                    child[0] = _LINK
+                    data = _encode(entry.target)
+                    flags |= _HAS_SYMLINKS
+                else:
+                    if isinstance(entry, LazyFile):
+                        entry = entry.load()
+                    if util.is_string(entry):
+                        child[0] = _TEXT
+                        data = _encode(entry)
+                    elif isinstance(entry, (bytes, bytearray, memoryview, mmap.mmap)):
+                        child[0] = _BYTES
+                        data = entry
+                    else:
+                        raise TypeError('cannot save %r in an image' % (entry,))
+                    child[5] = len(entry)
+                child[3] = offset
+                child[4] = len(data)
+                fh.write(data)
+                offset += len(data)
+        fh.write(names)
+        nodes_offset = offset + len(names)
+        pack = _NODE.pack
+        fh.write(b''.join([pack(*record) for record in records]))
+        fh.seek(0)
+        fh.write(
+            _HEADER.pack(
+                MAGIC, VERSION, flags, len(records), offset, len(names), nodes_offset
+            )
+        )
+
+
+def load(path):
+    """
+    Return the root directory of the image at 'path' and its flags
+
+    Raises ValueError when 'path' is not an image or when its header
+    points outside of the file. Records that point outside of their regions
+    raise ValueError when their directory is listed.
+
+    """
+    with _open(path, 'rb') as fh:
+        try:
+            data = _mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            data = b''
+    if len(data) < _HEADER.size:
+        raise ValueError('not a mockfs image: %r' % path)
+    (
+        magic,
+        version,
+        flags,
+        count,
+        names_offset,
+        names_size,
+        nodes_offset,
+    ) = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a mockfs image: %r' % path)
+    if version != VERSION:
+        raise ValueError('unsupported mockfs image version %d: %r' % (version, path))
+    if (
+        count < 1
+        or names_offset < _HEADER.size
+        or names_offset + names_size > nodes_offset
+        or nodes_offset + count * _NODE.size > len(data)
+    ):
+        raise ValueError('corrupt mockfs image: %r' % path)
+    image = Image(data, names_offset, names_size, nodes_offset, count)
+    if image.node(0)[0] != _DIR:
+        raise ValueError('corrupt mockfs image: %r' % path)
+    return image.directory(0), bool(flags & _HAS_SYMLINKS)
+
+
+class Image(object):
+    """A memory-mapped image and the offsets of its regions"""
+
+    __slots__ = ('data', 'names_offset', 'names_size', 'nodes_offset', 'count')
+
+    def __init__(self, data, names_offset, names_size, nodes_offset, count):
+        self.data = data
+        self.names_offset = names_offset
+        self.names_size = names_size
+        self.nodes_offset = nodes_offset
+        self.count = count
+
+    def node(self, idx):
+        """Return the fields of node record 'idx'"""
+        if not 0 <= idx < self.count:
+            raise ValueError('corrupt mockfs image: node %d out of range' % idx)
+        return _NODE.unpack_from(self.data, self.nodes_offset + idx * _NODE.size)
+
+    def nodes(self, first, count):
+        """Iterate over the fields of 'count' node records from 'first'"""
+        if first < 0 or first + count > self.count:
+            raise ValueError('corrupt mockfs image: node %d out of range' % first)
+        start = self.nodes_offset + first * _NODE.size
+        return _NODE.iter_unpack(self.data[start : start + count * _NODE.size])
+
+    def directory(self, idx):
+        """Return the unloaded directory of node 'idx'"""
+        return ImageDirectory(source=(self, idx))
+
+    def name(self, offset, size):
+        """Return the name of 'size' bytes at 'offset' in the names region"""
+        if offset + size > self.names_size:
+            raise ValueError('corrupt mockfs image: name out of range')
+        start = self.names_offset + offset
+        return _decode(self.data[start : start + size])
+
+    def check_contents(self, offset, size):
+        """Raise ValueError unless 'size' bytes at 'offset' are contents"""
+        if offset < _HEADER.size or offset + size > self.names_offset:
+            raise ValueError('corrupt mockfs image: contents out of range')
+
+    def contents(self, offset, size):
+        """Return a copy of 'size' bytes of the contents region"""
+        self.check_contents(offset, size)
+        return self.data[offset : offset + size]
+
+
+class ImageDirectory(LazyDirectory):
+    """A directory whose entries are read from an image on first use"""
+
+    __slots__ = ()
+
+    def load_entries(self):
+        image, idx = self.source
+        first, count = image.node(idx)[3:5]
+        if count and first <= idx:
+            # Children follow their parent, so records cannot form a cycle
+            raise ValueError('corrupt mockfs image: node %d out of order' % first)
+        entries = []
+        mtimes = {}
+        child = first
+        for kind, name_size, name_offset, offset, size, length, mtime in image.nodes(
+            first, count
+        ):
+            name = image.name(name_offset, name_size)
+            if kind == _DIR:
+                entry = image.directory(child)
+            elif kind == _LINK:
+                entry = Symlink(_decode(image.contents(offset, size)))
+            elif kind in (_BYTES, _TEXT):
+                image.check_contents(offset, size)
+                entry = ImageFile(image, offset, size, length, kind == _TEXT)
+            else:
+                raise ValueError(
+                    'corrupt mockfs image: node %d has kind %d' % (child, kind)
+                )
+            entries.append((name, entry))
+            mtimes[name] = mtime
+            child += 1
+        if len(set(mtimes.values())) == 1:
+            # Children saved together share one record, as add_entries() does
+            mtimes = {None: mtime}
+        self.mtimes = mtimes or None
+        return entries
+
+
+class ImageFile(LazyFile):
+    """A file whose contents are copied from an image when it is read"""
+
+    __slots__ = ('image', 'offset', 'nbytes', 'text')
+
+    def __init__(self, image, offset, nbytes, size, text):
+        LazyFile.__init__(self, size)
+        self.image = image
+        self.offset = offset
+        self.nbytes = nbytes
+        self.text = text
+
+    def load(self):
+        data = self.image.contents(self.offset, self.nbytes)
+        if self.text:
+            return _decode(data)
+        return data
+
+
+def _encode(value):
+    return value.encode('utf-8', 'surrogatepass')
+
+
+def _decode(value):
+    return value.decode('utf-8', 'surrogatepass')
@@ -0,0 +1,93 @@
+"""Journal of the changes made to a MockFS tree."""
+
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+
+class Journal(object):
+    """
+    Append-only record of the paths changed in a MockFS
+
+    Each change is a (path, change, subtree) tuple. 'subtree' is True when
+    the whole tree below 'path' was replaced or removed at once, e.g. by
+    rmtree() or copytree(), in which case the descendants are not recorded.
+    Recording a change costs O(1) and reading the changes costs O(depth)
+    per change, whatever the size of the tree.
+
+    """
+
+    def __init__(self):
+        self._changes = []
+
+    def record(self, path, change, subtree=False):
+        """Record a change to the normalized absolute 'path'"""
+        self._changes.append((path, change, subtree))
+
+    def mark(self):
+        """Return a mark for :meth:`changes_since`"""
+        return len(self._changes)
+
+    def changes_since(self, mark=0):
+        """
+        Return the changes recorded after 'mark', coalesced per path
+
+        Returns a dict mapping paths to CREATED, MODIFIED or DELETED in the
+        order the paths first changed. A path that was created and then
+        deleted is left out, and a path that was deleted and then created
+        again is MODIFIED. Changes below a subtree that was later replaced
+        or removed are folded into the change of the subtree, as are later
+        changes below a subtree that existed at the mark and was replaced or
+        removed since, because the journal cannot tell whether they existed.
+
+        """
+        # Per path: whether it existed at the mark, whether it exists now
+        # and the position of its last change
+        states = {}
+        # Per subtree replaced or removed at once: whether it existed at the
+        # mark (None when unknown) and the position of the change
+        subtrees = {}
+        for position, (path, change, subtree) in enumerate(self._changes[mark:]):
+            state = states.get(path)
+            if state is not None:
+                existed = state[0]
+                state[1] = change != DELETED
+                state[2] = position
+            else:
+                covering = _covering(subtrees, path)
+                if covering is None:
+                    existed = change != CREATED
+                elif covering[0] is False:
+                    # Below a subtree that did not exist at the mark
+                    existed = False
+                else:
+                    # Whether the path existed below the subtree is unknown,
+                    # so the change is folded into the change of the subtree
+                    existed = None
+                if existed is not None:
+                    states[path] = [existed, change != DELETED, position]
+            if subtree:
+                subtrees[path] = (existed, position)
+        result = {}
+        for path, (before, after, position) in states.items():
+            covering = _covering(subtrees, path)
+            if covering is not None and covering[1] > position:
+                continue
+            if before and after:
+                result[path] = MODIFIED
+            elif after:
+                result[path] = CREATED
+            elif before:
+                result[path] = DELETED
+        return result
+
+
+def _covering(subtrees, path):
+    """Return the record of the latest subtree change above 'path', if any"""
+    found = None
+    while subtrees and path != '/':
+        path = path.rpartition('/')[0] or '/'
+        record = subtrees.get(path)
+        if record is not None and (found is None or record[1] > found[1]):
+            found = record
+    return found
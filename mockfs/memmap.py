@@ -0,0 +1,197 @@
+"""Memory maps over mock files."""
+
+import mmap
+import os
+import sys
+import tempfile
+
+# The real type, captured before replace_builtins() can swap it
+_mmap = mmap.mmap
+
+# Shared mappings are the default on every platform
+MAP_SHARED = getattr(mmap, 'MAP_SHARED', 1)
+MAP_PRIVATE = getattr(mmap, 'MAP_PRIVATE', 2)
+PROT_READ = getattr(mmap, 'PROT_READ', 1)
+PROT_WRITE = getattr(mmap, 'PROT_WRITE', 2)
+
+
+class SharedBuffer(object):
+    """
+    Contents of a mock file shared by the memory maps of the file
+
+    The contents are copied once into an anonymous file that every map of
+    the file maps, so writes through one map are seen by the others.
+    'data' is the contents the buffer was created from, or last saved, and
+    'source' is the tree entry holding them. Mapping a file therefore costs
+    a copy of the file, but reading the maps does not copy anything.
+
+    """
+
+    __slots__ = ('fd', 'data', 'source', '_path', '__weakref__')
+
+    def __init__(self, data, source=None):
+        self.fd, self._path = _anonymous_file()
+        self.data = data
+        self.source = source
+        view = memoryview(data)
+        try:
+            while view:
+                view = view[os.write(self.fd, view) :]
+        finally:
+            view.release()
+
+    def read(self):
+        """Return the current contents, including writes through the maps"""
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, 1024 * 1024)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def changed(self):
+        """Return True if the maps changed the contents since 'data'"""
+        size = os.fstat(self.fd).st_size
+        if size != len(self.data):
+            return True
+        if not size:
+            return False
+        # Compared in place: writes through exported buffers, e.g. memoryview,
+        # cannot be tracked, but the contents need not be read to compare them
+        with _mmap(self.fd, size, access=mmap.ACCESS_READ) as current:
+            view = memoryview(current)
+            try:
+                return not self.data.startswith(view)
+            finally:
+                view.release()
+
+    def close(self):
+        """Release the anonymous file"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            if self._path is not None:
+                os.remove(self._path)
+
+    def __del__(self):
+        if getattr(self, 'fd', None) is not None:
+            self.close()
+
+
+def _anonymous_file():
+    """Return the descriptor of a new anonymous file and its path, if any"""
+    if hasattr(os, 'memfd_create'):
+        return os.memfd_create('mockfs-mmap', os.MFD_CLOEXEC), None
+    fd, path = tempfile.mkstemp(prefix='mockfs-mmap-')
+    try:
+        os.remove(path)
+    except OSError:
+        # Open files cannot be removed on Windows
+        return fd, path
+    return fd, None
+
+
+def _access(
+    flags=MAP_SHARED,
+    prot=PROT_READ | PROT_WRITE,
+    access=mmap.ACCESS_DEFAULT,
+    offset=0,
+    **_,
+):
+    """Return the access mode and offset for the POSIX mmap() arguments"""
+    if access == mmap.ACCESS_DEFAULT:
+        if flags & MAP_PRIVATE:
+            access = mmap.ACCESS_COPY
+        elif not prot & PROT_WRITE:
+            access = mmap.ACCESS_READ
+        else:
+            access = mmap.ACCESS_WRITE
+    return access, offset
+
+
+def _access_windows(tagname=None, access=mmap.ACCESS_DEFAULT, offset=0):
+    """Return the access mode and offset for the Windows mmap() arguments"""
+    if access == mmap.ACCESS_DEFAULT:
+        access = mmap.ACCESS_WRITE
+    return access, offset
+
+
+if sys.platform == 'win32':
+    parse_arguments = _access_windows
+else:
+    parse_arguments = _access
+
+
+class MockMmap(_mmap):
+    """
+    A memory map over the contents of a mock file
+
+    A real :class:`mmap.mmap` of the :class:`SharedBuffer` of the file, so
+    the maps of a file share their memory and the map supports the buffer
+    protocol, e.g. :func:`re.search` and :class:`memoryview`, on every
+    Python version. Writes to shared mappings are saved back to the
+    filesystem by :meth:`flush` and :meth:`close` when the contents
+    changed, which is checked without copying them. Mappings made with ``ACCESS_READ`` or ``ACCESS_COPY`` are
+    never saved.
+
+    """
+
+    def __new__(cls, buffer, offset, length, access, save=None):
+        self = _mmap.__new__(cls, buffer.fd, length, access=access, offset=offset)
+        self._buffer = buffer
+        self._save = save
+        return self
+
+    def flush(self, *args):
+        """Save pending writes back to the mock filesystem"""
+        result = _mmap.flush(self, *args)
+        if self._save is not None:
+            self._save(self._buffer)
+        return result
+
+    def close(self):
+        """Save pending writes and close the map"""
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            _mmap.close(self)
+            self._buffer = None
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, '_buffer', None) is not None and not self.closed:
+            self.close()
+
+
+class _MmapType(type):
+    """Metaclass of the replacement for :class:`mmap.mmap`"""
+
+    def __call__(cls, *args, **kwargs):
+        return cls.dispatch(*args, **kwargs)
+
+    def __instancecheck__(cls, instance):
+        return isinstance(instance, (_mmap, MockMmap))
+
+    def __subclasscheck__(cls, subclass):
+        return issubclass(subclass, (_mmap, MockMmap))
+
+
+def mmap_type(dispatch):
+    """
+    Return a replacement for :class:`mmap.mmap` that calls 'dispatch'
+
+    Real maps and :class:`MockMmap` objects are both instances of the
+    replacement, so isinstance() checks keep working while it is installed.
+
+    """
+    namespace = {
+        '__doc__': _mmap.__doc__,
+        '__module__': _mmap.__module__,
+        'dispatch': staticmethod(dispatch),
+    }
+    return _MmapType('mmap', (object,), namespace)
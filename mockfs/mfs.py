@@ -1,18 +1,30 @@
 """mockfs: A simple mock filesystem for unit tests."""
 
-import copy
+import contextvars
 import errno
-import fnmatch
+import functools
 import glob
+import importlib
+import itertools
+import locale
+import mmap
+import operator
 import os
 import shutil
+import stat
 import sys
+import threading
+import time
+import weakref
 
-from . import compat, storage, util
+from . import archive, compat, compression, image, journal, memmap, stats, storage, util
+from .mirror import MirroredDirectory
+from .nodes import Directory, LazyFile, Symlink
 
 # Python functions to replace
 builtins = {
     'glob.glob': glob.glob,
+    'glob.iglob': glob.iglob,
     'os.chdir': os.chdir,
     'os.getcwd': os.getcwd,
     'os.path.abspath': os.path.abspath,
@@ -21,22 +33,175 @@ builtins = {
     'os.path.islink': os.path.islink,
     'os.path.isdir': os.path.isdir,
     'os.path.isfile': os.path.isfile,
+    'os.path.getatime': os.path.getatime,
+    'os.path.getctime': os.path.getctime,
+    'os.path.getmtime': os.path.getmtime,
+    'os.path.lexists': os.path.lexists,
+    'os.path.realpath': os.path.realpath,
+    'os.readlink': os.readlink,
+    'os.symlink': os.symlink,
+    'os.stat': os.stat,
+    'os.lstat': os.lstat,
     'os.walk': os.walk,
     'os.listdir': os.listdir,
+    'os.scandir': os.scandir,
     'os.makedirs': os.makedirs,
     'os.remove': os.remove,
+    'os.rename': os.rename,
+    'os.replace': os.replace,
     'os.rmdir': os.rmdir,
     'os.unlink': os.unlink,
+    'shutil.move': shutil.move,
     'shutil.rmtree': shutil.rmtree,
+    'builtins.open': storage.original_open,
+    'io.open': storage.original_io_open,
+    'codecs.open': storage.original_codecs_open,
+    'mmap.mmap': mmap.mmap,
+}
+
+# The MockFS attribute that implements each replaced function
+_methods = {
+    'glob.glob': 'glob',
+    'glob.iglob': 'iglob',
+    'os.chdir': 'cwd.chdir',
+    'os.getcwd': 'cwd.getcwd',
+    'os.path.abspath': 'abspath',
+    'os.path.exists': 'exists',
+    'os.path.getsize': 'getsize',
+    'os.path.islink': 'islink',
+    'os.path.isdir': 'isdir',
+    'os.path.isfile': 'isfile',
+    'os.path.getatime': 'getatime',
+    'os.path.getctime': 'getctime',
+    'os.path.getmtime': 'getmtime',
+    'os.path.lexists': 'lexists',
+    'os.path.realpath': 'realpath',
+    'os.readlink': 'readlink',
+    'os.symlink': 'symlink',
+    'os.stat': 'stat',
+    'os.lstat': 'lstat',
+    'os.walk': 'walk',
+    'os.fwalk': 'fwalk',
+    'os.listdir': 'listdir',
+    'os.scandir': 'scandir',
+    'os.makedirs': 'makedirs',
+    'os.remove': 'remove',
+    'os.rename': 'rename',
+    'os.replace': 'replace',
+    'os.rmdir': 'rmdir',
+    'os.unlink': 'remove',
+    'os.getcwdu': 'cwd.getcwdu',
+    'shutil.move': 'move',
+    'shutil.rmtree': 'rmtree',
+    'builtins.open': 'open',
+    'io.open': 'open',
+    'codecs.open': 'codecs_open',
+    'mmap.mmap': 'mmap',
 }
 
 # On python2.x also replace os.getcwdu
 if compat.PY2:
     builtins['os.getcwdu'] = os.getcwdu
 
+# os.fwalk() is only available on some platforms
+if hasattr(os, 'fwalk'):
+    builtins['os.fwalk'] = os.fwalk
+
+# The MockFS bound to the current context by "with mfs:", and the MockFS
+# installed for the whole process by replace_builtins(). Calls made in a
+# context without a binding go to the process-wide MockFS, if any, and
+# otherwise to the real functions.
+_active = contextvars.ContextVar('mockfs_active', default=None)
+_tokens = contextvars.ContextVar('mockfs_tokens', default=())
+_process_mfs = None
+
+# The dispatchers are installed while any MockFS is bound or installed
+_install_lock = threading.Lock()
+_bindings = 0
+_installed = False
+# Incremented by restore_builtins() so that the bindings it ended are not
+# counted again when their "with mfs:" blocks exit
+_epoch = 0
+
 # We use the original abspath()
 _abspath_builtin = builtins['os.path.abspath']
 
+# Maximum number of normalized paths remembered by MockFS.abspath()
+DEFAULT_ABSPATH_CACHE_SIZE = 4096
+
+# MockFS methods that only read the tree and those that modify it. A
+# thread-safe MockFS guards them with a readers-writer lock.
+READ_OPERATIONS = (
+    'abspath',
+    'exists',
+    'getatime',
+    'getctime',
+    'getmtime',
+    'getsize',
+    'glob',
+    'isdir',
+    'isfile',
+    'islink',
+    'lexists',
+    'listdir',
+    'lstat',
+    'read',
+    'readlink',
+    'realpath',
+    'save_image',
+    'scandir',
+    'stat',
+)
+READ_ITERATORS = ('fwalk', 'iglob', 'walk')
+WRITE_OPERATIONS = (
+    'add_entries',
+    'close',
+    'copytree',
+    'load_image',
+    'makedirs',
+    'mmap',
+    'mount_archive',
+    'mount_directory',
+    'move',
+    'remove',
+    'rename',
+    'replace',
+    'restore',
+    'rmdir',
+    'rmtree',
+    'snapshot',
+    'symlink',
+)
+
+# Maximum number of symbolic links followed while resolving a path
+MAXSYMLINKS = 40
+
+# Size reported for directories, as on most disk filesystems
+DIRECTORY_SIZE = 4096
+
+# Entries without a recorded modification time report the time mockfs was
+# imported. Files and directories are owned by the current user.
+_START_NS = time.time_ns()
+_UID = os.getuid() if hasattr(os, 'getuid') else 0
+_GID = os.getgid() if hasattr(os, 'getgid') else 0
+_DIR_MODE = stat.S_IFDIR | 0o755
+_FILE_MODE = stat.S_IFREG | 0o644
+_LINK_MODE = stat.S_IFLNK | 0o777
+# Key of the root directory's own modification time in its mtimes
+_SELF = '.'
+
+# Salts that give the copies made by copytree() inode numbers of their own
+_salts = itertools.count(1)
+
+# Generations own the directories they may modify in place. Generations are
+# unique across MockFS instances so that snapshots can be shared between them.
+_generations = itertools.count(1)
+
+# Kinds of compiled glob pattern segments
+_GLOB_LITERAL = 0
+_GLOB_PATTERN = 1
+_GLOB_RECURSIVE = 2
+
 
 def _OSError(err, path):
     """Return an OSError with an appropriate error string"""
@@ -51,6 +216,8 @@ def _IOError(err, path):
 class StorageBackend(object):
     def __init__(self, mfs):
         self.mfs = mfs
+        # Text and binary views of the contents of recently opened files
+        self.views = util.LRUCache(storage.VIEW_CACHE_SIZE)
 
     def CheckForFile(self, filename):
         return self.mfs.exists(filename)
@@ -61,11 +228,21 @@ class StorageBackend(object):
     def LoadFile(self, filename):
         return self.mfs.read(filename)
 
+    def LoadStream(self, filename):
+        """Return the compressed entry for 'filename' to read in blocks, or None"""
+        entry = self.mfs._direntry(filename)
+        if isinstance(entry, compression.CompressedFile):
+            return entry
+        return None
+
     def SaveFile(self, filename, data):
-        full_path = self.mfs.abspath(filename)
+        # Writing to a symbolic link writes to its target
+        full_path = self.mfs._realpath(self.mfs.abspath(filename))
+        if util.is_dir(self.mfs._lookup(full_path)):
+            raise _IOError(errno.EISDIR, filename)
         parent_dir = os.path.dirname(full_path)
-        if self.mfs.exists(parent_dir):
-            self.mfs.add_entries({filename: data})
+        if self.mfs.isdir(parent_dir):
+            self.mfs.add_entries({full_path: data})
         else:
             raise _IOError(errno.ENOENT, filename)
 
@@ -78,27 +255,503 @@ class MockFS(object):
 
     """
 
-    def __init__(self, entries=None):
+    def __init__(
+        self,
+        entries=None,
+        abspath_cache_size=DEFAULT_ABSPATH_CACHE_SIZE,
+        enable_stats=False,
+        thread_safe=False,
+        dedup_contents=False,
+        compress_threshold=None,
+        compress_level=compression.DEFAULT_LEVEL,
+    ):
         self.cwd = Cwd(self)
         self.backend = StorageBackend(self)
-
-        self._entries = {}
+        self._stats = None
+        self._journal = None
+        self._lock = None
+        # Normalized paths keyed on (cwd, path). Cleared by Cwd.chdir().
+        self._abspath_cache = util.LRUCache(abspath_cache_size)
+
+        self._generation = next(_generations)
+        self._entries = Directory(owner=self._generation)
+        # Flat index mapping normalized absolute paths to entries in the tree.
+        # Paths are added as they are resolved and dropped when they change.
+        self._index = {'/': self._entries}
+        # Paths with their symbolic links resolved, keyed on (path, follow the
+        # last link). Only used once the tree holds symbolic links, and
+        # cleared whenever links may have changed.
+        self._symlinks = False
+        self._resolved = util.LRUCache(abspath_cache_size)
+        # Whether the tree may hold renamed entries, which keep the inode
+        # numbers of their original paths
+        self._renamed = False
+        # Equal file contents share one value when deduplication is enabled
+        self._contents = util.ContentStore() if dedup_contents else None
+        # Contents of at least this many characters or bytes are compressed
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+        self._blocks = compression.BlockCache()
+        # Buffers shared by the memory maps of each file
+        self._mapped = weakref.WeakValueDictionary()
+        # Archives mounted by mount_archive(), closed by close()
+        self._archives = weakref.WeakSet()
+        if thread_safe:
+            self._install_lock()
+        if enable_stats:
+            self.enable_stats()
         if entries:
             self.add_entries(entries)
 
     def add_entries(self, entries):
-        """Add new entries to mockfs."""
-        new_entries = util.build_nested_dict(entries)
-        util.merge_dicts(new_entries, self._entries)
+        """
+        Add new entries to mockfs.
+
+        :param entries: a mapping or an iterable of (path, content) pairs.
+            Directories are given as dicts, e.g. ``{'/unix/dir': {}}``.
+
+        Entries are inserted into the live tree in a single pass. The parent
+        directory is reused while consecutive entries share it, so sorted
+        input resolves each directory only once. The throughput target is
+        1M sorted entries in about one second; see ``benchmarks/add_entries.py``.
+
+        """
+        if hasattr(entries, 'items'):
+            entries = entries.items()
+        curdir = self.cwd.getcwd()
+        store = self._contents is not None or self._compress_threshold is not None
+        intern = sys.intern
+        changes = self._journal
+        # Entries added by one call share a modification time
+        now = time.time_ns()
+        dirname = parent = None
+        # Directories whose own time was already set to 'now' by this call
+        touched = set()
+        for path, value in entries:
+            if path[:1] != '/' or '//' in path or '/.' in path or path[-1:] == '/':
+                path = _normalize(curdir, path)
+                if path == '/':
+                    self._add_entry(path, value, now)
+                    dirname = parent = None
+                    continue
+            head, _, name = path.rpartition('/')
+            if head != dirname:
+                dirname = head
+                if self._symlinks:
+                    head = self._resolve(head or '/').rstrip('/')
+                parent = self._writable_dir(head or '/', create=True, now=now)
+                # Directories created by this call already hold the time
+                stamp = parent.mtimes is None or parent.mtimes.get(None) != now
+                touch = stamp and head not in touched
+            if name in parent or isinstance(value, (dict, Symlink)):
+                self._insert(parent, _join(head or '/', name), name, value, now)
+            else:
+                if store:
+                    value = self._store(value)
+                # Names are interned so that repeated names share one string
+                name = intern(name)
+                parent[name] = value
+                if stamp:
+                    _stamp(parent, name, now)
+                    # Entries of new directories share the directory's salt
+                    self._new_inode(parent, name)
+                if touch:
+                    self._touch(head or '/', now)
+                    touched.add(head)
+                    touch = False
+                if changes is not None:
+                    changes.record(_join(head or '/', name), journal.CREATED)
+
+    @classmethod
+    def from_directory(cls, real_path, mount_at='/'):
+        """
+        Return a MockFS that mirrors a real directory tree
+
+        See :meth:`mount_directory`.
+
+        """
+        mfs = cls()
+        mfs.mount_directory(mount_at, real_path)
+        return mfs
+
+    def mount_directory(self, path, real_path):
+        """
+        Mirror the real directory 'real_path' at 'path'
+
+        Directory listings and file contents are read from disk when a
+        mocked call first touches them, using the real :mod:`os` functions
+        even when the builtins have been replaced. Large files are
+        memory-mapped instead of copied. Entries report the modification
+        times of the real files. Changes are not written back.
+
+        """
+        real_path = _abspath_builtin(real_path)
+        path = self._realpath(self.abspath(path), follow=False)
+        entry = MirroredDirectory(owner=self._generation, source=real_path)
+        # The mount point reports the time of the real directory
+        mtime = builtins['os.stat'](real_path).st_mtime_ns
+        if path == '/':
+            entry.mtimes = {_SELF: mtime}
+            self._set_root(entry)
+            self._record('/', journal.MODIFIED, True)
+            return
+        now = time.time_ns()
+        dirname = os.path.dirname(path)
+        parent = self._writable_dir(dirname, create=True, now=now)
+        self._set_entry(parent, sys.intern(os.path.basename(path)), path, entry, mtime)
+        self._touch(dirname, now)
+
+    def mount_archive(self, path, archive_path, cache_size=archive.CACHE_SIZE):
+        """
+        Mount the real zip or tar archive 'archive_path' at 'path'
+
+        Only the archive index is read up front: the zip central directory,
+        or a single scan of the tar members. Members are extracted when a
+        mocked call first reads them, and the last 'cache_size' extracted
+        members are kept so that they are not decompressed again. Pass 0 to
+        disable the cache. Compressed tar archives are detected
+        automatically. Changes are not written back.
+
+        The archive file stays open while its entries are in use and is
+        closed by :meth:`close`. Returns the :class:`mockfs.archive.Archive`,
+        whose ``info()`` reports the use of the cache. Raises
+        :class:`tarfile.ReadError` when the file is neither a zip nor a tar
+        archive.
+
+        """
+        source = archive.Archive(archive_path, cache_size)
+        try:
+            now = time.time_ns()
+            root, symlinks = archive.build_tree(source, self._generation, now)
+            path = self._realpath(self.abspath(path), follow=False)
+            if path == '/':
+                self._set_root(root)
+                self._record('/', journal.MODIFIED, True)
+            else:
+                dirname = os.path.dirname(path)
+                parent = self._writable_dir(dirname, create=True, now=now)
+                self._set_entry(
+                    parent, sys.intern(os.path.basename(path)), path, root, now
+                )
+                self._touch(dirname, now)
+        except Exception:
+            source.close()
+            raise
+        self._archives.add(source)
+        if symlinks:
+            self._add_symlink()
+        return source
+
+    def close(self):
+        """
+        Close the archives mounted by :meth:`mount_archive`
+
+        Archives are also closed when their entries are no longer used, but
+        tests should call this when they are done with the filesystem so
+        that no real file stays open. Reading a member of a closed archive
+        raises ValueError.
+
+        """
+        for source in list(self._archives):
+            source.close()
+        self._archives.clear()
+
+    def enable_stats(self):
+        """
+        Start recording per-operation statistics
+
+        Calls to the :class:`MockFS` methods and to the files returned by
+        :func:`open` are counted and timed. See :meth:`stats`.
+        Instrumentation is installed on this instance only, so there is no
+        overhead while statistics are disabled.
+
+        """
+        if self._stats is not None:
+            return
+        self._stats = stats.Stats()
+        self._stats.instrument(self)
+        self._blocks.stats = self._stats
+
+    def disable_stats(self):
+        """Stop recording statistics and remove the instrumentation"""
+        if self._stats is None:
+            return
+        self._stats.uninstrument(self)
+        self._stats = None
+        self._blocks.stats = None
+
+    def stats(self, reset=False):
+        """
+        Return the statistics recorded since :meth:`enable_stats`
+
+        Returns a dict mapping operation names, e.g. 'exists', 'open' or
+        'write', to dicts with the 'count' of calls, the 'total' time in
+        seconds and a latency 'histogram' of (upper bound in microseconds,
+        count) pairs. The statistics are cleared when reset is True.
+
+        """
+        if self._stats is None:
+            return {}
+        return self._stats.report(reset=reset)
+
+    def reset_stats(self):
+        """Clear the recorded statistics"""
+        if self._stats is not None:
+            self._stats.reset()
+
+    def enable_journal(self):
+        """
+        Start recording the paths changed in the filesystem
+
+        Files and directories that are added, written, renamed or removed
+        are recorded as they change, so the cost is proportional to the
+        number of changes and not to the size of the tree. See
+        :meth:`changes_since`.
+
+        """
+        if self._journal is None:
+            self._journal = journal.Journal()
+
+    def disable_journal(self):
+        """Stop recording changes and forget the recorded changes"""
+        self._journal = None
+
+    def journal_mark(self):
+        """Return a mark of the current position in the journal"""
+        if self._journal is None:
+            raise ValueError('the journal is not enabled')
+        return self._journal.mark()
+
+    def changes_since(self, mark=0):
+        """
+        Return the paths changed since a :meth:`journal_mark`
+
+        Returns a dict mapping absolute paths to 'created', 'modified' or
+        'deleted', coalesced per path, e.g. a file that was created and
+        written is 'created' and a file that was created and removed is left
+        out. Subtrees that are added or removed at once, e.g. by
+        :meth:`copytree` or :meth:`rmtree`, are reported by their top
+        directory. Restoring a snapshot or loading an image reports '/' as
+        'modified'.
+
+        """
+        if self._journal is None:
+            raise ValueError('the journal is not enabled')
+        return self._journal.changes_since(mark)
+
+    def snapshot(self):
+        """
+        Return a snapshot of the filesystem tree
+
+        Snapshots share their structure with the live tree so taking one
+        costs O(1). Directories are copied when they are first modified
+        after a snapshot, so a mutation only copies the path leading to it.
+
+        """
+        self._generation = next(_generations)
+        return Snapshot(self._entries, self._symlinks, self._renamed)
+
+    def restore(self, snapshot):
+        """Restore the filesystem tree from a :meth:`snapshot`"""
+        self._generation = next(_generations)
+        self._set_root(snapshot.entries)
+        self._record('/', journal.MODIFIED, True)
+        if snapshot.symlinks:
+            self._add_symlink()
+        if snapshot.renamed:
+            self._renamed = True
+        if self._contents is not None:
+            # The restored tree holds a different set of references
+            self._contents.clear()
+            self._contents.add_tree(snapshot.entries)
+
+    def save_image(self, path):
+        """
+        Save the filesystem tree to a binary image at the real 'path'
+
+        The image holds the directories, files, symbolic links and
+        modification times of the tree. See :mod:`mockfs.image` for the
+        format. Mirrored directories and files are read in full.
+
+        """
+        image.save(self._entries, path, _child_mtime)
+
+    def load_image(self, path):
+        """
+        Replace the filesystem tree with the image at the real 'path'
+
+        The image is memory-mapped and nothing else is read up front:
+        directories are listed when they are first used and file contents
+        are read from the map when a file is opened. Loading an image
+        therefore costs the same whatever its size, and processes loading
+        the same image share its pages. Changes are not written back.
+        Raises ValueError when 'path' is not an image.
+
+        """
+        root, symlinks = image.load(path)
+        self._generation = next(_generations)
+        self._set_root(root)
+        self._record('/', journal.MODIFIED, True)
+        if symlinks:
+            self._add_symlink()
+        if self._contents is not None:
+            # Contents are read from the image and are not shared
+            self._contents.clear()
+
+    def content_info(self):
+        """
+        Return the statistics of the content store
+
+        Returns a :class:`mockfs.util.ContentInfo` with the number of
+        distinct contents, the number of files referencing them and the
+        total size of the distinct contents, or None when the filesystem
+        was created without ``dedup_contents``.
+
+        """
+        if self._contents is None:
+            return None
+        return self._contents.info()
+
+    def block_cache_info(self):
+        """
+        Return the hits, misses, maxsize and currsize of the block cache
+
+        The cache holds the decompressed blocks of files compressed with
+        ``compress_threshold``.
+
+        """
+        return self._blocks.info()
 
     def __enter__(self):
-        """Replace builtin functions when the context manager scope begins"""
-        replace_builtins(context=self)
+        """
+        Use this filesystem in the current context
+
+        The binding is local to the current thread or asyncio task, so
+        several filesystems can be used in parallel.
+
+        """
+        _bind(self)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        """Restore builtin functions when the context manager scope ends"""
-        restore_builtins()
+        """Restore the previous filesystem when the context manager scope ends"""
+        _unbind()
+
+    def open(
+        self,
+        name,
+        mode='r',
+        buffering=-1,
+        encoding=None,
+        errors=None,
+        newline=None,
+        closefd=True,
+        opener=None,
+    ):
+        """
+        Open a file
+
+        Implements the :func:`open` interface. Buffering, 'closefd' and
+        'opener' are ignored.
+
+        """
+        if self._stats is None:
+            return storage.file(
+                name,
+                mode,
+                encoding=encoding,
+                errors=errors,
+                backend=self.backend,
+                newline=newline,
+            )
+        return self._stats.open(
+            name, mode, encoding, errors, backend=self.backend, newline=newline
+        )
+
+    def mmap(self, fileno, length, *args, **kwargs):
+        """
+        Map a file into memory
+
+        Implements the :class:`mmap.mmap` interface for the files returned by
+        :meth:`open` and returns a :class:`mockfs.memmap.MockMmap`. Mock file
+        numbers are negative, so real descriptors are always mapped by the
+        real :class:`mmap.mmap`.
+
+        The contents of a file are copied once into shared memory that all
+        maps of the file use. Writes are saved to the file by ``flush()``
+        and ``close()``, which compare the memory with the file in place and
+        only read it back when it changed.
+
+        """
+        if not storage.is_mock_fileno(fileno):
+            return builtins['mmap.mmap'](fileno, length, *args, **kwargs)
+        fh = storage.get_file(fileno)
+        if fh is None:
+            raise _OSError(errno.EBADF, fileno)
+        access, offset = memmap.parse_arguments(*args, **kwargs)
+        if length < 0:
+            raise OverflowError('memory mapped length must be positive')
+        if offset < 0:
+            raise OverflowError('memory mapped offset must be positive')
+        if fh.mode not in storage.READ_MODES or (
+            access == mmap.ACCESS_WRITE and fh.mode not in storage.WRITE_MODES
+        ):
+            raise OSError(errno.EACCES, os.strerror(errno.EACCES))
+        if fh.mode in storage.WRITE_MODES:
+            fh.flush()
+
+        path = self._realpath(self.abspath(fh.name))
+        buffer = self._mapped_buffer(path)
+        size = len(buffer.data)
+        if offset % mmap.ALLOCATIONGRANULARITY:
+            raise _OSError(errno.EINVAL, fh.name)
+        if length == 0:
+            if size == 0:
+                raise ValueError('cannot mmap an empty file')
+            if offset >= size:
+                raise ValueError('mmap offset is greater than file size')
+            length = size - offset
+        elif offset > size or size - offset < length:
+            raise ValueError('mmap length is greater than file size')
+
+        if access in (mmap.ACCESS_READ, mmap.ACCESS_COPY):
+            return memmap.MockMmap(buffer, offset, length, access)
+
+        def save(buffer):
+            if not buffer.changed():
+                return  # Only maps that were written to are saved
+            data = buffer.read()
+            self.backend.SaveFile(path, data)
+            buffer.data = data
+            buffer.source = self._lookup(path)
+
+        return memmap.MockMmap(buffer, offset, length, access, save)
+
+    def _mapped_buffer(self, path):
+        """Return the buffer shared by the memory maps of a file"""
+        entry = self._lookup(path)
+        if entry is None or util.is_dir(entry):
+            raise _OSError(errno.ENOENT, path)
+        buffer = self._mapped.get(path)
+        if buffer is not None and buffer.source is entry:
+            return buffer
+        data = entry.load() if isinstance(entry, LazyFile) else entry
+        if util.is_string(data):
+            data = data.encode(locale.getpreferredencoding(False))
+        buffer = self._mapped[path] = memmap.SharedBuffer(data, entry)
+        return buffer
+
+    def codecs_open(self, name, mode='r', encoding=None, errors='strict', buffering=-1):
+        """
+        Open a file
+
+        Implements the :func:`codecs.open` interface. Files are opened in
+        text mode when an encoding is given.
+
+        """
+        if encoding is not None:
+            mode = mode.replace('b', '')
+        return self.open(name, mode, encoding=encoding, errors=errors)
 
     def exists(self, path):
         """
@@ -108,30 +761,77 @@ class MockFS(object):
 
         """
         path = self.abspath(path)
-        dirent = self._direntry(os.path.dirname(path))
+        try:
+            entry = self._find(path)
+        except OSError:
+            return False
         if path == '/':
-            return bool(dirent)
-        return bool(dirent) and os.path.basename(path) in dirent
+            return bool(entry)
+        return entry is not None
 
     def getsize(self, path):
         """Return the size of a file, reported by os.stat()."""
         entry = self._direntry(path)
         if entry is None:
             raise _OSError(errno.ENOENT, path)
+        if util.is_dir(entry):
+            return DIRECTORY_SIZE
         return len(entry)
 
+    def getmtime(self, path):
+        """
+        Return the time of last modification of a path in seconds
+
+        Implements the :func:`os.path.getmtime` interface.
+
+        """
+        path = self._realpath(self.abspath(path))
+        if self._lookup(path) is None:
+            raise _OSError(errno.ENOENT, path)
+        return self._mtime(path) / 1e9
+
+    def getctime(self, path):
+        """
+        Return the time of last metadata change of a path in seconds
+
+        Implements the :func:`os.path.getctime` interface. Metadata only
+        changes with the contents, so this is the modification time.
+
+        """
+        return self.getmtime(path)
+
+    def getatime(self, path):
+        """
+        Return the time of last access of a path in seconds
+
+        Implements the :func:`os.path.getatime` interface. Reads are not
+        recorded, so this is the modification time.
+
+        """
+        return self.getmtime(path)
+
+    def lexists(self, path):
+        """
+        Return True if path exists
+
+        Implements the :func:`os.path.lexists` interface. Broken symbolic
+        links exist.
+
+        """
+        return self._checked_direntry(path, follow=False) is not None
+
     def read(self, path):
         path = self.abspath(path)
-        dirname = os.path.dirname(path)
-        basename = os.path.basename(path)
-        entry = self._direntry(dirname)
-        if not util.is_dir(entry):
+        entry = self._find(path)
+        if isinstance(entry, LazyFile):
+            return entry.load()
+        if util.is_dir(entry):
+            raise _OSError(errno.EISDIR, path)
+        if entry is not None:
+            return entry
+        if not util.is_dir(self._find(os.path.dirname(path))):
             raise _OSError(errno.EPERM, path)
-
-        try:
-            return entry[basename]
-        except KeyError:
-            raise _OSError(errno.ENOENT, path)
+        raise _OSError(errno.ENOENT, path)
 
     def isdir(self, path):
         """
@@ -140,7 +840,7 @@ class MockFS(object):
         Implements the :func:`os.path.isdir` interface.
 
         """
-        return util.is_dir(self._direntry(path))
+        return util.is_dir(self._checked_direntry(path))
 
     def isfile(self, path):
         """
@@ -149,18 +849,69 @@ class MockFS(object):
         Implements the :func:`os.path.isfile` interface.
 
         """
-        return util.is_file(self._direntry(path))
+        return util.is_file(self._checked_direntry(path))
 
     def islink(self, path):
         """
-        Return True if path is a symlink
+        Return True if path is a symbolic link
+
+        Implements the :func:`os.path.islink` interface.
+
+        """
+        return type(self._direntry(path, follow=False)) is Symlink
+
+    def symlink(self, src, dst, target_is_directory=False, *, dir_fd=None):
+        """
+        Create a symbolic link at 'dst' pointing to 'src'
 
-        .. note::
+        Implements the :func:`os.symlink` interface. The target does not
+        need to exist.
 
-            Currently hard-wired to return False
+        """
+        if dir_fd is not None:
+            raise NotImplementedError('dir_fd unavailable on this platform')
+        path = self._realpath(self.abspath(dst), follow=False)
+        if path == '/' or self._lookup(path) is not None:
+            raise _OSError(errno.EEXIST, dst)
+        dirname, _, basename = path.rpartition('/')
+        if not util.is_dir(self._lookup(dirname or '/')):
+            raise _OSError(errno.ENOENT, dst)
+        parent = self._writable_dir(dirname or '/')
+        now = time.time_ns()
+        self._set_entry(
+            parent, sys.intern(basename), path, Symlink(os.fspath(src)), now
+        )
+        self._touch(dirname or '/', now)
+
+    def readlink(self, path, *, dir_fd=None):
+        """
+        Return the target of a symbolic link
+
+        Implements the :func:`os.readlink` interface.
+
+        """
+        if dir_fd is not None:
+            raise NotImplementedError('dir_fd unavailable on this platform')
+        entry = self._direntry(path, follow=False)
+        if entry is None:
+            raise _OSError(errno.ENOENT, path)
+        if type(entry) is not Symlink:
+            raise _OSError(errno.EINVAL, path)
+        return entry.target
 
+    def realpath(self, path, *, strict=False):
         """
-        return False
+        Return 'path' with its symbolic links resolved
+
+        Implements the :func:`os.path.realpath` interface. Resolved paths
+        are cached until links change, so long chains of links are only
+        followed once.
+
+        """
+        path = self._realpath(self.abspath(path))
+        if strict and self._lookup(path) is None:
+            raise _OSError(errno.ENOENT, path)
+        return path
 
     def makedirs(self, path):
         """Create directory entries for a path
@@ -168,20 +919,36 @@ class MockFS(object):
         Raise OSError if the path already exists.
 
         """
-        path = self.abspath(path)
-        entry = self._direntry(path)
-        if entry is not None:
+        path = self._realpath(self.abspath(path), follow=False)
+        if self._find(path) is not None or self._lookup(path) is not None:
             raise _OSError(errno.EEXIST, path)
 
-        new_entries = util.build_nested_dir_dict(path)
-        util.merge_dicts(new_entries, self._entries)
+        self._add_entry(path, {}, time.time_ns())
 
     def abspath(self, path):
-        if os.path.isabs(path):
-            # Folds '////' into '/'
-            return _abspath_builtin(path)
-        curdir = self.cwd.getcwd()
-        return _abspath_builtin(os.path.join(curdir, path))
+        """
+        Return a normalized absolute version of 'path'
+
+        Implements the :func:`os.path.abspath` interface.
+        Results are memoized in a bounded LRU cache keyed on the current
+        directory, the type of the path and the raw path. Bytes paths are
+        normalized as str and returned as bytes.
+
+        """
+        curdir = self.cwd._cwd
+        key = (curdir, type(path), path)
+        result = self._abspath_cache.get(key)
+        if result is None:
+            if isinstance(path, bytes):
+                result = os.fsencode(_normalize(curdir, os.fsdecode(path)))
+            else:
+                result = _normalize(curdir, path)
+            self._abspath_cache[key] = result
+        return result
+
+    def abspath_cache_info(self):
+        """Return the hits, misses, maxsize and currsize of the abspath cache"""
+        return self._abspath_cache.info()
 
     def listdir(self, path):
         """
@@ -200,40 +967,175 @@ class MockFS(object):
             return list(sorted(direntry.keys()))
         raise _OSError(errno.EINVAL, path)
 
-    def walk(self, path):
+    def stat(self, path, *, dir_fd=None, follow_symlinks=True):
+        """
+        Return an :class:`os.stat_result` for a path
+
+        Implements the :func:`os.stat` interface. Open mock files can also
+        be given by their negative file number, and real descriptors are
+        passed to the real :func:`os.stat`. The metadata is derived from the
+        entry and the modification time recorded in its parent directory,
+        so the result is the only object allocated. A directory's time
+        changes when entries are added to or removed from it. Inode numbers
+        are derived from the path and kept when an entry or one of its
+        parents is renamed.
+
+        """
+        if dir_fd is not None:
+            raise NotImplementedError('dir_fd unavailable on this platform')
+        if isinstance(path, int):
+            if not storage.is_mock_fileno(path):
+                return builtins['os.stat'](path)
+            fh = storage.get_file(path)
+            if fh is None:
+                raise _OSError(errno.EBADF, path)
+            path = fh.name
+        # Normalized absolute paths skip the cache, which sampled stat() calls
+        # over large trees would otherwise thrash
+        if not (
+            type(path) is str
+            and path[:1] == '/'
+            and '//' not in path
+            and '/.' not in path
+            and path[-1:] != '/'
+        ):
+            path = self.abspath(path)
+        if self._symlinks:
+            path = self._resolve(path, follow_symlinks)
+        entry = self._lookup(path)
+        if entry is None:
+            raise _OSError(errno.ENOENT, path)
+        return _stat_result(entry, self._inode(path), self._mtime(path))
+
+    def lstat(self, path, *, dir_fd=None):
+        """
+        Return an :class:`os.stat_result` for a path
+
+        Implements the :func:`os.lstat` interface.
+
+        """
+        return self.stat(path, dir_fd=dir_fd, follow_symlinks=False)
+
+    def scandir(self, path='.'):
+        """
+        Return an iterator of :class:`DirEntry` objects for a directory
+
+        Implements the :func:`os.scandir` interface. Each entry holds a
+        reference to its node, so its methods do not look up the path again.
+
+        """
+        direntry = self._direntry(path)
+        if direntry is None:
+            raise _OSError(errno.ENOENT, path)
+        if not util.is_dir(direntry):
+            raise _OSError(errno.ENOTDIR, path)
+        return ScandirIterator(path, self.abspath(path), direntry, self)
+
+    def walk(self, top, topdown=True, onerror=None, followlinks=False):
         """
         Walk a filesystem path
 
-        Implements the :func:`os.walk` interface.
+        Implements the :func:`os.walk` interface. Directories are visited
+        depth-first through references to their nodes, so each directory costs
+        only the time needed to sort its children into directories and files.
+        With 'topdown', entries removed from the yielded directory names are
+        not visited.
 
         """
-        path = self.abspath(path)
-        inspect = [path]
-        while True:
-            dirstack = []
-            for entry in inspect:
-                dirent = self._direntry(entry)
-                dirs = []
-                files = []
-                if dirent:
-                    for e in dirent:
-                        if isinstance(dirent[e], dict):
-                            dirs.append(e)
+        top = os.fspath(top)
+        entry = self._direntry(top)
+        if entry is None:
+            if onerror is not None:
+                onerror(_OSError(errno.ENOENT, top))
+            return
+        if not util.is_dir(entry):
+            if onerror is not None:
+                onerror(_OSError(errno.ENOTDIR, top))
+            return
+        # Items are (path, directory) pairs to scan, or (path, None, result)
+        # triples holding bottom-up results that are ready to be yielded.
+        stack = [(top, entry, None)]
+        while stack:
+            path, entry, result = stack.pop()
+            if result is not None:
+                yield result
+                continue
+            dirs = []
+            files = []
+            subdirs = []
+            if path.endswith('/'):
+                prefix = path
+            else:
+                prefix = path + '/'
+            try:
+                for name, child in entry.items():
+                    if type(child) is Symlink:
+                        # Links to directories are listed as directories but
+                        # only descended into with 'followlinks'
+                        try:
+                            target = self._direntry(prefix + name)
+                        except OSError as err:
+                            # Links that cannot be resolved are listed as files
+                            if onerror is not None:
+                                onerror(err)
+                            target = None
+                        if isinstance(target, dict):
+                            dirs.append(name)
+                            subdirs.append(target if followlinks else None)
                         else:
-                            files.append(e)
-                yield (entry, dirs, files)
-                dirstack.extend([os.path.join(entry, d) for d in dirs])
-            inspect = dirstack
-            if not inspect:
-                raise StopIteration
+                            files.append(name)
+                    elif isinstance(child, dict):
+                        dirs.append(name)
+                        subdirs.append(child)
+                    else:
+                        files.append(name)
+            except OSError as err:
+                # Mirrored directories are listed on first use
+                if onerror is not None:
+                    onerror(err)
+                continue
+            if topdown:
+                yield path, dirs, files
+                # The caller may have pruned or reordered 'dirs'
+                for name in reversed(dirs):
+                    child = entry.get(name)
+                    if type(child) is Symlink and followlinks:
+                        try:
+                            child = self._direntry(prefix + name)
+                        except OSError:
+                            continue  # Reported while listing
+                    if isinstance(child, dict):
+                        stack.append((prefix + name, child, None))
+            else:
+                stack.append((path, None, (path, dirs, files)))
+                for idx in range(len(dirs) - 1, -1, -1):
+                    if subdirs[idx] is not None:
+                        stack.append((prefix + dirs[idx], subdirs[idx], None))
+
+    def fwalk(
+        self, top='.', topdown=True, onerror=None, follow_symlinks=False, dir_fd=None
+    ):
+        """
+        Walk a filesystem path and yield a directory descriptor for each directory
+
+        Implements the :func:`os.fwalk` interface on top of :meth:`walk`.
+        The descriptors are unique placeholders that cannot be passed to
+        other functions, so 'dir_fd' is not supported.
+
+        """
+        if dir_fd is not None:
+            raise NotImplementedError('dir_fd unavailable on this platform')
+        for dirpath, dirs, files in self.walk(top, topdown, onerror, follow_symlinks):
+            yield dirpath, dirs, files, storage.get_new_fileno()
 
     def remove(self, path):
         """Remove the entry for a file path
 
-        Implements the :func:`os.remove` interface.
+        Implements the :func:`os.remove` interface. Symbolic links are
+        removed, not their targets.
 
         """
-        path = self.abspath(path)
+        path = self._realpath(self.abspath(path), follow=False)
         dirname = os.path.dirname(path)
         basename = os.path.basename(path)
         entry = self._direntry(dirname)
@@ -245,10 +1147,19 @@ class MockFS(object):
         except KeyError:
             raise _OSError(errno.ENOENT, path)
 
-        if not util.is_file(fsentry):
+        if type(fsentry) is Symlink:
+            self._resolved.clear()
+        elif not util.is_file(fsentry):
             raise _OSError(errno.EPERM, path)
 
-        del entry[basename]
+        parent = self._writable_dir(dirname)
+        del parent[basename]
+        _unstamp(parent, basename)
+        self._touch(dirname, time.time_ns())
+        self._index.pop(path, None)
+        self._record(path, journal.DELETED)
+        if self._contents is not None:
+            self._contents.discard(fsentry)
 
     def rmdir(self, fspath):
         """Remove the entry for a directory path
@@ -256,10 +1167,10 @@ class MockFS(object):
         Implements the :func:`os.rmdir` interface.
 
         """
-        path = self.abspath(fspath)
+        path = self._realpath(self.abspath(fspath), follow=False)
         dirname = os.path.dirname(path)
         basename = os.path.basename(path)
-        entry = self._direntry(dirname)
+        entry = self._lookup(dirname)
         if not util.is_dir(entry):
             raise _OSError(errno.ENOENT, path)
 
@@ -274,20 +1185,150 @@ class MockFS(object):
         if len(direntry) != 0:
             raise _OSError(errno.ENOTEMPTY, fspath)
 
-        del entry[basename]
+        parent = self._writable_dir(dirname)
+        del parent[basename]
+        _unstamp(parent, basename)
+        self._touch(dirname, time.time_ns())
+        self._index.pop(path, None)
+        self._record(path, journal.DELETED)
 
     def copytree(self, src, dst):
         """Copy a directory subtree
 
         Implements the :func:`shutil.copytree` interface.
+        The copy shares its structure with the source, so copying costs
+        O(1) and directories are copied when either side is modified.
 
         """
-        src_d = self._direntry(src)
+        src = self._realpath(self.abspath(src))
+        src_d = self._lookup(src)
         if src_d is None:
             raise _OSError(errno.ENOENT, src)
-        dst = self.abspath(dst)
-        dst_d_parent = self._direntry(os.path.dirname(dst))
-        dst_d_parent[os.path.basename(dst)] = copy.deepcopy(src_d)
+        dst = self._realpath(self.abspath(dst), follow=False)
+        dirname = os.path.dirname(dst)
+        if not util.is_dir(self._lookup(dirname)):
+            raise _OSError(errno.ENOENT, dst)
+        parent = self._writable_dir(dirname)
+        if self._contents is not None and util.is_dir(src_d):
+            self._contents.add_tree(src_d)
+        name = sys.intern(os.path.basename(dst))
+        # Like shutil.copytree(), the copy keeps the modification times
+        self._set_entry(parent, name, dst, src_d, self._mtime(src))
+        if self._renamed:
+            # Renamed entries in the copy get inode numbers of their own
+            _set_inode(parent, name, (next(_salts), None))
+        elif parent.inodes:
+            parent.inodes.pop(name, None)
+        self._touch(dirname, time.time_ns())
+        # The subtree is now shared: start a new generation so that both
+        # copies are copied-on-write from here on.
+        self._generation = next(_generations)
+
+    def rename(self, src, dst, *, src_dir_fd=None, dst_dir_fd=None):
+        """
+        Rename a file or directory
+
+        Implements the :func:`os.rename` interface with POSIX semantics: an
+        existing file, or an empty directory, at 'dst' is replaced.
+        The entry is moved between its parent directories, so renaming a
+        directory costs the same as renaming a file whatever its size.
+        Modification times move with the entry.
+
+        """
+        if src_dir_fd is not None or dst_dir_fd is not None:
+            raise NotImplementedError('dir_fd unavailable on this platform')
+        # Links are renamed, not their targets
+        src_path = self._realpath(self.abspath(src), follow=False)
+        dst_path = self._realpath(self.abspath(dst), follow=False)
+        entry = self._lookup(src_path)
+        if entry is None:
+            raise _OSError(errno.ENOENT, src)
+        if src_path == dst_path:
+            return
+        if src_path == '/' or dst_path == '/':
+            raise _OSError(errno.EBUSY, src)
+        is_dir = util.is_dir(entry)
+        if is_dir and dst_path.startswith(src_path + '/'):
+            raise _OSError(errno.EINVAL, src)
+
+        dst_dirname, _, dst_name = dst_path.rpartition('/')
+        dst_dirname = dst_dirname or '/'
+        dst_parent = self._lookup(dst_dirname)
+        if dst_parent is None:
+            raise _OSError(errno.ENOENT, dst)
+        if not util.is_dir(dst_parent):
+            raise _OSError(errno.ENOTDIR, dst)
+        current = dst_parent.get(dst_name)
+        if current is not None:
+            if util.is_dir(current):
+                if not is_dir:
+                    raise _OSError(errno.EISDIR, dst)
+                if len(current) != 0:
+                    raise _OSError(errno.ENOTEMPTY, dst)
+            elif is_dir:
+                raise _OSError(errno.ENOTDIR, dst)
+
+        src_dirname, _, src_name = src_path.rpartition('/')
+        src_dirname = src_dirname or '/'
+        src_parent = self._writable_dir(src_dirname)
+        mtime = _child_mtime(src_parent, src_name)
+        salt, origin = self._inode_origin(src_path)
+        del src_parent[src_name]
+        _unstamp(src_parent, src_name)
+        self._record(src_path, journal.DELETED, is_dir)
+        if is_dir:
+            # Every indexed path below the directory has moved
+            self._reset_index()
+        else:
+            self._index.pop(src_path, None)
+        if self._symlinks and (is_dir or type(entry) is Symlink):
+            self._resolved.clear()
+        dst_parent = self._writable_dir(dst_dirname)
+        dst_name = sys.intern(dst_name)
+        self._set_entry(dst_parent, dst_name, dst_path, entry, mtime)
+        # The entry keeps the inode number of its original path
+        salt ^= self._inode_origin(dst_dirname)[0]
+        _set_inode(dst_parent, dst_name, (salt, origin))
+        self._renamed = True
+        now = time.time_ns()
+        self._touch(src_dirname, now)
+        self._touch(dst_dirname, now)
+
+    def replace(self, src, dst, *, src_dir_fd=None, dst_dir_fd=None):
+        """
+        Rename a file or directory, replacing 'dst'
+
+        Implements the :func:`os.replace` interface. See :meth:`rename`.
+
+        """
+        self.rename(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+
+    def move(self, src, dst, copy_function=None):
+        """
+        Move a file or directory and return its destination
+
+        Implements the :func:`shutil.move` interface. When 'dst' is a
+        directory, 'src' is moved inside it. Everything is on one
+        filesystem, so moves are renames and 'copy_function' is unused.
+
+        """
+        real_dst = dst
+        if self.isdir(dst):
+            if self.realpath(src) == self.realpath(dst):
+                self.rename(src, dst)
+                return
+            real_dst = os.path.join(dst, os.path.basename(os.fspath(src).rstrip('/')))
+            if self.exists(real_dst):
+                raise shutil.Error("Destination path '%s' already exists" % real_dst)
+        try:
+            self.rename(src, real_dst)
+        except OSError as err:
+            if err.errno != errno.EINVAL:
+                raise
+            raise shutil.Error(
+                "Cannot move a directory '%s' into itself '%s'." % (src, dst)
+            )
+        return real_dst
 
     def rmtree(self, path, ignore_errors=False, onerror=None):
         """Recursively delete a directory tree.
@@ -300,7 +1341,7 @@ class MockFS(object):
         is false and onerror is None, an exception is raised.
 
         """
-        abspath = self.abspath(path)
+        abspath = self._realpath(self.abspath(path), follow=False)
         if abspath == '/':
             # Do not allow removing the root
             if ignore_errors:
@@ -310,7 +1351,7 @@ class MockFS(object):
                 return
             raise _OSError(errno.EPERM, '/')
 
-        entry = self._direntry(abspath)
+        entry = self._lookup(abspath)
         if entry is None:
             if ignore_errors:
                 return
@@ -319,7 +1360,15 @@ class MockFS(object):
                 return
             raise _OSError(errno.ENOENT, entry)
 
-        if not self.isdir(path):
+        if type(entry) is Symlink:
+            if ignore_errors:
+                return
+            if onerror:
+                onerror(os.path.islink, path, sys.exc_info())
+                return
+            raise OSError('Cannot call rmtree on a symbolic link')
+
+        if not util.is_dir(entry):
             if ignore_errors:
                 return
             if onerror:
@@ -328,7 +1377,7 @@ class MockFS(object):
             raise _OSError(errno.ENOTDIR, path)
 
         dirname = os.path.dirname(abspath)
-        dirent = self._direntry(dirname)
+        dirent = self._lookup(dirname)
         if dirent is None:
             if ignore_errors:
                 return
@@ -337,7 +1386,7 @@ class MockFS(object):
                 return
             raise _OSError(errno.ENOENT, dirname)
 
-        basename = os.path.basename(path)
+        basename = os.path.basename(abspath)
         if basename not in dirent:
             if ignore_errors:
                 return
@@ -347,74 +1396,738 @@ class MockFS(object):
             raise _OSError(errno.ENOENT, path)
 
         # Remove the directory
-        del dirent[basename]
-
-    def glob(self, pattern):
+        parent = self._writable_dir(dirname)
+        removed = parent.pop(basename)
+        _unstamp(parent, basename)
+        self._touch(dirname, time.time_ns())
+        self._reset_index()
+        self._record(abspath, journal.DELETED, True)
+        if self._contents is not None:
+            self._contents.discard_tree(removed)
+
+    def glob(self, pattern, recursive=False):
         """Implementation of :py:func:`glob.glob`"""
+        return list(self.iglob(pattern, recursive=recursive))
+
+    def iglob(self, pattern, recursive=False):
+        """
+        Implementation of :py:func:`glob.iglob`
+
+        Each path segment of the pattern is compiled once. Segments without
+        wildcards are resolved with a direct lookup instead of a scan.
+        When recursive is True, '**' matches zero or more directories.
+        Matches within each directory are returned in sorted order.
+
+        """
         # Keep relative glob paths relative
         if os.path.isabs(pattern):
-            prefix = None
+            abspath = outpath = '/'
         else:
-            prefix = self.cwd.getcwd()
-            if prefix != '/':
-                prefix += '/'
-
-        pattern = self.abspath(pattern)
-        if pattern == '/':
-            return ['/']
-
-        # Keep track of current likely candidate paths.
-        # Each time we filter down, take the new candidates
-        # and append their names to create new candidates paths.
-        patterns = pattern.split('/')[1:]
-        entries = [('', self._entries)]
-        match = fnmatch.fnmatch
-        path_stack = []
-        pattern_stack = ['']
-        paths = []
-
-        for idx, subpattern in enumerate(patterns):
-            pattern_stack.append(subpattern)
-            pattern = '/'.join(pattern_stack)
-
-            new_entries = []
-            new_paths = []
-
-            for subdir, entry in entries:
-                path_stack.append(subdir)
-                for path in sorted(entry):
-                    path_stack.append(path)
-                    abspath = '/'.join(path_stack)
-                    if match(abspath, pattern):
-                        new_entries.append((abspath, entry[path]))
-                        new_paths.append(abspath)
-                    path_stack.pop()
-                path_stack.pop()
-
-            entries = new_entries
-            paths = new_paths
-
-        if prefix is None:
-            return paths
-        else:
-            return [p[len(prefix) :] for p in paths]
+            abspath = self.cwd.getcwd()
+            outpath = ''
+        entry = self._glob_find(abspath)
+        dironly = pattern.endswith('/')
+
+        segments = []
+        for segment in pattern.split('/'):
+            if not segment:
+                continue
+            if recursive and segment == '**':
+                segments.append((_GLOB_RECURSIVE, None))
+            elif util.has_magic(segment):
+                segments.append((_GLOB_PATTERN, util.compile_pattern(segment)))
+            else:
+                segments.append((_GLOB_LITERAL, segment))
+        if not segments and not outpath:
+            return iter(())
+
+        return self._iglob(abspath, outpath, entry, segments, 0, dironly)
 
     # Internal Methods
-    def _direntry(self, fspath):
+    def _install_lock(self):
+        """
+        Guard the public methods with a readers-writer lock
+
+        Reads run concurrently while each mutation, including the multi-step
+        ones such as rmtree() and copytree(), runs alone. Iterators hold the
+        read lock only while they compute the next item, so the caller may
+        modify the tree between items.
+
+        """
+        lock = self._lock = util.RWLock()
+        for name in READ_OPERATIONS:
+            setattr(
+                self,
+                name,
+                _locked(lock.acquire_read, lock.release_read, getattr(self, name)),
+            )
+        for name in READ_ITERATORS:
+            setattr(self, name, _read_locked_iterator(lock, getattr(self, name)))
+        for name in WRITE_OPERATIONS:
+            setattr(
+                self,
+                name,
+                _locked(lock.acquire_write, lock.release_write, getattr(self, name)),
+            )
+        cwd = self.cwd
+        cwd.chdir = _locked(lock.acquire_write, lock.release_write, cwd.chdir)
+        # Files are saved with an isdir() check followed by add_entries()
+        backend = self.backend
+        backend.SaveFile = _locked(
+            lock.acquire_write, lock.release_write, backend.SaveFile
+        )
+
+    def _iglob(self, abspath, outpath, entry, segments, idx, dironly):
+        """Match segments[idx:] against the children of a directory entry"""
+        if type(entry) is Symlink:
+            entry = self._glob_find(abspath)
+        if idx == len(segments):
+            if not dironly:
+                yield outpath
+            elif util.is_dir(entry):
+                yield _glob_join(outpath, '')
+            return
+        if not util.is_dir(entry):
+            return
+
+        kind, segment = segments[idx]
+        idx += 1
+        if kind == _GLOB_LITERAL:
+            if segment in ('.', '..'):
+                abspath = self.abspath(_join(abspath, segment))
+                child = self._glob_find(abspath)
+            else:
+                abspath = _join(abspath, segment)
+                child = entry.get(segment)
+            if child is not None:
+                outpath = _glob_join(outpath, segment)
+                yield from self._iglob(abspath, outpath, child, segments, idx, dironly)
+        elif kind == _GLOB_PATTERN:
+            try:
+                names = sorted(name for name in entry if segment(name))
+            except OSError:
+                return  # Mirrored directories are listed on first use
+            for name in names:
+                child = entry.get(name)
+                if child is None:
+                    continue  # Removed by the caller while iterating
+                yield from self._iglob(
+                    _join(abspath, name),
+                    _glob_join(outpath, name),
+                    child,
+                    segments,
+                    idx,
+                    dironly,
+                )
+        elif idx == len(segments):
+            # A trailing '**' matches the directory itself and everything below it
+            if outpath:
+                yield _glob_join(outpath, '')
+            for _, path, child in _iglob_tree(abspath, outpath, entry):
+                if not dironly:
+                    yield path
+                elif util.is_dir(child):
+                    yield _glob_join(path, '')
+        else:
+            # '**' matches zero or more directories
+            yield from self._iglob(abspath, outpath, entry, segments, idx, dironly)
+            for childpath, path, child in _iglob_tree(abspath, outpath, entry):
+                if util.is_dir(child):
+                    yield from self._iglob(
+                        childpath, path, child, segments, idx, dironly
+                    )
+
+    def _glob_find(self, path):
+        """Return the entry for a path, or None when it cannot be resolved"""
+        # Like glob.glob(), errors such as ELOOP are treated as no match
+        try:
+            return self._find(path)
+        except OSError:
+            return None
+
+    def _direntry(self, fspath, follow=True):
         """Return the directory "dict" entry for a path"""
-        path = self.abspath(fspath)
+        return self._find(self.abspath(fspath), follow)
+
+    def _checked_direntry(self, fspath, follow=True):
+        """Return the entry for a path, or None when it cannot be resolved"""
+        # Like os.path.exists(), errors such as ELOOP mean the path is missing
+        try:
+            return self._direntry(fspath, follow)
+        except OSError:
+            return None
+
+    def _find(self, path, follow=True):
+        """
+        Return the entry for a normalized absolute path, or None
+
+        Symbolic links in the path are followed, and so is a link at the end
+        of the path when 'follow' is True. Paths without links are looked
+        up directly.
+
+        """
+        entry = self._lookup(path)
+        if self._symlinks and (entry is None or follow and type(entry) is Symlink):
+            entry = self._lookup(self._resolve(path, follow))
+        return entry
+
+    def _realpath(self, path, follow=True):
+        """Return a normalized absolute path with its symbolic links resolved"""
+        if self._symlinks:
+            return self._resolve(path, follow)
+        return path
+
+    def _resolve(self, path, follow=True):
+        """Return a normalized absolute path with its symbolic links resolved"""
+        return self._resolve_links(path, follow)[0]
+
+    def _resolve_links(self, path, follow=True, depth=0):
+        """
+        Return the resolved path and the number of links followed to reach it
+
+        Each link target is resolved through this method, so the targets of
+        links along a chain are cached too. As on POSIX, every link followed
+        counts, including links crossed again and again through a loop, and
+        ELOOP is raised after MAXSYMLINKS links.
+
+        """
+        key = (path, follow)
+        result = self._resolved.get(key)
+        if result is not None:
+            return result
+        if depth > MAXSYMLINKS:
+            raise _OSError(errno.ELOOP, path)
+        links = 0
+        resolved = ''
+        names = path.split('/')
+        last = len(names) - 1
+        for idx in range(1, last + 1):
+            name = names[idx]
+            if not name:
+                continue
+            candidate = resolved + '/' + name
+            entry = self._lookup(candidate)
+            if type(entry) is Symlink and (follow or idx < last):
+                target = _normalize(resolved or '/', entry.target)
+                candidate, count = self._resolve_links(target, True, depth + 1)
+                links += count + 1
+                if links > MAXSYMLINKS:
+                    raise _OSError(errno.ELOOP, path)
+                if candidate == '/':
+                    candidate = ''
+            resolved = candidate
+        result = self._resolved[key] = (resolved or '/', links)
+        return result
+
+    def _mtime(self, path):
+        """Return the modification time of a normalized absolute path in ns"""
+        if path == '/':
+            return _child_mtime(self._entries, _SELF)
+        dirname, _, basename = path.rpartition('/')
+        return _child_mtime(self._lookup(dirname or '/'), basename)
+
+    def _touch(self, path, now):
+        """Record that entries were added to or removed from a writable directory"""
         if path == '/':
-            return self._entries
-        elts = path.split('/')[1:]
-        current = self._entries
-        retval = None
-        for elt in elts:
-            if elt in current:
-                retval = current[elt]
-                current = current[elt]
+            _stamp(self._entries, _SELF, now)
+            return
+        dirname, _, basename = path.rpartition('/')
+        _stamp(self._writable_dir(dirname or '/'), basename, now)
+
+    def _inode(self, path):
+        """Return the inode number of a normalized absolute path"""
+        if not self._renamed:
+            return _inode(path)
+        salt, origin = self._inode_origin(path)
+        if salt:
+            return _inode((salt, origin))
+        return _inode(origin)
+
+    def _new_inode(self, parent, name):
+        """Give a new entry of a writable directory an inode number of its own"""
+        # Once entries were renamed, a new entry's path may be the one that
+        # a renamed entry derives its inode number from
+        if self._renamed:
+            _set_inode(parent, name, (next(_salts), None))
+
+    def _inode_origin(self, path):
+        """
+        Return the salt and the path that the inode number of 'path' derives from
+
+        Entries derive their inode numbers from their own path, unless they
+        or their parents were renamed or copied, in which case their new
+        parent records the salt and the path they were renamed from.
+
+        """
+        if path == '/':
+            return 0, path
+        salt = 0
+        origin = ''
+        entry = self._entries
+        for name in path[1:].split('/'):
+            record = None
+            if util.is_dir(entry):
+                if entry.inodes:
+                    record = entry.inodes.get(name)
+                entry = entry.get(name)
+            if record is None:
+                origin = origin + '/' + name
             else:
-                return None
-        return retval
+                salt ^= record[0]
+                origin = origin + '/' + name if record[1] is None else record[1]
+        return salt, origin
+
+    def _lookup(self, path):
+        """Return the entry for a normalized absolute path, or None"""
+        entry = self._index.get(path)
+        if entry is None and path != '/':
+            dirname, _, basename = path.rpartition('/')
+            parent = self._lookup(dirname or '/')
+            if util.is_dir(parent):
+                entry = parent.get(basename)
+                if entry is not None:
+                    self._index[path] = entry
+        return entry
+
+    def _writable_dir(self, path, create=False, now=None):
+        """
+        Return the directory at 'path' so that it can be modified in place
+
+        Directories owned by an older generation are copied, together with
+        their parents. Missing directories are created when 'create' is True,
+        with the modification time 'now' or the current time.
+        Returns None when the directory does not exist.
+
+        """
+        generation = self._generation
+        if path == '/':
+            root = self._entries
+            if root.owner != generation:
+                root = _copy_dir(root, generation)
+                self._set_root(root)
+            return root
+
+        entry = self._index.get(path)
+        if util.is_dir(entry) and entry.owner == generation:
+            return entry
+
+        dirname, _, basename = path.rpartition('/')
+        parent = self._writable_dir(dirname or '/', create=create, now=now)
+        if parent is None:
+            return None
+        entry = parent.get(basename)
+        if util.is_dir(entry):
+            if entry.owner != generation:
+                entry = parent[basename] = _copy_dir(entry, generation)
+        elif create:
+            if now is None:
+                now = time.time_ns()
+            self._record(path, journal.CREATED if entry is None else journal.MODIFIED)
+            basename = sys.intern(basename)
+            if entry is None:
+                self._new_inode(parent, basename)
+            elif self._contents is not None:
+                # The file replaced by the directory no longer holds its contents
+                self._contents.discard(entry)
+            entry = parent[basename] = Directory(owner=generation, mtimes={None: now})
+            _stamp(parent, basename, now)
+            self._touch(dirname or '/', now)
+        else:
+            return None
+        self._index[path] = entry
+        return entry
+
+    def _add_entry(self, path, value, now):
+        """Insert an entry into the tree, creating parent directories"""
+        path = self.abspath(path)
+        if path == '/':
+            if util.is_dir(value):
+                self._merge_entries(path, value, self._writable_dir(path), now)
+            return
+        parent = self._writable_dir(os.path.dirname(path), create=True, now=now)
+        self._insert(parent, path, os.path.basename(path), value, now)
+
+    def _insert(self, parent, path, name, value, now):
+        """Insert or merge an entry into its writable parent directory"""
+        current = parent.get(name)
+        name = sys.intern(name)
+        if current is None:
+            # New entries are indexed lazily when they are first looked up
+            parent[name] = self._import(value, now)
+            _stamp(parent, name, now)
+            self._new_inode(parent, name)
+            self._touch(path.rpartition('/')[0] or '/', now)
+            self._record(path, journal.CREATED, util.is_dir(value))
+        elif util.is_dir(current) and util.is_dir(value):
+            self._merge_entries(path, value, self._writable_dir(path), now)
+        elif isinstance(current, list) and isinstance(value, list):
+            current.extend(value)
+            _stamp(parent, name, now)
+            self._record(path, journal.MODIFIED)
+        else:
+            self._set_entry(parent, name, path, self._import(value, now), now)
+
+    def _merge_entries(self, path, src, dst, now):
+        """Merge the nested entries from 'src' into the writable 'dst' directory"""
+        for name, value in src.items():
+            self._insert(dst, _join(path, name), name, value, now)
+
+    def _import(self, value, now):
+        """Convert nested dicts from add_entries() into directories"""
+        if type(value) is Symlink:
+            self._add_symlink()
+            return value
+        if not util.is_dir(value):
+            return self._store(value)
+        intern = sys.intern
+        return Directory(
+            ((intern(name), self._import(child, now)) for name, child in value.items()),
+            owner=self._generation,
+            mtimes={None: now},
+        )
+
+    def _store(self, value):
+        """Return the value to keep in the tree for new file contents"""
+        threshold = self._compress_threshold
+        if (
+            threshold is not None
+            and isinstance(value, compat.file_types)
+            and len(value) >= threshold
+        ):
+            if self._stats is None:
+                return compression.CompressedFile(
+                    value, self._compress_level, self._blocks
+                )
+            # Recorded directly because compression runs inside other operations
+            start = time.perf_counter()
+            value = compression.CompressedFile(
+                value, self._compress_level, self._blocks
+            )
+            self._stats.record('compress', time.perf_counter() - start)
+            return value
+        if self._contents is not None:
+            value = self._contents.add(value)
+        return value
+
+    def _set_entry(self, parent, name, path, entry, now):
+        """Store an entry in its writable parent directory and update the index"""
+        current = parent.get(name)
+        if util.is_dir(current):
+            self._reset_index()
+        if type(entry) is Symlink or type(current) is Symlink:
+            self._add_symlink()
+        if self._contents is not None and current is not None:
+            if util.is_dir(current):
+                self._contents.discard_tree(current)
+            else:
+                self._contents.discard(current)
+        parent[name] = entry
+        _stamp(parent, name, now)
+        if current is None:
+            self._new_inode(parent, name)
+        self._index[path] = entry
+        if self._journal is not None:
+            self._journal.record(
+                path,
+                journal.CREATED if current is None else journal.MODIFIED,
+                util.is_dir(current) or util.is_dir(entry),
+            )
+
+    def _record(self, path, change, subtree=False):
+        """Record a change in the journal, if enabled"""
+        if self._journal is not None:
+            self._journal.record(path, change, subtree)
+
+    def _set_root(self, entries):
+        """Replace the root directory"""
+        self._entries = entries
+        self._reset_index()
+        # Views of the previous tree's contents would only keep them alive
+        self.backend.views.clear()
+
+    def _add_symlink(self):
+        """Enable link resolution and forget paths resolved before a link changed"""
+        self._symlinks = True
+        self._resolved.clear()
+
+    def _reset_index(self):
+        """Forget all resolved paths, e.g. after a subtree was removed"""
+        self._index = {'/': self._entries}
+        self._resolved.clear()
+
+
+def _locked(acquire, release, func):
+    """Wrap func so that it runs while holding a lock"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        acquire()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            release()
+
+    return wrapper
+
+
+def _read_locked_iterator(lock, func):
+    """Wrap a generator function so that each step holds the read lock"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        iterator = iter(func(*args, **kwargs))
+        while True:
+            lock.acquire_read()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                lock.release_read()
+            yield value
+
+    return wrapper
+
+
+class Snapshot(object):
+    """An immutable view of a :class:`MockFS` tree returned by snapshot()"""
+
+    __slots__ = ('entries', 'symlinks', 'renamed')
+
+    def __init__(self, entries, symlinks=False, renamed=False):
+        self.entries = entries
+        # Whether the tree may contain symbolic links
+        self.symlinks = symlinks
+        # Whether the tree may contain renamed entries
+        self.renamed = renamed
+
+
+class DirEntry(object):
+    """An :class:`os.DirEntry` compatible entry returned by MockFS.scandir()"""
+
+    __slots__ = ('name', 'path', '_entry', '_parent', '_dirpath', '_mfs')
+
+    def __init__(self, dirname, name, entry, parent=None, dirpath=None, mfs=None):
+        self.name = name
+        self.path = os.path.join(dirname, name)
+        self._entry = entry
+        # The parent directory node and its absolute path, for stat()
+        self._parent = parent
+        self._dirpath = dirpath
+        # The filesystem, for following symbolic links
+        self._mfs = mfs
+
+    def _target(self, follow_symlinks):
+        """Return the entry, or the entry a symbolic link points to"""
+        entry = self._entry
+        if follow_symlinks and type(entry) is Symlink and self._mfs is not None:
+            return self._mfs._find(_join(self._dirpath, self.name))
+        return entry
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return '<DirEntry %r>' % self.name
+
+    def inode(self):
+        """Return the inode number of the entry"""
+        return self.stat().st_ino
+
+    def is_dir(self, follow_symlinks=True):
+        """Return True if the entry is a directory"""
+        return util.is_dir(self._target(follow_symlinks))
+
+    def is_file(self, follow_symlinks=True):
+        """Return True if the entry is a file"""
+        entry = self._target(follow_symlinks)
+        return type(entry) is not Symlink and util.is_file(entry)
+
+    def is_symlink(self):
+        """Return True if the entry is a symbolic link"""
+        return type(self._entry) is Symlink
+
+    def stat(self, follow_symlinks=True):
+        """Return an :class:`os.stat_result` for the entry"""
+        if follow_symlinks and type(self._entry) is Symlink and self._mfs is not None:
+            return self._mfs.stat(_join(self._dirpath, self.name))
+        if self._parent is None:
+            return _stat_result(self._entry, _inode(self.path), _START_NS)
+        path = _join(self._dirpath, self.name)
+        return _stat_result(
+            self._entry,
+            _inode(path) if self._mfs is None else self._mfs._inode(path),
+            _child_mtime(self._parent, self.name),
+        )
+
+
+class ScandirIterator(object):
+    """Iterator of :class:`DirEntry` objects that can be used as a context manager"""
+
+    def __init__(self, dirname, dirpath, directory, mfs=None):
+        self._dirname = dirname
+        self._dirpath = dirpath
+        self._directory = directory
+        self._mfs = mfs
+        self._items = iter(sorted(directory.items()))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        name, entry = next(self._items)
+        return DirEntry(
+            self._dirname, name, entry, self._directory, self._dirpath, self._mfs
+        )
+
+    next = __next__  # Python2
+
+    def close(self):
+        """Release the iterator"""
+        self._items = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+
+def _stat_result(entry, ino, mtime_ns):
+    """Return an :class:`os.stat_result` describing a tree entry"""
+    if util.is_dir(entry):
+        mode = _DIR_MODE
+        nlink = 2
+        size = DIRECTORY_SIZE
+    elif type(entry) is Symlink:
+        mode = _LINK_MODE
+        nlink = 1
+        size = len(os.fsencode(entry.target))
+    else:
+        mode = _FILE_MODE
+        nlink = 1
+        size = len(entry)
+    seconds = mtime_ns // 1000000000
+    mtime = mtime_ns / 1e9
+    return os.stat_result((
+        mode,
+        ino,
+        0,
+        nlink,
+        _UID,
+        _GID,
+        size,
+        seconds,
+        seconds,
+        seconds,
+        mtime,
+        mtime,
+        mtime,
+        mtime_ns,
+        mtime_ns,
+        mtime_ns,
+    ))
+
+
+def _inode(key):
+    """Return the inode number derived from a path or a (salt, path) pair"""
+    return hash(key) & 0x7FFFFFFFFFFFFFFF or 1
+
+
+def _child_mtime(parent, name):
+    """Return the modification time in ns of the entry 'name' of a directory"""
+    mtimes = parent.mtimes
+    if mtimes:
+        mtime = mtimes.get(name)
+        if mtime is None:
+            mtime = mtimes.get(None)
+        if mtime is not None:
+            return mtime
+    return _START_NS
+
+
+def _stamp(parent, name, now):
+    """Record that the entry 'name' of a writable directory changed at 'now'"""
+    mtimes = parent.mtimes
+    if mtimes is None:
+        parent.mtimes = {name: now}
+    elif mtimes.get(None) == now:
+        mtimes.pop(name, None)
+    else:
+        mtimes[name] = now
+
+
+def _unstamp(parent, name):
+    """Forget the modification time and inode offset of a removed entry"""
+    mtimes = parent.mtimes
+    if mtimes:
+        mtimes.pop(name, None)
+    inodes = parent.inodes
+    if inodes:
+        inodes.pop(name, None)
+
+
+def _set_inode(parent, name, record):
+    """Record the (salt, original path) of the entry 'name' of a directory"""
+    if parent.inodes is None:
+        parent.inodes = {name: record}
+    else:
+        parent.inodes[name] = record
+
+
+def _copy_dir(entry, generation):
+    """Return a copy of a directory owned by 'generation'"""
+    # Copying loads lazy directories, which may set their times
+    copy = Directory(entry, owner=generation)
+    if entry.mtimes is not None:
+        copy.mtimes = dict(entry.mtimes)
+    if entry.inodes is not None:
+        copy.inodes = dict(entry.inodes)
+    return copy
+
+
+def _normalize(curdir, path):
+    """Return an absolute path with '.', '..' and duplicate slashes folded"""
+    if not os.path.isabs(path):
+        path = os.path.join(curdir, path)
+    path = _abspath_builtin(path)
+    # POSIX preserves a leading '//' but mockfs has a single root
+    if path.startswith('//'):
+        path = path[1:]
+    return path
+
+
+def _glob_join(outpath, name):
+    """Join a glob result path, which may be relative or empty, with a name"""
+    if not outpath:
+        return name
+    if outpath.endswith('/'):
+        return outpath + name
+    return outpath + '/' + name
+
+
+def _iglob_tree(abspath, outpath, entry):
+    """Yield (abspath, path, entry) tuples for everything below a directory"""
+    try:
+        names = sorted(entry)
+    except OSError:
+        return
+    for name in names:
+        child = entry.get(name)
+        if child is None:
+            continue
+        childpath = _join(abspath, name)
+        path = _glob_join(outpath, name)
+        yield childpath, path, child
+        if util.is_dir(child):
+            yield from _iglob_tree(childpath, path, child)
+
+
+def _join(dirname, basename):
+    """Join an absolute, normalized directory path with a basename"""
+    if dirname == '/':
+        return '/' + basename
+    return dirname + '/' + basename
 
 
 class Cwd(object):
@@ -435,7 +2148,8 @@ class Cwd(object):
         elif not util.is_dir(entry):
             raise _OSError(errno.ENOTDIR, path)
 
-        self._cwd = _abspath_builtin(cdpath)
+        self._cwd = self._mfs._realpath(_abspath_builtin(cdpath))
+        self._mfs._abspath_cache.clear()
 
     def getcwd(self):
         return self._cwd
@@ -447,6 +2161,10 @@ class Cwd(object):
 def replace_builtins(entries=None, context=None):
     """Replace builtin functions with mockfs.
 
+    The replaced functions dispatch to the installed MockFS, or to the
+    MockFS bound to the current context with ``with mfs:``. Replacing one
+    MockFS with another only switches the dispatch target.
+
     :param entries: Dictionary mapping paths to content
     :returns: Newly installed :class:`mockfs.mfs.MockFS` instance.
 
@@ -461,6 +2179,7 @@ def replace_builtins(entries=None, context=None):
     >>> mockfs.restore_builtins()
 
     """
+    global _bindings, _process_mfs
     if context is None:
         mfs = MockFS(entries=entries)
     else:
@@ -468,41 +2187,111 @@ def replace_builtins(entries=None, context=None):
         if entries:
             mfs.add_entries(entries)
 
-    # Install functions
-    glob.glob = mfs.glob
-    os.chdir = mfs.cwd.chdir
-    os.getcwd = mfs.cwd.getcwd
-    os.listdir = mfs.listdir
-    os.makedirs = mfs.makedirs
-    os.path.abspath = mfs.abspath
-    os.path.exists = mfs.exists
-    os.path.getsize = mfs.getsize
-    os.path.islink = mfs.islink
-    os.path.isdir = mfs.isdir
-    os.path.isfile = mfs.isfile
-    os.remove = mfs.remove
-    os.rmdir = mfs.rmdir
-    os.unlink = mfs.remove
-    os.walk = mfs.walk
-    shutil.rmtree = mfs.rmtree
-    if compat.PY2:
-        os.getcwdu = mfs.cwd.getcwdu
-
+    with _install_lock:
+        if _process_mfs is None:
+            _bindings += 1
+        _process_mfs = mfs
+        _install()
+    # Files opened with storage.open() directly use the installed backend
     storage.backend = mfs.backend
-    storage.replace_builtins()
-
     return mfs
 
 
 def restore_builtins():
-    """Restore the original builtin functions."""
-    for k, v in builtins.items():
-        mod, func = k.rsplit('.', 1)  # 'os.path.isdir' -> ('os.path', 'isdir')
-        name_elts = mod.split('.')
-        top = name_elts.pop(0)
-        module = globals()[top]
-        for elt in name_elts:
-            module = getattr(module, elt)
-        setattr(module, func, v)
-
-    storage.restore_builtins()
+    """
+    Restore the original builtin functions
+
+    This also ends the bindings made by ``with mfs:`` blocks that are still
+    active, in any thread or asyncio task.
+
+    """
+    global _bindings, _epoch, _process_mfs
+    with _install_lock:
+        _process_mfs = None
+        _bindings = 0
+        _epoch += 1
+        _uninstall()
+    _active.set(None)
+
+
+def current():
+    """Return the MockFS that handles calls in the current context, or None"""
+    return _active.get() or _process_mfs
+
+
+def _dispatcher(original, method):
+    """Return a function that calls 'method' on the current MockFS"""
+    get_method = operator.attrgetter(method)
+
+    @functools.wraps(original)
+    def dispatch(*args, **kwargs):
+        mfs = _active.get() or _process_mfs
+        if mfs is None:
+            return original(*args, **kwargs)
+        return get_method(mfs)(*args, **kwargs)
+
+    return dispatch
+
+
+def _target(name):
+    """Return the (module, attribute) pair for a dotted name, e.g. 'os.path.isdir'"""
+    module, func = name.rsplit('.', 1)
+    return importlib.import_module(module), func
+
+
+def _install():
+    """Install the dispatchers. Called with _install_lock held."""
+    global _installed
+    if not _installed:
+        for module, func, _, dispatch in _patches:
+            setattr(module, func, dispatch)
+        _installed = True
+
+
+def _uninstall():
+    """Restore the original functions. Called with _install_lock held."""
+    global _installed
+    for module, func, original, _ in _patches:
+        setattr(module, func, original)
+    _installed = False
+
+
+def _bind(mfs):
+    """Bind a MockFS to the current context"""
+    global _bindings
+    with _install_lock:
+        _bindings += 1
+        _install()
+        epoch = _epoch
+    _tokens.set(_tokens.get() + ((_active.set(mfs), epoch),))
+
+
+def _unbind():
+    """Restore the binding that was replaced by the last call to _bind()"""
+    global _bindings
+    tokens = _tokens.get()
+    if tokens:
+        token, epoch = tokens[-1]
+        _tokens.set(tokens[:-1])
+        if epoch != _epoch:
+            return  # Ended by restore_builtins()
+        _active.reset(token)
+    # Without a token the block was entered in another context, whose
+    # binding cannot be reset from here, but it still has to be counted
+    with _install_lock:
+        if _bindings > (_process_mfs is not None):
+            _bindings -= 1
+        if not _bindings:
+            _uninstall()
+
+
+_dispatchers = {
+    name: _dispatcher(original, _methods[name]) for name, original in builtins.items()
+}
+# mmap.mmap is a type, so its replacement must also be one
+_dispatchers['mmap.mmap'] = memmap.mmap_type(_dispatchers['mmap.mmap'])
+# (module, attribute, original, dispatcher) for each replaced function
+_patches = [
+    _target(name) + (original, _dispatchers[name])
+    for name, original in builtins.items()
+]
@@ -0,0 +1,64 @@
+"""Lazy mirrors of real directory trees."""
+
+import mmap
+import os
+
+from . import storage
+from .nodes import LazyDirectory, LazyFile
+
+# The real functions are captured before replace_builtins() can swap them.
+_open = storage.original_open
+_scandir = os.scandir
+_mmap = mmap.mmap
+
+# Files of at least this many bytes are memory-mapped instead of read
+MMAP_THRESHOLD = 1024 * 1024
+
+
+class MirroredDirectory(LazyDirectory):
+    """A directory whose entries are listed from a real directory on first use"""
+
+    __slots__ = ()
+
+    def load_entries(self):
+        entries = []
+        # Times recorded before the listing, e.g. a mounted root's own, are kept
+        mtimes = dict(self.mtimes) if self.mtimes else {}
+        with _scandir(self.source) as it:
+            for dirent in it:
+                try:
+                    if dirent.is_dir():
+                        entry = MirroredDirectory(source=dirent.path)
+                    elif dirent.is_file():
+                        entry = MirroredFile(dirent.path, dirent.stat().st_size)
+                    else:
+                        continue
+                    mtime = dirent.stat().st_mtime_ns
+                except OSError:
+                    # Broken symlinks and entries that vanished are skipped
+                    continue
+                entries.append((dirent.name, entry))
+                mtimes[dirent.name] = mtime
+        # Entries report the modification times of the real files
+        self.mtimes = mtimes or None
+        return entries
+
+
+class MirroredFile(LazyFile):
+    """A file whose contents are read from a real file on first use"""
+
+    __slots__ = ('path', 'data')
+
+    def __init__(self, path, size):
+        LazyFile.__init__(self, size)
+        self.path = path
+        self.data = None
+
+    def load(self):
+        if self.data is None:
+            with _open(self.path, 'rb') as fh:
+                if self.size >= MMAP_THRESHOLD:
+                    self.data = _mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self.data = fh.read()
+        return self.data
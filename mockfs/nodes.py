@@ -0,0 +1,154 @@
+"""Node types stored in the MockFS tree."""
+
+import threading
+
+# Held while a lazy directory loads, so that readers sharing a thread-safe
+# MockFS's read lock never see a directory half loaded or load it twice.
+# Nodes have no room for a lock of their own: loading changes their class.
+_load_lock = threading.RLock()
+
+
+class Directory(dict):
+    """
+    A directory in the mock filesystem tree
+
+    Directories map names to entries. The owner is the generation of the
+    filesystem that may modify the directory in place. Directories owned by
+    an older generation may be shared with snapshots or copies and must be
+    copied before they are modified.
+
+    'mtimes' maps the names of children to their modification times in
+    nanoseconds. The None key holds the time shared by the children that
+    have no time of their own, i.e. those created with the directory, and
+    the '.' key the time of the directory itself when it has no parent.
+
+    'inodes' maps the names of children that were renamed into the
+    directory to the offsets that keep their inode numbers.
+
+    """
+
+    __slots__ = ('owner', 'source', 'mtimes', 'inodes')
+
+    def __init__(self, entries=(), owner=0, source=None, mtimes=None, inodes=None):
+        dict.__init__(self, entries)
+        self.owner = owner
+        self.source = source
+        self.mtimes = mtimes
+        self.inodes = inodes
+
+
+class LazyDirectory(Directory):
+    """
+    A directory whose entries are loaded on first access
+
+    Subclasses implement :meth:`load_entries` to return the (name, entry)
+    pairs for the directory described by 'source'. Once loaded, the
+    directory becomes a plain :class:`Directory`.
+
+    """
+
+    __slots__ = ()
+
+    def load_entries(self):
+        """Return an iterable of (name, entry) pairs"""
+        raise NotImplementedError
+
+    def _load(self):
+        with _load_lock:
+            # Another thread may have loaded the directory in the meantime
+            if isinstance(self, LazyDirectory):
+                entries = self.load_entries()
+                dict.update(self, entries)
+                self.source = None
+                self.__class__ = Directory
+
+
+def _loading(name):
+    """Wrap a dict method so that it loads a lazy directory first"""
+    method = getattr(dict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _name in (
+    '__contains__',
+    '__delitem__',
+    '__eq__',
+    '__getitem__',
+    '__iter__',
+    '__len__',
+    '__ne__',
+    '__repr__',
+    '__reversed__',
+    '__setitem__',
+    'clear',
+    'copy',
+    'get',
+    'items',
+    'keys',
+    'pop',
+    'popitem',
+    'setdefault',
+    'update',
+    'values',
+):
+    setattr(LazyDirectory, _name, _loading(_name))
+del _name
+
+
+class LazyFile(object):
+    """
+    A file whose contents are loaded on first use
+
+    The size is known up front so that the file can be listed and measured
+    without loading it. Subclasses implement :meth:`load`.
+
+    """
+
+    __slots__ = ('size',)
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def load(self):
+        """Return the file contents"""
+        raise NotImplementedError
+
+
+class Symlink(object):
+    """
+    A symbolic link
+
+    The target is stored as given, so relative targets are resolved from
+    the directory holding the link.
+
+    """
+
+    __slots__ = ('target',)
+
+    def __init__(self, target):
+        self.target = target
+
+    def __len__(self):
+        return len(self.target)
+
+    def __eq__(self, other):
+        return type(other) is Symlink and other.target == self.target
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.target)
+
+    def __repr__(self):
+        return 'Symlink(%r)' % self.target
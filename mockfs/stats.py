@@ -0,0 +1,254 @@
+"""Opt-in instrumentation of MockFS operations."""
+
+import functools
+import threading
+import time
+
+from . import storage
+
+# Latency histograms have power-of-two buckets measured in microseconds.
+# The last bucket collects everything slower than the previous bound.
+HISTOGRAM_BUCKETS = 24
+
+# MockFS methods that are instrumented, and the operation names they record
+MOCKFS_OPERATIONS = (
+    'add_entries',
+    'copytree',
+    'exists',
+    'getatime',
+    'getctime',
+    'getmtime',
+    'getsize',
+    'glob',
+    'isdir',
+    'isfile',
+    'islink',
+    'lexists',
+    'listdir',
+    'lstat',
+    'makedirs',
+    'mmap',
+    'move',
+    'read',
+    'readlink',
+    'realpath',
+    'remove',
+    'rename',
+    'replace',
+    'rmdir',
+    'rmtree',
+    'scandir',
+    'stat',
+    'symlink',
+)
+MOCKFS_ITERATORS = ('fwalk', 'iglob', 'walk')
+CWD_OPERATIONS = ('chdir',)
+FILE_OPERATIONS = (
+    ('__next__', 'next'),
+    ('close', 'close'),
+    ('flush', 'flush'),
+    ('read', 'read'),
+    ('readline', 'readline'),
+    ('readlines', 'readlines'),
+    ('seek', 'seek'),
+    ('truncate', 'truncate'),
+    ('write', 'write'),
+    ('writelines', 'writelines'),
+)
+
+
+class Stats(object):
+    """
+    Per-operation call counts, cumulative time and latency histograms
+
+    Only the outermost call is recorded when operations call each other,
+    e.g. :func:`open` reading the file through :meth:`MockFS.read`.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ops = {}
+        self._shadowed = []
+
+    def record(self, op, elapsed):
+        """Record a single call of 'op' that took 'elapsed' seconds"""
+        bucket = min(int(elapsed * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        with self._lock:
+            try:
+                counters = self._ops[op]
+            except KeyError:
+                counters = self._ops[op] = [0, 0.0, [0] * HISTOGRAM_BUCKETS]
+            counters[0] += 1
+            counters[1] += elapsed
+            counters[2][bucket] += 1
+
+    def report(self, reset=False):
+        """
+        Return a dict mapping operation names to their statistics
+
+        Each value is a dict with the 'count' of calls, the 'total' time in
+        seconds and the latency 'histogram' as a list of (upper bound in
+        microseconds, count) pairs for the non-empty buckets.
+
+        """
+        with self._lock:
+            ops = self._ops
+            if reset:
+                self._ops = {}
+        result = {}
+        for op, (count, total, histogram) in ops.items():
+            buckets = []
+            for bucket, bucket_count in enumerate(histogram):
+                if bucket_count:
+                    if bucket == HISTOGRAM_BUCKETS - 1:
+                        bound = float('inf')
+                    else:
+                        bound = 2**bucket
+                    buckets.append((bound, bucket_count))
+            result[op] = {'count': count, 'total': total, 'histogram': buckets}
+        return result
+
+    def reset(self):
+        """Forget all recorded statistics"""
+        with self._lock:
+            self._ops = {}
+
+    def call(self, op, func, *args, **kwargs):
+        """Call func(*args, **kwargs) and record it as 'op'"""
+        local = self._local
+        if getattr(local, 'depth', 0):
+            return func(*args, **kwargs)
+        local.depth = 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(op, time.perf_counter() - start)
+            local.depth = 0
+
+    def iterate(self, op, iterator):
+        """Yield from iterator and record the total time spent as 'op'"""
+        local = self._local
+        if getattr(local, 'depth', 0):
+            yield from iterator
+            return
+        elapsed = 0.0
+        try:
+            while True:
+                local.depth = 1
+                start = time.perf_counter()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                    local.depth = 0
+                yield value
+        finally:
+            self.record(op, elapsed)
+
+    def open(
+        self, name, mode='r', encoding=None, errors=None, backend=None, newline=None
+    ):
+        """Open an :class:`InstrumentedFile` and record it as 'open'"""
+        return self.call(
+            'open',
+            InstrumentedFile,
+            name,
+            mode,
+            encoding,
+            errors,
+            self,
+            backend,
+            newline,
+        )
+
+    def instrument(self, mfs):
+        """Shadow the methods of a MockFS instance with instrumented wrappers"""
+        # Methods may already be shadowed, e.g. by the locks of a thread-safe
+        # MockFS, so the previous attributes are restored by uninstrument().
+        self._shadowed = []
+        for obj, names, wrap in (
+            (mfs, MOCKFS_OPERATIONS, self._wrap),
+            (mfs, MOCKFS_ITERATORS, self._wrap_iterator),
+            (mfs.cwd, CWD_OPERATIONS, self._wrap),
+        ):
+            for name in names:
+                self._shadowed.append((obj, name, obj.__dict__.get(name)))
+                setattr(obj, name, wrap(name, getattr(obj, name)))
+
+    def uninstrument(self, mfs):
+        """Remove the wrappers installed by :meth:`instrument`"""
+        for obj, name, previous in self._shadowed:
+            if previous is None:
+                obj.__dict__.pop(name, None)
+            else:
+                setattr(obj, name, previous)
+        self._shadowed = []
+
+    def _wrap(self, op, func):
+        call = self.call
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return call(op, func, *args, **kwargs)
+
+        return wrapper
+
+    def _wrap_iterator(self, op, func):
+        iterate = self.iterate
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return iterate(op, iter(func(*args, **kwargs)))
+
+        return wrapper
+
+
+class InstrumentedFile(storage.file):
+    """A :class:`mockfs.storage.file` that records its operations"""
+
+    def __init__(
+        self,
+        name,
+        mode='r',
+        encoding=None,
+        errors=None,
+        stats=None,
+        backend=None,
+        newline=None,
+    ):
+        # Set first: a failed open still calls close() from __del__
+        self._stats = stats
+        storage.file.__init__(
+            self,
+            name,
+            mode,
+            encoding=encoding,
+            errors=errors,
+            backend=backend,
+            newline=newline,
+        )
+
+
+def _instrumented(name, op):
+    """Return a method that records calls to the storage.file method 'name'"""
+    method = getattr(storage.file, name)
+
+    def wrapper(self, *args, **kwargs):
+        stats = self._stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+        return stats.call(op, method, self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _name, _op in FILE_OPERATIONS:
+    setattr(InstrumentedFile, _name, _instrumented(_name, _op))
+del _name, _op
@@ -1,6 +1,12 @@
+import bisect
 import codecs
 import io
+import itertools
+import locale
+import os
+import re
 import sys
+import weakref
 from warnings import warn
 
 from . import compat, util
@@ -27,15 +33,39 @@ READ_MODES += MIXED_MODES
 WRITE_MODES += MIXED_MODES
 
 
-# would need something a little less basic if os.read
-# is implemented...
-_fileno_counter = 2
+NEWLINES = (None, '', '\n', '\r', '\r\n')
+_UNIVERSAL_NEWLINES = re.compile('\r\n|\r|\n')
+
+# Text and binary views of file contents are computed once per content
+# version. Backends with a 'views' LRU remember them for the most recently
+# opened files, so the cache goes away with the backend.
+VIEW_CACHE_SIZE = 64
+
+
+# Mock file numbers count down from FIRST_FILENO. Real file descriptors are
+# never negative and -1 asks mmap.mmap() for an anonymous map, so a mock
+# number can never be mistaken for a real descriptor. Calling next() on an
+# itertools.count is atomic, so threads never share a file number.
+FIRST_FILENO = -2
+_filenos = itertools.count(FIRST_FILENO, -1)
 
 
 def get_new_fileno():
-    global _fileno_counter
-    _fileno_counter += 1
-    return _fileno_counter
+    return next(_filenos)
+
+
+def is_mock_fileno(fileno):
+    """Return whether 'fileno' is in the range of mock file numbers"""
+    return fileno <= FIRST_FILENO
+
+
+# Open files by file number, so that mmap.mmap() can find them
+_files = weakref.WeakValueDictionary()
+
+
+def get_file(fileno):
+    """Return the open mock file with the file number 'fileno', or None"""
+    return _files.get(fileno)
 
 
 class file(object):
@@ -68,39 +98,65 @@ class file(object):
     @property
     def encoding(self):
         'file encoding'
-        return None
+        return self._encoding
 
     @property
     def errors(self):
         """Unicode error handler"""
-        return None
+        return self._errors
 
     @property
     def newlines(self):
         """end-of-line convention used in this file"""
         return None
 
-    def __init__(self, name, mode='r'):
+    def __init__(
+        self, name, mode='r', encoding=None, errors=None, backend=None, newline=None
+    ):
         """
         x.__init__(...) initializes x; see x.__class__.__doc__ for signature
         """
+        # Files keep the backend they were opened with
+        if backend is None:
+            backend = _default_backend()
+        self._backend = backend
+        # A file that fails to open is closed when it is collected
+        self._closed = True
         if not util.is_string(name):
             raise TypeError('File name argument must be str got: %s' % type(name))
         if not util.is_string(mode):
             raise TypeError('File mode argument must be str got: %s' % type(mode))
+        if newline not in NEWLINES:
+            raise ValueError('illegal newline value: %r' % (newline,))
 
         self._name = name
         self._mode = mode
+        self._encoding = encoding
+        self._errors = errors
+        self._newline = newline
         self._position = 0
         self._closed = False
         self._binary = mode.endswith('b')
         self._fileno = get_new_fileno()
         self._in_iter = False
         self._softspace = 0
+        # The stored contents that the data was last loaded from
+        self._raw = None
+        # A compressed entry that is read block by block instead of loaded
+        self._stream = None
+        # Line end offsets and the data they were computed for
+        self._line_ends = None
+        self._line_ends_data = None
+        # Writes go to a growable buffer that is turned back into an
+        # immutable value only when the data is needed.
+        self._buffer = None
+        self._dirty = False
+        # Only files that were written to are saved by flush() and close()
+        self._modified = False
         if self._binary:
-            self._data = b''
+            self._value = b''
         else:
-            self._data = ''
+            self._value = ''
 
         if mode not in ALL_MODES:
             raise ValueError(
@@ -120,29 +176,118 @@ class file(object):
         else:
             # double check and remove this branch!
             raise AssertionError('whoops - not possible, surely??')
+        _files[self._fileno] = self
 
     def _open_read(self):
-        if not backend.CheckForFile(self.name):
+        if not self._backend.CheckForFile(self.name):
             raise IOError('No such file or directory: %r' % self.name)
-        data = backend.LoadFile(self.name)
-        if not self._binary:
-            data = data.replace('\r\n', '\n')
-        self._data = data
+        stream = self._load_stream()
+        self._stream = stream
+        if stream is not None:
+            self._raw = stream
+            return
+        raw = self._backend.LoadFile(self.name)
+        if raw is self._raw and not self._dirty:
+            return
+        self._data = self._view(raw)
+        self._raw = raw
+
+    def _load_stream(self):
+        """
+        Return the compressed entry to read in blocks, or None
+
+        Streaming is used by read-only files whose view of the contents
+        would be identical to the stored contents. Other files decompress
+        the whole entry when they open it.
+
+        """
+        if self.mode in WRITE_MODES:
+            return None
+        load_stream = getattr(self._backend, 'LoadStream', None)
+        if load_stream is None:
+            return None
+        stream = load_stream(self.name)
+        if stream is None or stream.text == self._binary:
+            return None
+        if (
+            self._binary
+            or self._newline == '\n'
+            or (self._newline in (None, '') and not stream.has_cr)
+        ):
+            return stream
+        return None
+
+    def _view(self, raw):
+        """
+        Return the stored contents as seen through this file
+
+        Text files decode binary contents and translate newlines, and binary
+        files encode text contents. The result is cached per content version
+        so that opening and reading the same contents again is free.
+
+        """
+        binary = self._binary
+        if binary and not util.is_string(raw):
+            return raw
+        views = getattr(self._backend, 'views', None)
+        key = (id(raw), binary, self._encoding, self._errors, self._newline)
+        if views is not None:
+            cached = views.get(key)
+            if cached is not None and cached[0] is raw:
+                return cached[1]
+        encoding = self._encoding or locale.getpreferredencoding(False)
+        errors = self._errors or 'strict'
+        if binary:
+            data = raw.encode(encoding, errors)
+        else:
+            if not util.is_string(raw):
+                # Binary contents, e.g. files mirrored from disk
+                data = str(raw, encoding, errors)
+            else:
+                data = raw
+            if self._newline is None and '\r' in data:
+                data = data.replace('\r\n', '\n').replace('\r', '\n')
+        if views is not None:
+            views[key] = (raw, data)
+        return data
 
     def _open_write(self):
         try:
-            backend.SaveFile(self.name, '')
+            self._backend.SaveFile(self.name, '')
         except IOError as e:
             self._closed = True
             raise e
 
     def _open_append(self):
-        if backend.CheckForFile(self.name):
+        if self._backend.CheckForFile(self.name):
             self._open_read()
             self._position = len(self._data)
         else:
             self._open_write()
 
+    def _get_data(self):
+        if self._stream is not None:
+            return self._stream.load()
+        if self._dirty:
+            self._value = self._buffer.getvalue()
+            self._dirty = False
+        return self._value
+
+    def _set_data(self, value):
+        self._value = value
+        self._buffer = None
+        self._dirty = False
+
+    _data = property(_get_data, _set_data, doc='the current file contents')
+
+    def _get_size(self):
+        """Return the size of the data without materializing the buffer"""
+        if self._stream is not None:
+            return self._stream.size
+        if self._dirty:
+            return self._buffer.seek(0, io.SEEK_END)
+        return len(self._value)
+
     def _check_int_argument(self, arg):
         if isinstance(arg, float):
             arg = int(arg)
@@ -172,13 +317,16 @@ class file(object):
             self._open_read()
 
         if size is DEFAULT:
-            size = len(self._data)
+            size = -1
         else:
             size = self._check_int_argument(size)
+
+        if self._stream is not None:
+            data = self._stream.read(pos, size)
+        else:
             if size < 0:
                 size = len(self._data)
-
-        data = self._data[pos : pos + size]
+            data = self._data[pos : pos + size]
         self._position += len(data)
         return data
 
@@ -197,18 +345,25 @@ class file(object):
 
         if not data:
             return
-        if self._binary:
-            null = b'\x00'
-        else:
-            null = '\x00'
-            data = data.replace('\n', '\r\n')
-
-        position = self._position
-        start = self._data[:position]
-        padding = (position - len(start)) * null
-        end = self._data[position + len(data) :]
-        self._data = start + padding + data + end
-        self._position = position + len(data)
+        if not self._binary:
+            newline = self._newline
+            if newline is None:
+                newline = os.linesep
+            if newline and newline != '\n' and '\n' in data:
+                data = data.replace('\n', newline)
+
+        buffer = self._buffer
+        if buffer is None:
+            if self._binary:
+                buffer = io.BytesIO(self._value)
+            else:
+                buffer = io.StringIO(self._value)
+            self._buffer = buffer
+        # Writing past the end pads the gap with null bytes
+        buffer.seek(self._position)
+        self._position += buffer.write(data)
+        self._dirty = True
+        self._modified = True
 
     def close(self):
         """Returns None or (perhaps) an integer.  Close the file.
@@ -221,8 +376,9 @@ class file(object):
         if self.closed:
             return
         self._closed = True
-        if self.mode in WRITE_MODES:
-            backend.SaveFile(self.name, self._data)
+        _files.pop(self._fileno, None)
+        if self._modified:
+            self._backend.SaveFile(self.name, self._data)
 
     def __repr__(self):
         """repr() implementation hook"""
@@ -255,7 +411,7 @@ class file(object):
         if whence == 1:
             position = self._position + position
         elif whence == 2:
-            position = len(self._data) + position
+            position = self._get_size() + position
 
         if position < 0:
             raise IOError('Invalid Argument')
@@ -270,7 +426,9 @@ class file(object):
         """Flush the internal I/O buffer."""
         if self.mode not in WRITE_MODES:
             raise IOError('Bad file descriptor')
-        backend.SaveFile(self.name, self._data)
+        if self._modified:
+            self._backend.SaveFile(self.name, self._data)
+            self._modified = False
 
     def isatty(self):
         """Is the file connected to a tty device? mockfs always returns False."""
@@ -294,7 +452,7 @@ class file(object):
         if self.mode in WRITE_MODES:
             raise IOError('Bad file descriptor')
         self._in_iter = True
-        if self._position >= len(self._data):
+        if self._position >= self._get_size():
             raise StopIteration
         return self.readline()
 
@@ -316,31 +474,30 @@ class file(object):
                 # treat negative integers the same as DEFAULT
                 size = DEFAULT
 
-        if self._position >= len(self._data):
-            return ''
-
         position = self._position
-        remaining = self._data[position:]
-        poz = remaining.find('\n')
-
-        if poz == -1:
-            if size is DEFAULT or size > len(remaining):
-                self._position = len(self._data)
-                return remaining
-            actual = remaining[:size]
-            self._position += len(actual)
-            return actual
-
-        if size is DEFAULT:
-            self._position = position + poz + 1
-            return remaining[: poz + 1]
-
-        actual = remaining[: poz + 1]
-        if len(actual) <= size:
-            self._position += len(actual)
-            return actual
-        self._position += size
-        return actual[:size]
+        if self._stream is not None:
+            return self._readline_stream(position, size)
+        data = self._data
+        if position >= len(data):
+            return data[:0]
+
+        line_ends = self._get_line_ends()
+        idx = bisect.bisect_right(line_ends, position)
+        if idx < len(line_ends):
+            end = line_ends[idx]
+        else:
+            end = len(data)
+        if size is not DEFAULT and end - position > size:
+            end = position + size
+        self._position = end
+        return data[position:end]
+
+    def _readline_stream(self, position, size):
+        """Return the next line of a compressed entry, decompressing its blocks"""
+        sep = b'\n' if self._binary else '\n'
+        line = self._stream.readline(position, sep, -1 if size is DEFAULT else size)
+        self._position = position + len(line)
+        return line
 
     def readlines(self, size=DEFAULT):
         """Return a list of strings, each a line from the file.
@@ -352,14 +509,52 @@ class file(object):
         if self.mode in WRITE_MODES:
             raise IOError('Bad file descriptor')
 
-        # argument actually ignored
         if size is not DEFAULT:
-            self._check_int_argument(size)
+            size = self._check_int_argument(size)
+            if size <= 0:
+                size = DEFAULT
 
-        result = list(self)
+        result = []
+        total = 0
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            result.append(line)
+            total += len(line)
+            if size is not DEFAULT and total >= size:
+                break
         self._in_iter = False
         return result
 
+    def _get_line_ends(self):
+        """Return the sorted offsets just past each line end in the file data
+
+        The offsets are computed lazily, once per version of the data.
+        """
+        data = self._data
+        if self._line_ends_data is not data:
+            newline = self._newline
+            if not util.is_string(data):
+                newline = b'\n'
+            elif newline is None:
+                # Newlines were translated when the data was loaded
+                newline = '\n'
+            if newline == '':
+                line_ends = [m.end() for m in _UNIVERSAL_NEWLINES.finditer(data)]
+            else:
+                line_ends = []
+                find = data.find
+                step = len(newline)
+                pos = find(newline)
+                while pos != -1:
+                    pos += step
+                    line_ends.append(pos)
+                    pos = find(newline, pos)
+            self._line_ends = line_ends
+            self._line_ends_data = data
+        return self._line_ends
+
     def xreadlines(self):
         """Returns self for backward compatibility.
 
@@ -393,8 +588,13 @@ class file(object):
                 raise IOError('Invalid argument')
         else:
             size = self._position
+        if self._binary:
+            null = b'\x00'
+        else:
+            null = '\x00'
         data = self._data[:size]
-        self._data = data + (size - len(data)) * '\x00'
+        self._data = data + (size - len(data)) * null
+        self._modified = True
         self.flush()
 
     def writelines(self, sequence):
@@ -422,21 +622,36 @@ class file(object):
         self.close()
 
 
-def open(name, mode='r', encoding=None, errors=None):
+def open(
+    name,
+    mode='r',
+    buffering=-1,
+    encoding=None,
+    errors=None,
+    newline=None,
+    closefd=True,
+    opener=None,
+):
     """Open a file using the file() type, returns a file object.
 
-    This is the preferred way to open a file.
+    This is the preferred way to open a file. The arguments match the
+    builtin :func:`open`. Buffering, 'closefd' and 'opener' are ignored.
     """
-    return file(name, mode)
+    return file(name, mode, encoding=encoding, errors=errors, newline=newline)
+
 
+def replace_builtins(opener=None):
+    """replace file and open in the builtin module
 
-def replace_builtins():
-    """replace file and open in the builtin module"""
+    :param opener: replacement for :func:`open`, defaults to :func:`open`
+    """
+    if opener is None:
+        opener = open
     if sys.version_info[0] == 2:
         builtins.file = file
-    builtins.open = open
-    codecs.open = open
-    io.open = open
+    builtins.open = opener
+    codecs.open = opener
+    io.open = opener
 
 
 def restore_builtins():
@@ -448,6 +663,11 @@ def restore_builtins():
     io.open = original_io_open
 
 
+def _default_backend():
+    """Return the module-level backend used when a file is given none"""
+    return backend
+
+
 _store = {}
 
 
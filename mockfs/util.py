@@ -1,6 +1,20 @@
+import collections
+import fnmatch
 import os
+import re
+import threading
 
 from . import compat
+from .nodes import LazyDirectory, LazyFile
+
+_SLASHES = re.compile('//+')
+_MAGIC = re.compile('[*?[]')
+_FILE_TYPES = compat.file_types + (LazyFile,)
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ('hits', 'misses', 'maxsize', 'currsize')
+)
+ContentInfo = collections.namedtuple('ContentInfo', ('distinct', 'references', 'size'))
 
 
 def is_string(value):
@@ -9,8 +23,8 @@ def is_string(value):
 
 
 def is_file(value):
-    """Is value a file?  Equivalent to checking for strings"""
-    return is_string(value)
+    """Is value a file?  Equivalent to checking for strings or bytes"""
+    return isinstance(value, _FILE_TYPES)
 
 
 def is_dir(entry):
@@ -25,13 +39,22 @@ def sanitize(path):
     to simulate the file system.
 
     """
-    while '//' in path:
-        path = path.replace('//', '/')
-    while len(path) > 1 and path.endswith('/'):
+    path = _SLASHES.sub('/', path)
+    if len(path) > 1 and path.endswith('/'):
         path = path[:-1]
     return path
 
 
+def has_magic(pattern):
+    """Does pattern contain glob wildcards?"""
+    return _MAGIC.search(pattern) is not None
+
+
+def compile_pattern(pattern):
+    """Compile a single glob path segment into a match function"""
+    return re.compile(fnmatch.translate(pattern)).match
+
+
 def merge_dicts(src, dst):
     """
     Merge entries from 'src' into 'dst'.
@@ -99,3 +122,218 @@ def build_nested_dir_dict(dirpath):
 
     current[basename] = {}
     return result
+
+
+class LRUCache(object):
+    """Bounded mapping that evicts the least recently used entries
+
+    Hits and misses are counted by :meth:`get` and survive :meth:`clear`
+    so that the cache can be sized for a workload.
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __setitem__(self, key, value):
+        data = self._data
+        data[key] = value
+        # Concurrent readers may evict the key or empty the cache in between
+        try:
+            data.move_to_end(key)
+            if len(data) > self.maxsize:
+                data.popitem(last=False)
+        except KeyError:
+            pass
+
+    def get(self, key, default=None):
+        """Return the cached value for key and mark it as recently used"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            pass
+        self.hits += 1
+        return value
+
+    def pop(self, key, default=None):
+        """Remove key from the cache and return its value"""
+        return self._data.pop(key, default)
+
+    def clear(self):
+        """Remove all entries while keeping the hit and miss counters"""
+        self._data.clear()
+
+    def info(self):
+        """Return a :class:`CacheInfo` with the cache statistics"""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+class RWLock(object):
+    """
+    A reentrant readers-writer lock
+
+    Any number of threads may hold the lock for reading while no thread
+    holds it for writing. Waiting writers take precedence over new readers.
+    A thread may acquire the lock again for reading while it holds it for
+    reading or writing, and again for writing while it holds it for
+    writing. Upgrading a read lock to a write lock would deadlock and
+    raises :exc:`RuntimeError`.
+
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        """Acquire the lock for reading"""
+        if self._writer == threading.get_ident():
+            return
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        if depth:
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        """Release a lock acquired with :meth:`acquire_read`"""
+        if self._writer == threading.get_ident():
+            return
+        local = self._local
+        local.depth -= 1
+        if local.depth:
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Acquire the lock for writing"""
+        ident = threading.get_ident()
+        if self._writer == ident:
+            self._writer_depth += 1
+            return
+        if getattr(self._local, 'depth', 0):
+            raise RuntimeError('cannot upgrade a read lock to a write lock')
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = ident
+            self._writer_depth = 1
+
+    def release_write(self):
+        """Release a lock acquired with :meth:`acquire_write`"""
+        self._writer_depth -= 1
+        if self._writer_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+
+class ContentStore(object):
+    """
+    Content-addressed store that keeps each distinct file content once
+
+    :meth:`add` returns the shared value equal to the given contents and
+    counts a reference to it. Values are dropped from the store when their
+    last reference is discarded. Only ``str`` and ``bytes`` contents are
+    stored; lazily loaded files are left alone.
+
+    """
+
+    def __init__(self):
+        # Maps each content to its shared value. Reference counts are only
+        # kept for values with more than one reference, which keeps the
+        # cost of unique contents to a single dict slot.
+        self._contents = {}
+        self._counts = {}
+        self._references = 0
+
+    def __len__(self):
+        return len(self._contents)
+
+    def add(self, value):
+        """Return the shared copy of value and count a reference to it"""
+        if not isinstance(value, compat.file_types):
+            return value
+        self._references += 1
+        shared = self._contents.get(value)
+        if shared is None:
+            self._contents[value] = value
+            return value
+        self._counts[shared] = self._counts.get(shared, 1) + 1
+        return shared
+
+    def discard(self, value):
+        """Drop a reference to value"""
+        if not isinstance(value, compat.file_types) or value not in self._contents:
+            return
+        self._references -= 1
+        count = self._counts.pop(value, 1) - 1
+        if count > 1:
+            self._counts[value] = count
+        elif not count:
+            del self._contents[value]
+
+    def add_tree(self, directory):
+        """Count a reference to every file below a directory"""
+        for value in _iter_files(directory):
+            self.add(value)
+
+    def discard_tree(self, directory):
+        """Drop the references of every file below a directory"""
+        for value in _iter_files(directory):
+            self.discard(value)
+
+    def clear(self):
+        """Forget all contents"""
+        self._contents = {}
+        self._counts = {}
+        self._references = 0
+
+    def info(self):
+        """Return a :class:`ContentInfo` with the store statistics"""
+        size = sum(len(value) for value in self._contents)
+        return ContentInfo(len(self._contents), self._references, size)
+
+
+def _iter_files(directory):
+    """Yield the file contents below a directory, without loading lazy ones"""
+    stack = [directory]
+    while stack:
+        directory = stack.pop()
+        if isinstance(directory, LazyDirectory):
+            continue
+        for entry in directory.values():
+            if isinstance(entry, dict):
+                stack.append(entry)
+            else:
+                yield entry
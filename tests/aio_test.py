@@ -0,0 +1,88 @@
+# subjects under test
+import asyncio
+import functools
+import unittest
+
+import mockfs
+from mockfs import aio
+
+
+def async_test(method):
+    """Run the coroutine test 'method' on a new event loop"""
+
+    @functools.wraps(method)
+    def test(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(method(self))
+        finally:
+            loop.close()
+
+    return test
+
+
+class AioTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mfs = mockfs.replace_builtins()
+        self.mfs.add_entries({'/a/a': 'a\nb\n', '/a/b/c': ''})
+
+    def tearDown(self):
+        aio.set_yield_every(0)
+        mockfs.restore_builtins()
+
+    @async_test
+    async def test_open_and_read(self):
+        async with aio.open('/a/a') as fh:
+            self.assertEqual(await fh.read(), 'a\nb\n')
+        self.assertTrue(fh.closed)
+
+    @async_test
+    async def test_await_open_and_write(self):
+        fh = await aio.open('/a/new', 'w')
+        await fh.write('x')
+        await fh.close()
+        self.assertEqual(self.mfs.read('/a/new'), 'x')
+
+    @async_test
+    async def test_iterate_lines(self):
+        async with aio.open('/a/a') as fh:
+            lines = [line async for line in fh]
+        self.assertEqual(lines, ['a\n', 'b\n'])
+
+    @async_test
+    async def test_os_operations(self):
+        self.assertTrue(await aio.exists('/a/a'))
+        self.assertTrue(await aio.isdir('/a/b'))
+        self.assertEqual(await aio.listdir('/a'), ['a', 'b'])
+        self.assertEqual((await aio.stat('/a/a')).st_size, 4)
+        await aio.remove('/a/a')
+        await aio.rmtree('/a/b')
+        self.assertEqual(await aio.listdir('/a'), [])
+
+    @async_test
+    async def test_scandir_and_walk(self):
+        names = [entry.name async for entry in aio.scandir('/a')]
+        self.assertEqual(names, ['a', 'b'])
+        dirpaths = [dirpath async for dirpath, _, _ in aio.walk('/a')]
+        self.assertEqual(dirpaths, ['/a', '/a/b'])
+
+    @async_test
+    async def test_yield_every(self):
+        order = []
+
+        async def worker(name):
+            for _ in range(3):
+                await aio.exists('/a/a')
+                order.append(name)
+
+        await asyncio.gather(worker('x'), worker('y'))
+        self.assertEqual(order, ['x', 'x', 'x', 'y', 'y', 'y'])
+
+        del order[:]
+        aio.set_yield_every(1)
+        await asyncio.gather(worker('x'), worker('y'))
+        self.assertEqual(order, ['x', 'y', 'x', 'y', 'x', 'y'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# subjects under test
+import gc
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+import mockfs
+from mockfs import archive, storage
+
+MEMBERS = {
+    'data/a.txt': b'a1\na2\n',
+    'data/sub/b.bin': b'\xff' * 64,
+    'top.txt': b'top\n',
+}
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tmpdir, 'fixtures.zip')
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('data/empty/', b'')
+            for name, content in MEMBERS.items():
+                zf.writestr(name, content)
+        self.tar_path = os.path.join(self.tmpdir, 'fixtures.tar.gz')
+        with tarfile.open(self.tar_path, 'w:gz') as tf:
+            for name, content in MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                info.mtime = 1000000000
+                tf.addfile(info, io.BytesIO(content))
+            link = tarfile.TarInfo('link')
+            link.type = tarfile.SYMTYPE
+            link.linkname = 'data/sub'
+            tf.addfile(link)
+            hardlink = tarfile.TarInfo('hardlink.txt')
+            hardlink.type = tarfile.LNKTYPE
+            hardlink.linkname = 'top.txt'
+            tf.addfile(hardlink)
+        self.mfs = mockfs.MockFS()
+        mockfs.replace_builtins(context=self.mfs)
+
+    def tearDown(self):
+        self.mfs.close()
+        mockfs.restore_builtins()
+        shutil.rmtree(self.tmpdir)
+
+    def test_zip(self):
+        self.mfs.mount_archive('/opt/zip', self.zip_path)
+        self.assertEqual(sorted(os.listdir('/opt/zip')), ['data', 'top.txt'])
+        self.assertEqual(sorted(os.listdir('/opt/zip/data')), ['a.txt', 'empty', 'sub'])
+        self.assertTrue(os.path.isdir('/opt/zip/data/empty'))
+        self.assertEqual(os.path.getsize('/opt/zip/data/sub/b.bin'), 64)
+        with open('/opt/zip/data/a.txt') as fh:
+            self.assertEqual(fh.readlines(), ['a1\n', 'a2\n'])
+        with open('/opt/zip/data/sub/b.bin', 'rb') as fh:
+            self.assertEqual(fh.read(), b'\xff' * 64)
+
+    def test_tar(self):
+        self.mfs.mount_archive('/opt/tar', self.tar_path)
+        self.assertEqual(
+            sorted(os.listdir('/opt/tar')), ['data', 'hardlink.txt', 'link', 'top.txt']
+        )
+        self.assertEqual(os.path.getmtime('/opt/tar/top.txt'), 1000000000)
+        self.assertTrue(os.path.islink('/opt/tar/link'))
+        self.assertEqual(os.listdir('/opt/tar/link'), ['b.bin'])
+        self.assertEqual(os.path.getsize('/opt/tar/hardlink.txt'), 4)
+        with open('/opt/tar/hardlink.txt') as fh:
+            self.assertEqual(fh.read(), 'top\n')
+
+    def test_members_are_extracted_on_first_read(self):
+        source = self.mfs.mount_archive('/', self.zip_path, cache_size=1)
+        self.assertIsInstance(self.mfs._direntry('/top.txt'), archive.ArchiveFile)
+        self.assertEqual(source.info().currsize, 0)
+        self.assertEqual(self.mfs.read('/top.txt'), b'top\n')
+        self.assertEqual(self.mfs.read('/top.txt'), b'top\n')
+        self.assertEqual(source.info().hits, 1)
+        self.assertEqual(self.mfs.read('/data/a.txt'), b'a1\na2\n')
+        self.assertEqual(source.info().currsize, 1)
+
+    def test_changes_are_not_written_back(self):
+        self.mfs.mount_archive('/opt', self.zip_path)
+        with open('/opt/top.txt', 'w') as fh:
+            fh.write('changed')
+        os.remove('/opt/data/a.txt')
+        mfs = mockfs.MockFS()
+        mfs.mount_archive('/opt', self.zip_path)
+        self.assertEqual(mfs.read('/opt/top.txt'), b'top\n')
+        self.assertTrue(mfs.exists('/opt/data/a.txt'))
+        mfs.close()
+
+    def test_close(self):
+        for path in (self.zip_path, self.tar_path):
+            source = self.mfs.mount_archive('/opt', path)
+            self.assertEqual(self.mfs.read('/opt/top.txt'), b'top\n')
+            self.mfs.close()
+            self.assertTrue(source.closed)
+            self.assertRaises(ValueError, self.mfs.read, '/opt/data/a.txt')
+
+    def test_unused_archive_is_closed(self):
+        source = self.mfs.mount_archive('/opt', self.tar_path)
+        fh = source._fh
+        del source
+        self.mfs.rmtree('/opt')
+        gc.collect()
+        self.assertTrue(fh.closed)
+
+    def test_not_an_archive(self):
+        path = os.path.join(self.tmpdir, 'plain.txt')
+        with storage.original_open(path, 'wb') as fh:
+            fh.write(b'plain text')
+        self.assertRaises(tarfile.ReadError, self.mfs.mount_archive, '/opt', path)
+
+
+if __name__ == '__main__':
+    unittest.main()
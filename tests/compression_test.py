@@ -0,0 +1,86 @@
+# subjects under test
+import os
+import unittest
+
+import mockfs
+from mockfs import compression
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.block_size = compression.BLOCK_SIZE
+        compression.BLOCK_SIZE = 8
+        self.text = ''.join('line %d\n' % idx for idx in range(20))
+        self.data = bytes(range(256)) * 4
+        self.mfs = mockfs.MockFS(compress_threshold=32)
+        self.mfs.add_entries(
+            {'/text': self.text, '/data': self.data, '/small': 'small\n'}
+        )
+        mockfs.replace_builtins(context=self.mfs)
+
+    def tearDown(self):
+        mockfs.restore_builtins()
+        compression.BLOCK_SIZE = self.block_size
+
+    def test_entries_above_threshold_are_compressed(self):
+        entry = self.mfs._direntry('/text')
+        self.assertIsInstance(entry, compression.CompressedFile)
+        self.assertEqual(len(entry.blocks), (len(self.text) + 7) // 8)
+        self.assertEqual(self.mfs._direntry('/small'), 'small\n')
+        self.assertEqual(os.path.getsize('/text'), len(self.text))
+        self.assertEqual(self.mfs.read('/text'), self.text)
+        self.assertEqual(self.mfs.read('/data'), self.data)
+
+    def test_read_in_blocks(self):
+        with open('/data', 'rb') as fh:
+            self.assertEqual(fh.read(5), self.data[:5])
+            fh.seek(300)
+            self.assertEqual(fh.read(20), self.data[300:320])
+            self.assertEqual(fh.read(), self.data[320:])
+            self.assertEqual(fh.read(), b'')
+        info = self.mfs.block_cache_info()
+        self.assertEqual(info.currsize, compression.BLOCK_CACHE_SIZE)
+
+    def test_readline_and_iteration(self):
+        with open('/text') as fh:
+            self.assertEqual(fh.readline(), 'line 0\n')
+            self.assertEqual(fh.readline(3), 'lin')
+            lines = self.text.splitlines(True)
+            self.assertEqual(list(fh), ['e 1\n'] + lines[2:])
+            self.assertEqual(fh.readline(), '')
+        with open('/text') as fh:
+            self.assertEqual(fh.readlines(), self.text.splitlines(True))
+
+    def test_repeated_reads_hit_block_cache(self):
+        for _ in range(2):
+            with open('/text') as fh:
+                fh.read(4)
+        info = self.mfs.block_cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_translated_text_is_decompressed_whole(self):
+        self.mfs.add_entries({'/crlf': 'a\r\n' * 20})
+        with open('/crlf') as fh:
+            self.assertEqual(fh.read(), 'a\n' * 20)
+        with open('/text', 'rb') as fh:
+            self.assertEqual(fh.read(), self.text.encode('ascii'))
+
+    def test_write_compresses_new_contents(self):
+        with open('/text', 'a') as fh:
+            fh.write('more\n' * 10)
+        entry = self.mfs._direntry('/text')
+        self.assertIsInstance(entry, compression.CompressedFile)
+        self.assertEqual(self.mfs.read('/text'), self.text + 'more\n' * 10)
+
+    def test_stats(self):
+        self.mfs.enable_stats()
+        self.mfs.add_entries({'/more': 'x' * 64})
+        with open('/more') as fh:
+            fh.read()
+        stats = self.mfs.stats()
+        self.assertEqual(stats['compress']['count'], 1)
+        self.assertEqual(stats['decompress']['count'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
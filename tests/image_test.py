@@ -0,0 +1,115 @@
+# subjects under test
+import os
+import shutil
+import tempfile
+import unittest
+
+import mockfs
+from mockfs import image
+
+
+class ImageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'tree.img')
+        self.mfs = mockfs.MockFS()
+        self.mfs.add_entries({
+            '/src/text.txt': 'line 1\nline é\n',
+            '/src/data.bin': b'\x00\xff' * 8,
+            '/src/empty': '',
+            '/src/sub/deep/file': 'deep',
+            '/empty': {},
+        })
+        self.mfs.symlink('/src/sub', '/link')
+
+    def tearDown(self):
+        mockfs.restore_builtins()
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self):
+        self.mfs.save_image(self.path)
+        mfs = mockfs.MockFS()
+        mfs.load_image(self.path)
+        return mfs
+
+    def test_round_trip(self):
+        mfs = self._load()
+        self.assertEqual(mfs.listdir('/'), ['empty', 'link', 'src'])
+        self.assertEqual(mfs.listdir('/src'), ['data.bin', 'empty', 'sub', 'text.txt'])
+        self.assertEqual(mfs.read('/src/text.txt'), 'line 1\nline é\n')
+        self.assertEqual(mfs.read('/src/data.bin'), b'\x00\xff' * 8)
+        self.assertEqual(mfs.read('/src/empty'), '')
+        self.assertEqual(mfs.getsize('/src/text.txt'), 14)
+        self.assertEqual(mfs.listdir('/empty'), [])
+        self.assertEqual(mfs.readlink('/link'), '/src/sub')
+        self.assertEqual(mfs.read('/link/deep/file'), 'deep')
+        for path in ('/src', '/src/text.txt', '/src/sub/deep/file', '/link'):
+            self.assertEqual(mfs.lstat(path), self.mfs.lstat(path))
+
+    def test_open_after_load(self):
+        mfs = self._load()
+        mockfs.replace_builtins(context=mfs)
+        with open('/src/text.txt', encoding='utf-8') as fh:
+            self.assertEqual(fh.readlines(), ['line 1\n', 'line é\n'])
+        with open('/src/data.bin', 'rb') as fh:
+            self.assertEqual(fh.read(4), b'\x00\xff\x00\xff')
+
+    def test_load_is_lazy(self):
+        mfs = self._load()
+        self.assertIsInstance(mfs._entries, image.ImageDirectory)
+        src = mfs._direntry('/src')
+        self.assertIsInstance(src['sub'], image.ImageDirectory)
+        self.assertIsInstance(src['text.txt'], image.ImageFile)
+
+    def test_changes_do_not_touch_the_image(self):
+        mfs = self._load()
+        snapshot = mfs.snapshot()
+        mfs.add_entries({'/src/sub/new': 'new', '/src/text.txt': 'changed'})
+        mfs.rmtree('/empty')
+        self.assertEqual(mfs.listdir('/src/sub'), ['deep', 'new'])
+        mfs.restore(snapshot)
+        self.assertEqual(mfs.listdir('/src/sub'), ['deep'])
+        self.assertEqual(mfs.read('/src/text.txt'), 'line 1\nline é\n')
+        other = mockfs.MockFS()
+        other.load_image(self.path)
+        self.assertEqual(other.listdir('/'), ['empty', 'link', 'src'])
+
+    def test_not_an_image(self):
+        with open(self.path, 'wb') as fh:
+            fh.write(b'not an image')
+        self.assertRaises(ValueError, self.mfs.load_image, self.path)
+        with open(self.path, 'wb'):
+            pass
+        self.assertRaises(ValueError, self.mfs.load_image, self.path)
+
+    def test_truncated_image(self):
+        self.mfs.save_image(self.path)
+        with open(self.path, 'rb') as fh:
+            data = fh.read()
+        for size in (len(data) - 1, image._HEADER.size, image._HEADER.size + 4):
+            with open(self.path, 'wb') as fh:
+                fh.write(data[:size])
+            self.assertRaises(ValueError, mockfs.MockFS().load_image, self.path)
+
+    def test_corrupt_records(self):
+        self.mfs.save_image(self.path)
+        with open(self.path, 'rb') as fh:
+            data = bytearray(fh.read())
+        header = image._HEADER.unpack_from(data)
+        nodes_offset = header[6]
+        # The first child of the root, then the name size of that child
+        for idx, field in ((0, 3), (1, 1)):
+            corrupt = bytearray(data)
+            offset = nodes_offset + idx * image._NODE.size
+            record = list(image._NODE.unpack_from(corrupt, offset))
+            record[field] = len(data)
+            image._NODE.pack_into(corrupt, offset, *record)
+            with open(self.path, 'wb') as fh:
+                fh.write(corrupt)
+            mfs = mockfs.MockFS()
+            mfs.load_image(self.path)
+            self.assertRaises(ValueError, mfs.listdir, '/')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# subjects under test
+import errno
+import mmap
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import mockfs
+from mockfs import memmap
+
+
+class MemmapTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data = b'first line\nsecond line\nthird line\n'
+        self.mfs = mockfs.replace_builtins()
+        self.mfs.add_entries({'/data': self.data, '/empty': b'', '/text': 'abc\n'})
+
+    def tearDown(self):
+        mockfs.restore_builtins()
+
+    def test_read_only_map(self):
+        with open('/data', 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.assertIsInstance(mm, memmap.MockMmap)
+        self.assertIsInstance(mm, mmap.mmap)
+        self.assertEqual(len(mm), len(self.data))
+        self.assertEqual(mm.size(), len(self.data))
+        self.assertEqual(mm[0], ord('f'))
+        self.assertEqual(mm[-1], ord('\n'))
+        self.assertEqual(mm[:5], b'first')
+        self.assertEqual(mm[::11], self.data[::11])
+        with self.assertRaises(TypeError):
+            mm[0] = 0
+        mm.close()
+        self.assertTrue(mm.closed)
+        with self.assertRaises(ValueError):
+            mm.read()
+
+    def test_find_seek_read_and_readline(self):
+        with open('/data', 'rb') as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self.assertEqual(mm.find(b'line'), 6)
+                self.assertEqual(mm.find(b'line', 7), 18)
+                self.assertEqual(mm.rfind(b'line'), 29)
+                self.assertEqual(mm.find(b'missing'), -1)
+                self.assertEqual(mm.readline(), b'first line\n')
+                self.assertEqual(mm.tell(), 11)
+                self.assertEqual(mm.read(6), b'second')
+                self.assertEqual(mm.read_byte(), ord(' '))
+                mm.seek(-5, 2)
+                self.assertEqual(mm.read(), b'line\n')
+                self.assertEqual(mm.readline(), b'')
+                with self.assertRaises(ValueError):
+                    mm.seek(1, 1)
+
+    def test_buffer_protocol(self):
+        with open('/data', 'rb') as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self.assertEqual(re.search(rb'sec\w+', mm).group(), b'second')
+                self.assertEqual(bytes(memoryview(mm)[:5]), b'first')
+        with open('/data', 'r+b') as fh:
+            with mmap.mmap(fh.fileno(), 0) as mm:
+                memoryview(mm)[:5] = b'FIRST'
+        self.assertEqual(self.mfs.read('/data')[:5], b'FIRST')
+
+    def test_offset(self):
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.mfs.add_entries({'/data': b'x' * granularity + self.data})
+        with open('/data', 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 6, access=mmap.ACCESS_READ, offset=granularity)
+            self.assertEqual(mm[:], b'first ')
+            self.assertEqual(mm.find(b'r'), 2)
+            self.assertEqual(mm.size(), granularity + len(self.data))
+            with self.assertRaises(OSError):
+                mmap.mmap(fh.fileno(), 6, access=mmap.ACCESS_READ, offset=11)
+
+    def test_unmodified_map_is_not_saved(self):
+        with open('/data', 'r+b') as fh:
+            mm = mmap.mmap(fh.fileno(), 0)
+        self.mfs.add_entries({'/data': b'changed'})
+        mm.close()
+        self.assertEqual(self.mfs.read('/data'), b'changed')
+
+    def test_clean_map_is_not_read_back(self):
+        with open('/data', 'r+b') as fh:
+            mm = mmap.mmap(fh.fileno(), 0)
+        with mock.patch.object(memmap.SharedBuffer, 'read') as read:
+            mm[:5] = mm[:5]
+            mm.flush()
+            mm.close()
+        read.assert_not_called()
+
+    def test_writable_map_saves_on_flush(self):
+        with open('/data', 'r+b') as fh:
+            mm = mmap.mmap(fh.fileno(), 0)
+            other = mmap.mmap(fh.fileno(), 0)
+            mm[:5] = b'FIRST'
+            mm.seek(11)
+            mm.write(b'SECOND')
+            self.assertEqual(other[:17], b'FIRST line\nSECOND')
+            self.assertEqual(self.mfs.read('/data'), self.data)
+            mm.flush()
+            self.assertEqual(self.mfs.read('/data')[:17], b'FIRST line\nSECOND')
+            mm.move(0, 11, 6)
+            mm.close()
+            other.close()
+        self.assertEqual(self.mfs.read('/data')[:11], b'SECONDline\n')
+
+    def test_slice_assignment_must_keep_size(self):
+        with open('/data', 'r+b') as fh:
+            with mmap.mmap(fh.fileno(), 0) as mm:
+                with self.assertRaises(IndexError):
+                    mm[:2] = b'x'
+
+    def test_copy_map_is_private(self):
+        with open('/data', 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+        mm[0] = ord('F')
+        self.assertEqual(mm[:5], b'First')
+        mm.close()
+        self.assertEqual(self.mfs.read('/data'), self.data)
+
+    def test_write_access_needs_writable_file(self):
+        with open('/data', 'rb') as fh:
+            with self.assertRaises(PermissionError):
+                mmap.mmap(fh.fileno(), 0)
+
+    def test_invalid_lengths(self):
+        with open('/empty', 'rb') as fh:
+            with self.assertRaises(ValueError):
+                mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        with open('/data', 'rb') as fh:
+            with self.assertRaises(ValueError):
+                mmap.mmap(fh.fileno(), 100, access=mmap.ACCESS_READ)
+
+    def test_text_contents_are_encoded(self):
+        with open('/text', 'rb') as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self.assertEqual(mm[:], b'abc\n')
+
+    def test_real_files_use_real_mmap(self):
+        # Mock files open at the same time must not shadow the real one
+        mock_files = [open('/data', 'rb') for _ in range(16)]
+        self.addCleanup(lambda: [fh.close() for fh in mock_files])
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.unlink, path)
+        with mockfs.storage.original_open(fd, 'r+b') as fh:
+            fh.write(b'real')
+            fh.flush()
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self.assertNotIsInstance(mm, memmap.MockMmap)
+            self.assertIsInstance(mm, mmap.mmap)
+            self.assertEqual(mm[:], b'real')
+            mm.close()
+            self.assertEqual(os.stat(fh.fileno()).st_size, 4)
+
+    def test_closed_file_number(self):
+        with open('/data', 'rb') as fh:
+            fileno = fh.fileno()
+        self.assertLess(fileno, 0)
+        with self.assertRaises(OSError) as ctx:
+            mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        self.assertEqual(ctx.exception.errno, errno.EBADF)
+        with self.assertRaises(OSError) as ctx:
+            os.stat(fileno)
+        self.assertEqual(ctx.exception.errno, errno.EBADF)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# subjects under test
+import glob
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import mockfs
+from mockfs import mirror
+
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self._write('a/a.txt', b'a\n')
+        self._write('a/b/b.txt', b'b1\nb2\n')
+        self._write('c.bin', b'\xff' * 64)
+        self.mfs = mockfs.MockFS.from_directory(self.tmpdir, mount_at='/src')
+        mockfs.replace_builtins(context=self.mfs)
+
+    def tearDown(self):
+        mockfs.restore_builtins()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, path, content):
+        path = os.path.join(self.tmpdir, path)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+
+    def test_listdir(self):
+        self.assertEqual(os.listdir('/src'), ['a', 'c.bin'])
+        self.assertEqual(os.listdir('/src/a'), ['a.txt', 'b'])
+        self.assertTrue(os.path.isdir('/src/a/b'))
+        self.assertTrue(os.path.isfile('/src/a/b/b.txt'))
+        self.assertEqual(os.path.getsize('/src/c.bin'), 64)
+
+    def test_read(self):
+        with open('/src/a/b/b.txt', 'r') as fh:
+            self.assertEqual(fh.readlines(), ['b1\n', 'b2\n'])
+        with open('/src/c.bin', 'rb') as fh:
+            self.assertEqual(fh.read(), b'\xff' * 64)
+
+    def test_modification_times(self):
+        real_stat = mockfs.mfs.builtins['os.stat']
+        for path in ('a', 'a/a.txt', 'a/b', 'c.bin'):
+            real = real_stat(os.path.join(self.tmpdir, path)).st_mtime_ns
+            self.assertEqual(os.stat('/src/' + path).st_mtime_ns, real)
+        real = real_stat(self.tmpdir).st_mtime_ns
+        self.assertEqual(os.stat('/src').st_mtime_ns, real)
+        mfs = mockfs.MockFS.from_directory(self.tmpdir)
+        self.assertEqual(mfs.stat('/').st_mtime_ns, real)
+
+    def test_glob(self):
+        values = glob.glob('/src/**/*.txt', recursive=True)
+        self.assertEqual(values, ['/src/a/a.txt', '/src/a/b/b.txt'])
+
+    def test_directories_are_listed_lazily(self):
+        # The listing is read when the directory is first touched
+        mockfs.restore_builtins()
+        self._write('a/late.txt', b'late')
+        mockfs.replace_builtins(context=self.mfs)
+        self.assertTrue(os.path.isfile('/src/a/late.txt'))
+
+    def test_concurrent_readers_load_once(self):
+        mfs = mockfs.MockFS(thread_safe=True)
+        mfs.mount_directory('/src', self.tmpdir)
+        load_entries = mirror.MirroredDirectory.load_entries
+        sources = []
+
+        def slow_load_entries(directory):
+            sources.append(directory.source)
+            for item in load_entries(directory):
+                time.sleep(0.01)
+                yield item
+
+        barrier = threading.Barrier(4)
+        results = []
+
+        def reader():
+            barrier.wait()
+            results.append(sorted(mfs.listdir('/src/a')))
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        with mock.patch.object(
+            mirror.MirroredDirectory, 'load_entries', slow_load_entries
+        ):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [['a.txt', 'b']] * 4)
+        self.assertEqual(sources.count(os.path.join(self.tmpdir, 'a')), 1)
+
+    def test_writes_stay_in_memory(self):
+        with open('/src/a/a.txt', 'w') as fh:
+            fh.write('changed')
+        os.remove('/src/c.bin')
+        with open('/src/a/a.txt', 'r') as fh:
+            self.assertEqual(fh.read(), 'changed')
+        self.assertFalse(os.path.exists('/src/c.bin'))
+
+        mockfs.restore_builtins()
+        with open(os.path.join(self.tmpdir, 'a', 'a.txt'), 'rb') as fh:
+            self.assertEqual(fh.read(), b'a\n')
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'c.bin')))
+        mockfs.replace_builtins(context=self.mfs)
+
+    def test_large_files_are_memory_mapped(self):
+        threshold = mirror.MMAP_THRESHOLD
+        mirror.MMAP_THRESHOLD = 4
+        try:
+            with open('/src/a/b/b.txt', 'rb') as fh:
+                self.assertEqual(list(fh), [b'b1\n', b'b2\n'])
+            self.assertIsInstance(self.mfs.read('/src/a/b/b.txt'), mmap.mmap)
+        finally:
+            mirror.MMAP_THRESHOLD = threshold
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,18 @@
 # subjects under test
+import asyncio
+import contextvars
+import errno
 import glob
 import os
+import pathlib
 import shutil
+import stat
+import threading
+import time
 import unittest
 
 import mockfs
-from mockfs import compat
+from mockfs import compat, util
 
 
 class MockFSTestCase(unittest.TestCase):
@@ -177,6 +184,43 @@ class MockFSTestCase(unittest.TestCase):
         values = glob.glob('/*/a/*')
         self.assertEqual(values, ['/a/a/a', '/a/a/b', '/b/a/a', '/b/a/b'])
 
+    def test_glob_literal(self):
+        self._mkfs()
+        self.assertEqual(glob.glob('/a/a/b'), ['/a/a/b'])
+        self.assertEqual(glob.glob('/a/a/c'), [])
+
+    def test_glob_recursive(self):
+        self._mkfs()
+        self.mfs.add_entries({'/a/b/a/c.py': '', '/a/d.py': ''})
+        values = glob.glob('/a/**/*.py', recursive=True)
+        self.assertEqual(values, ['/a/d.py', '/a/b/a/c.py'])
+
+    def test_glob_recursive_tail(self):
+        self._mkfs()
+        values = glob.glob('/b/a/**', recursive=True)
+        self.assertEqual(values, ['/b/a/', '/b/a/a', '/b/a/b'])
+
+    def test_glob_recursive_directories(self):
+        self._mkfs()
+        values = glob.glob('/a/**/', recursive=True)
+        self.assertEqual(values, ['/a/', '/a/a/', '/a/a/a/', '/a/b/', '/a/b/a/'])
+
+    def test_glob_double_star_without_recursive(self):
+        self._mkfs()
+        values = glob.glob('/a/**/a')
+        self.assertEqual(values, ['/a/a/a', '/a/b/a'])
+
+    def test_iglob(self):
+        self._mkfs()
+        values = glob.iglob('/*/b/*')
+        self.assertEqual(next(values), '/a/b/a')
+        self.assertEqual(list(values), ['/a/b/b', '/b/b/a', '/b/b/b'])
+
+    def test_relative_glob_with_parent_directory(self):
+        self._mkfs()
+        os.chdir('/a/a')
+        self.assertEqual(glob.glob('../b/*'), ['../b/a', '../b/b'])
+
     def test_chdir(self):
         self._mkfs()
         os.chdir('/a/a/a')
@@ -200,6 +244,44 @@ class MockFSTestCase(unittest.TestCase):
         os.chdir('/////a/////')
         self.assertEqual(os.getcwd(), '/a')
 
+    def test_abspath_after_chdir(self):
+        self._mkfs()
+        self.assertEqual(os.path.abspath('a'), '/a')
+        os.chdir('/a')
+        self.assertEqual(os.path.abspath('a'), '/a/a')
+        self.assertEqual(os.path.abspath('../b/./a'), '/b/a')
+        self.assertEqual(os.path.abspath('//a//b/'), '/a/b')
+
+    def test_abspath_bytes(self):
+        self._mkfs()
+        self.assertEqual(os.path.abspath(b'/a'), b'/a')
+        self.assertEqual(os.path.abspath(b'//a//b/../c'), b'/a/c')
+        self.assertEqual(os.path.abspath('/a'), '/a')
+        os.chdir('/a')
+        self.assertEqual(os.path.abspath(b'b'), b'/a/b')
+        self.assertEqual(os.path.abspath(b'\xff'), b'/a/\xff')
+
+    def test_abspath_cache_info(self):
+        self._mkfs()
+        info = self.mfs.abspath_cache_info()
+        os.path.exists('/a/b')
+        os.path.exists('/a/b')
+        after = self.mfs.abspath_cache_info()
+        self.assertEqual(after.misses, info.misses + 1)
+        self.assertEqual(after.hits, info.hits + 1)
+
+        # Changing directories invalidates entries but keeps the counters
+        os.chdir('/a')
+        after_chdir = self.mfs.abspath_cache_info()
+        self.assertEqual(after_chdir.currsize, 0)
+        self.assertTrue(after_chdir.hits >= after.hits)
+
+    def test_abspath_cache_is_bounded(self):
+        mfs = mockfs.MockFS(abspath_cache_size=2)
+        for name in ('a', 'b', 'c', 'd'):
+            mfs.abspath(name)
+        self.assertEqual(mfs.abspath_cache_info().currsize, 2)
+
     def test_no_getcwdu_on_python3(self):
         """os.getcwd() should not exist on python3"""
         # Ensures that we don't patch os.getcwdu on Python3.
@@ -231,6 +313,209 @@ class MockFSTestCase(unittest.TestCase):
         entries = os.listdir('.')
         self.assertEqual(entries, ['a', 'b', 'c'])
 
+    def test_scandir(self):
+        self.mfs.add_entries({'/a/b': 'xyz', '/a/c/d': ''})
+        with os.scandir('/a') as it:
+            entries = list(it)
+        self.assertEqual([entry.name for entry in entries], ['b', 'c'])
+        self.assertEqual([entry.path for entry in entries], ['/a/b', '/a/c'])
+        self.assertTrue(entries[0].is_file())
+        self.assertFalse(entries[0].is_dir())
+        self.assertFalse(entries[0].is_symlink())
+        self.assertEqual(entries[0].stat().st_size, 3)
+        self.assertTrue(entries[1].is_dir())
+        self.assertEqual(os.fspath(entries[1]), '/a/c')
+
+    def test_stat(self):
+        self.mfs.add_entries({'/a/b': 'xyz', '/a/c/d': ''})
+        result = os.stat('/a/b')
+        self.assertTrue(stat.S_ISREG(result.st_mode))
+        self.assertEqual(result.st_size, 3)
+        self.assertEqual(result.st_nlink, 1)
+        self.assertEqual(result.st_mtime_ns, result.st_ctime_ns)
+        self.assertEqual(result.st_mtime, os.path.getmtime('/a/b'))
+        self.assertEqual(result.st_ctime, os.path.getctime('/a/b'))
+        self.assertEqual(result.st_atime, os.path.getatime('/a/b'))
+        self.assertEqual(os.lstat('/a/b'), result)
+        self.assertTrue(stat.S_ISDIR(os.stat('/a/c').st_mode))
+        self.assertNotEqual(os.stat('/a/c').st_ino, result.st_ino)
+        self.assertEqual(os.stat('/').st_size, mockfs.mfs.DIRECTORY_SIZE)
+        self.assertTrue(os.path.lexists('/a/b'))
+        self.assertFalse(os.path.lexists('/a/x'))
+        self.assertRaises(OSError, os.stat, '/a/x')
+        self.assertRaises(OSError, os.path.getmtime, '/a/x')
+
+    def test_stat_open_file(self):
+        self.mfs.add_entries({'/a/b': 'xyz'})
+        with open('/a/b') as fh:
+            self.assertEqual(os.stat(fh.fileno()), os.stat('/a/b'))
+
+    def test_stat_mtime_changes_on_write(self):
+        self.mfs.add_entries({'/src/a': 'a', '/src/b': 'b'})
+        before = os.stat('/src/a').st_mtime_ns
+        time.sleep(0.001)
+        with open('/out', 'w') as fh:
+            fh.write('built')
+        self.assertGreater(os.stat('/out').st_mtime_ns, before)
+        self.assertEqual(os.stat('/src/b').st_mtime_ns, before)
+
+        snapshot = self.mfs.snapshot()
+        time.sleep(0.001)
+        with open('/src/a', 'a') as fh:
+            fh.write('a')
+        self.assertGreater(os.stat('/src/a').st_mtime_ns, os.stat('/out').st_mtime_ns)
+        self.mfs.restore(snapshot)
+        self.assertEqual(os.stat('/src/a').st_mtime_ns, before)
+
+        os.remove('/out')
+        self.mfs.add_entries({'/out': ''})
+        self.assertGreater(os.stat('/out').st_mtime_ns, before)
+
+    def test_directory_mtime_changes_with_children(self):
+        self.mfs.add_entries({'/d/a': 'a', '/e': {}})
+
+        def check(path, changed, func, *args):
+            before = os.stat(path).st_mtime_ns
+            time.sleep(0.001)
+            func(*args)
+            if changed:
+                self.assertGreater(os.stat(path).st_mtime_ns, before)
+            else:
+                self.assertEqual(os.stat(path).st_mtime_ns, before)
+
+        check('/d', True, self.mfs.add_entries, {'/d/b': 'b'})
+        check('/d', False, self.mfs.add_entries, {'/d/b': 'changed'})
+        check('/d', True, os.remove, '/d/b')
+        check('/', True, os.makedirs, '/f/g')
+        check('/f', True, os.rmdir, '/f/g')
+        check('/', True, shutil.rmtree, '/f')
+        check('/d', True, os.rename, '/d/a', '/e/a')
+        check('/e', True, os.rename, '/e/a', '/e/b')
+        check('/e', True, os.symlink, '/e/b', '/e/link')
+        with open('/e/new', 'w') as fh:
+            fh.write('new')
+        check('/e', False, self.mfs.add_entries, {'/e/new': 'changed'})
+
+    def test_inode_is_kept_by_rename(self):
+        self.mfs.add_entries({'/d/sub/f': 'f', '/d/g': 'g'})
+        f = os.stat('/d/sub/f').st_ino
+        g = os.stat('/d/g').st_ino
+        sub = os.stat('/d/sub').st_ino
+        os.rename('/d/g', '/h')
+        self.assertEqual(os.stat('/h').st_ino, g)
+        os.rename('/d', '/moved')
+        self.assertEqual(os.stat('/moved/sub').st_ino, sub)
+        self.assertEqual(os.stat('/moved/sub/f').st_ino, f)
+        os.rename('/h', '/moved/sub/h')
+        self.assertEqual(os.stat('/moved/sub/h').st_ino, g)
+        entries = {entry.name: entry.inode() for entry in os.scandir('/moved/sub')}
+        self.assertEqual(entries, {'f': f, 'h': g})
+
+        snapshot = self.mfs.snapshot()
+        other = mockfs.MockFS()
+        other.restore(snapshot)
+        self.assertEqual(other.stat('/moved/sub/h').st_ino, g)
+
+        # Copies are new files
+        self.mfs.copytree('/moved', '/copy')
+        inodes = {os.stat(path).st_ino for path in ('/copy/sub/f', '/copy/sub/h')}
+        self.assertFalse(inodes & {f, g})
+        os.remove('/moved/sub/h')
+        self.mfs.add_entries({'/moved/sub/h': 'new'})
+        self.assertNotEqual(os.stat('/moved/sub/h').st_ino, g)
+
+    def test_new_entries_at_renamed_paths_are_new_files(self):
+        self.mfs.add_entries({'/a': 'x', '/d/x': 'x'})
+        os.rename('/a', '/b')
+        self.mfs.add_entries({'/a': 'y'})
+        self.assertFalse(os.path.samefile('/a', '/b'))
+        os.rename('/d', '/e')
+        self.mfs.add_entries({'/d/x': 'y', '/e/y': 'y'})
+        self.assertFalse(os.path.samefile('/d', '/e'))
+        self.assertFalse(os.path.samefile('/d/x', '/e/x'))
+        os.makedirs('/d/y')
+        self.assertFalse(os.path.samefile('/d/y', '/e/y'))
+        with open('/d/z', 'w', encoding='utf-8') as fh:
+            fh.write('z')
+        z = os.stat('/d/z').st_ino
+        os.rename('/d/z', '/e/z')
+        self.assertEqual(os.stat('/e/z').st_ino, z)
+        os.symlink('/e', '/d/z')
+        self.assertNotEqual(os.lstat('/d/z').st_ino, z)
+
+    def test_scandir_stat(self):
+        self.mfs.add_entries({'/a/b': 'xyz'})
+        os.chdir('/a')
+        entry = next(os.scandir('.'))
+        self.assertEqual(entry.stat(), os.stat('/a/b'))
+        self.assertEqual(entry.inode(), os.stat('/a/b').st_ino)
+
+    def test_scandir_relative(self):
+        self.mfs.add_entries({'/a/b': ''})
+        os.chdir('/a')
+        self.assertEqual([entry.path for entry in os.scandir()], ['./b'])
+
+    def test_scandir_errors(self):
+        self.mfs.add_entries({'/a/b': ''})
+        self.assertRaises(OSError, os.scandir, '/missing')
+        self.assertRaises(OSError, os.scandir, '/a/b')
+
+    def test_walk(self):
+        self._mkfs()
+        result = list(os.walk('/a'))
+        self.assertEqual(
+            result,
+            [
+                ('/a', ['a', 'b'], []),
+                ('/a/a', ['a'], ['b']),
+                ('/a/a/a', [], []),
+                ('/a/b', ['a'], ['b']),
+                ('/a/b/a', [], []),
+            ],
+        )
+
+    def test_walk_bottom_up(self):
+        self._mkfs()
+        dirpaths = [dirpath for dirpath, _, _ in os.walk('/a', topdown=False)]
+        self.assertEqual(dirpaths, ['/a/a/a', '/a/a', '/a/b/a', '/a/b', '/a'])
+
+    def test_walk_prunes_dirs(self):
+        self._mkfs()
+        dirpaths = []
+        for dirpath, dirs, _ in os.walk('/'):
+            dirpaths.append(dirpath)
+            if 'a' in dirs:
+                dirs.remove('a')
+        self.assertEqual(dirpaths, ['/', '/b', '/b/b'])
+
+    def test_walk_relative(self):
+        self._mkfs()
+        os.chdir('/a')
+        dirpaths = [dirpath for dirpath, _, _ in os.walk('b')]
+        self.assertEqual(dirpaths, ['b', 'b/a'])
+
+    def test_walk_path_like(self):
+        self._mkfs()
+        dirpaths = [dirpath for dirpath, _, _ in os.walk(pathlib.Path('/a/a'))]
+        self.assertEqual(dirpaths, ['/a/a', '/a/a/a'])
+        dirpaths = [item[0] for item in self.mfs.fwalk(pathlib.PurePath('/b/b'))]
+        self.assertEqual(dirpaths, ['/b/b', '/b/b/a'])
+
+    def test_walk_onerror(self):
+        self._mkfs()
+        errors = []
+        self.assertEqual(list(os.walk('/missing', onerror=errors.append)), [])
+        self.assertEqual(list(os.walk('/a/a/b', onerror=errors.append)), [])
+        self.assertEqual([err.errno for err in errors], [errno.ENOENT, errno.ENOTDIR])
+
+    def test_fwalk(self):
+        self._mkfs()
+        result = list(self.mfs.fwalk('/b/b'))
+        self.assertEqual(
+            [item[:3] for item in result], [('/b/b', ['a'], ['b']), ('/b/b/a', [], [])]
+        )
+        self.assertNotEqual(result[0][3], result[1][3])
+
     def test_os_getsize(self):
         filesystem = {
             '/a/a': '',
@@ -251,7 +536,7 @@ class MockFSTestCase(unittest.TestCase):
         }
         self.mfs.add_entries(filesystem)
         dir_size = os.path.getsize('/a')
-        self.assertEqual(dir_size, 2)
+        self.assertEqual(dir_size, mockfs.mfs.DIRECTORY_SIZE)
 
     def test_os_getsize_subdir(self):
         filesystem = {
@@ -276,6 +561,95 @@ class MockFSTestCase(unittest.TestCase):
         shutil.rmtree('/a')
         self.assertEqual(os.listdir('/'), [])
 
+    def test_shutil_rmtree_removes_descendants(self):
+        self._mkfs()
+        shutil.rmtree('/a')
+        self.assertFalse(os.path.exists('/a/a/b'))
+        self.assertFalse(os.path.isdir('/a/b/a'))
+        self.assertTrue(os.path.isfile('/b/a/b'))
+
+    def test_copytree(self):
+        self._mkfs()
+        self.mfs.copytree('/a', '/c')
+        self.assertTrue(os.path.isdir('/c/a/a'))
+        self.assertTrue(os.path.isfile('/c/b/b'))
+
+        os.remove('/c/a/b')
+        self.assertFalse(os.path.exists('/c/a/b'))
+        self.assertTrue(os.path.isfile('/a/a/b'))
+
+    def test_copytree_is_isolated(self):
+        self._mkfs()
+        self.mfs.copytree('/a', '/c')
+        self.mfs.add_entries({'/a/a/c': 'a', '/c/b/c': 'c'})
+        self.assertFalse(os.path.exists('/c/a/c'))
+        self.assertFalse(os.path.exists('/a/b/c'))
+        shutil.rmtree('/c/a')
+        self.assertTrue(os.path.isdir('/a/a/a'))
+
+    def test_snapshot_and_restore(self):
+        self._mkfs()
+        snapshot = self.mfs.snapshot()
+
+        os.remove('/a/a/b')
+        shutil.rmtree('/b')
+        self.mfs.add_entries({'/a/b/a/c': 'c'})
+        self.assertEqual(os.listdir('/'), ['a'])
+
+        self.mfs.restore(snapshot)
+        self.assertEqual(os.listdir('/'), ['a', 'b'])
+        self.assertTrue(os.path.isfile('/a/a/b'))
+        self.assertTrue(os.path.isfile('/b/b/b'))
+        self.assertFalse(os.path.exists('/a/b/a/c'))
+
+        # Snapshots can be restored more than once
+        os.remove('/a/a/b')
+        self.mfs.restore(snapshot)
+        self.assertTrue(os.path.isfile('/a/a/b'))
+
+    def test_snapshot_is_immutable(self):
+        self._mkfs()
+        snapshot = self.mfs.snapshot()
+        self.mfs.add_entries({'/a/a/c': 'c'})
+        other = mockfs.MockFS()
+        other.restore(snapshot)
+        self.assertFalse(other.exists('/a/a/c'))
+        other.add_entries({'/a/a/d': 'd'})
+        self.assertFalse(self.mfs.exists('/a/a/d'))
+
+    def test_add_entries_from_pairs(self):
+        pairs = (('/a/%s' % name, name) for name in ('x', 'y', 'z'))
+        self.mfs.add_entries(pairs)
+        self.assertEqual(os.listdir('/a'), ['x', 'y', 'z'])
+        self.assertEqual(self.mfs.read('/a/y'), 'y')
+
+    def test_add_entries_relative_paths(self):
+        self._mkfs()
+        os.chdir('/a/b')
+        self.mfs.add_entries({'c': 'c', '../d/./e/': {}})
+        self.assertTrue(os.path.isfile('/a/b/c'))
+        self.assertTrue(os.path.isdir('/a/d/e'))
+
+    def test_add_entries_replaces_file_with_directory(self):
+        self._mkfs()
+        self.mfs.add_entries([('/a/a/b/c', 'c'), ('/a/a/b/d', 'd')])
+        self.assertTrue(os.path.isdir('/a/a/b'))
+        self.assertEqual(os.listdir('/a/a/b'), ['c', 'd'])
+
+    def test_add_entries_replaces_directory(self):
+        self._mkfs()
+        self.mfs.add_entries({'/a/a': 'file'})
+        self.assertTrue(os.path.isfile('/a/a'))
+        self.assertFalse(os.path.exists('/a/a/a'))
+        self.assertFalse(os.path.exists('/a/a/b'))
+
+    def test_add_entries_merges_directories(self):
+        self.mfs.add_entries({'/a': {'b': {'c': 'c'}}})
+        self.mfs.add_entries({'/a': {'b': {'d': 'd'}}})
+        self.assertEqual(os.listdir('/a/b'), ['c', 'd'])
+        self.assertTrue(os.path.isfile('/a/b/c'))
+        self.assertTrue(os.path.isfile('/a/b/d'))
+
     def test_os_makedirs_creates_new_entry(self):
         os.makedirs('/new/directory')
         self.assertTrue(os.path.isdir('/new/directory'))
@@ -287,6 +661,332 @@ class MockFSTestCase(unittest.TestCase):
         os.makedirs('/new/directory')
         self.assertRaises(OSError, os.makedirs, '/new/directory')
 
+    def test_thread_safe(self):
+        mfs = mockfs.MockFS(thread_safe=True)
+        mfs.add_entries({'/shared/keep': ''})
+        mockfs.replace_builtins(context=mfs)
+        errors = []
+
+        def worker(idx):
+            try:
+                for count in range(50):
+                    path = '/t%d/%d/f' % (idx, count)
+                    os.makedirs(os.path.dirname(path))
+                    with open(path, 'w') as fh:
+                        fh.write('x')
+                    self.assertTrue(os.path.exists('/shared/keep'))
+                    self.assertEqual(os.listdir(os.path.dirname(path)), ['f'])
+                shutil.rmtree('/t%d/0' % idx)
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(os.listdir('/t3')), 49)
+        self.assertEqual(mfs.read('/t7/49/f'), 'x')
+
+    def test_thread_safe_with_stats(self):
+        mfs = mockfs.MockFS(thread_safe=True, enable_stats=True)
+        mfs.disable_stats()
+        self.assertTrue('exists' in mfs.__dict__)
+        mfs.add_entries({'/a': ''})
+        self.assertTrue(mfs.exists('/a'))
+
+    def test_context_binding_overrides_installed_fs(self):
+        self.mfs.add_entries({'/installed': ''})
+        other = mockfs.MockFS(entries={'/other': ''})
+        with other:
+            self.assertTrue(os.path.exists('/other'))
+            self.assertFalse(os.path.exists('/installed'))
+            self.assertIs(mockfs.mfs.current(), other)
+        self.assertTrue(os.path.exists('/installed'))
+        self.assertIs(mockfs.mfs.current(), self.mfs)
+
+    def test_context_binding_is_thread_local(self):
+        results = {}
+        barrier = threading.Barrier(4)
+
+        def worker(idx):
+            with mockfs.MockFS(entries={'/t%d' % idx: ''}):
+                barrier.wait()
+                results[idx] = sorted(os.listdir('/'))
+
+        threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {idx: ['t%d' % idx] for idx in range(4)})
+
+    def test_context_binding_is_task_local(self):
+        async def task(idx):
+            with mockfs.MockFS(entries={'/t%d' % idx: 'x'}):
+                await asyncio.sleep(0)
+                with open('/t%d' % idx) as fh:
+                    return os.listdir('/'), fh.read()
+
+        async def main():
+            return await asyncio.gather(task(0), task(1))
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [(['t0'], 'x'), (['t1'], 'x')])
+
+    def test_restore_builtins_ends_active_bindings(self):
+        with mockfs.MockFS(entries={'/bound': ''}):
+            mockfs.restore_builtins()
+            self.assertIs(os.path.exists, mockfs.mfs.builtins['os.path.exists'])
+            self.assertIsNone(mockfs.mfs.current())
+            mfs = mockfs.replace_builtins(entries={'/installed': ''})
+            self.assertIs(mockfs.mfs.current(), mfs)
+        self.assertTrue(os.path.exists('/installed'))
+        mockfs.restore_builtins()
+        contextvars.copy_context().run(mockfs.MockFS().__enter__)
+        mockfs.restore_builtins()
+        self.assertIs(os.path.exists, mockfs.mfs.builtins['os.path.exists'])
+
+    def test_exit_in_another_context(self):
+        mockfs.restore_builtins()
+        mfs = mockfs.MockFS(entries={'/bound': ''})
+        contextvars.copy_context().run(mfs.__enter__)
+        self.assertIsNot(os.path.exists, mockfs.mfs.builtins['os.path.exists'])
+        mfs.__exit__(None, None, None)
+        self.assertIs(os.path.exists, mockfs.mfs.builtins['os.path.exists'])
+
+    def test_names_are_interned(self):
+        self.mfs.add_entries([('/a/' + 'x' * 3, ''), ('/b/' + 'x' * 3, '')])
+        self.assertIs(os.listdir('/a')[0], os.listdir('/b')[0])
+
+    def test_dedup_contents(self):
+        mfs = mockfs.MockFS(dedup_contents=True)
+        mfs.add_entries({'/a/x': 'c' * 100, '/b/x': 'c' * 100, '/b/y': 'other'})
+        self.assertIs(mfs.read('/a/x'), mfs.read('/b/x'))
+        self.assertEqual(mfs.content_info(), util.ContentInfo(2, 3, 105))
+        mfs.remove('/a/x')
+        self.assertEqual(mfs.content_info(), util.ContentInfo(2, 2, 105))
+        snapshot = mfs.snapshot()
+        mfs.rmtree('/b')
+        self.assertEqual(mfs.content_info(), util.ContentInfo(0, 0, 0))
+        mfs.restore(snapshot)
+        self.assertEqual(mfs.content_info(), util.ContentInfo(2, 2, 105))
+        mfs.copytree('/b', '/c')
+        mfs.add_entries({'/c/y': 'changed'})
+        self.assertEqual(mfs.content_info(), util.ContentInfo(3, 4, 112))
+        self.assertEqual(self.mfs.content_info(), None)
+
+    def test_dedup_contents_of_a_file_replaced_by_a_directory(self):
+        mfs = mockfs.MockFS(dedup_contents=True)
+        mfs.add_entries({'/a': 'c' * 10, '/b': 'other'})
+        mfs.add_entries({'/a/x': 'other'})
+        self.assertTrue(mfs.isdir('/a'))
+        self.assertEqual(mfs.content_info(), util.ContentInfo(1, 2, 5))
+
+    def test_symlink(self):
+        self.mfs.add_entries({'/data/file': 'contents', '/data/dir/x': ''})
+        os.symlink('/data/file', '/link')
+        os.symlink('dir', '/data/dirlink')
+        self.assertTrue(os.path.islink('/link'))
+        self.assertFalse(os.path.islink('/data/file'))
+        self.assertEqual(os.readlink('/link'), '/data/file')
+        self.assertEqual(os.path.realpath('/data/dirlink/x'), '/data/dir/x')
+        with open('/link', encoding='utf-8') as fh:
+            self.assertEqual(fh.read(), 'contents')
+        self.assertTrue(os.path.isdir('/data/dirlink'))
+        self.assertEqual(os.listdir('/data/dirlink'), ['x'])
+        self.assertTrue(stat.S_ISLNK(os.lstat('/link').st_mode))
+        self.assertEqual(os.stat('/link').st_size, len('contents'))
+        # Writing through a link writes to its target
+        with open('/data/dirlink/x', 'w', encoding='utf-8') as fh:
+            fh.write('written')
+        self.assertEqual(self.mfs.read('/data/dir/x'), 'written')
+        self.assertRaises(OSError, os.symlink, '/elsewhere', '/link')
+        self.assertRaises(OSError, os.readlink, '/data/file')
+
+    def test_symlink_broken_and_loop(self):
+        os.symlink('/missing', '/broken')
+        self.assertFalse(os.path.exists('/broken'))
+        self.assertTrue(os.path.lexists('/broken'))
+        os.symlink('/b', '/a')
+        os.symlink('/a', '/b')
+        with self.assertRaises(OSError) as ctx:
+            os.stat('/a')
+        self.assertEqual(ctx.exception.errno, errno.ELOOP)
+
+    def test_symlink_loop_through_a_path(self):
+        self.mfs.add_entries({'/w/file': ''})
+        os.symlink('/w', '/w/self')
+        self.assertTrue(os.path.exists('/w/self/self/file'))
+        with self.assertRaises(OSError) as ctx:
+            os.stat('/w' + '/self' * 41)
+        self.assertEqual(ctx.exception.errno, errno.ELOOP)
+        errors = []
+        paths = [path for path, _, _ in os.walk('/w', True, errors.append, True)]
+        self.assertEqual(len(paths), 41)
+        self.assertEqual([err.errno for err in errors], [errno.ELOOP])
+
+    def test_symlink_loop_glob(self):
+        os.symlink('/loop', '/loop')
+        self.assertEqual(glob.glob('/loop/*'), [])
+        self.assertEqual(glob.glob('/loop'), ['/loop'])
+
+    def test_symlink_loop_predicates(self):
+        os.symlink('/loop', '/loop')
+        self.assertFalse(os.path.exists('/loop'))
+        self.assertTrue(os.path.lexists('/loop'))
+        self.assertFalse(os.path.isdir('/loop'))
+        self.assertFalse(os.path.isfile('/loop'))
+        for predicate in (
+            os.path.exists,
+            os.path.lexists,
+            os.path.isdir,
+            os.path.isfile,
+        ):
+            self.assertFalse(predicate('/loop/child'), predicate)
+
+    def test_symlink_resolution_is_invalidated(self):
+        self.mfs.add_entries({'/one/x': '1', '/two/x': '2'})
+        os.symlink('/one', '/current')
+        self.assertEqual(self.mfs.read('/current/x'), '1')
+        os.remove('/current')
+        self.assertTrue(os.path.exists('/one/x'))
+        os.symlink('/two', '/current')
+        self.assertEqual(self.mfs.read('/current/x'), '2')
+        self.mfs.add_entries({'/current': mockfs.Symlink('/one')})
+        self.assertEqual(os.path.realpath('/current/x'), '/one/x')
+
+    def test_symlink_walk_and_glob(self):
+        self.mfs.add_entries({'/top/real/x': '', '/target/y': ''})
+        os.symlink('/target', '/top/link')
+        self.assertEqual(
+            list(os.walk('/top')),
+            [('/top', ['real', 'link'], []), ('/top/real', [], ['x'])],
+        )
+        self.assertEqual(
+            [path for path, _, _ in os.walk('/top', followlinks=True)],
+            ['/top', '/top/real', '/top/link'],
+        )
+        self.assertEqual(sorted(glob.glob('/top/*/*')), ['/top/link/y', '/top/real/x'])
+        entries = {entry.name: entry for entry in os.scandir('/top')}
+        self.assertTrue(entries['link'].is_symlink())
+        self.assertTrue(entries['link'].is_dir())
+        self.assertFalse(entries['link'].is_dir(follow_symlinks=False))
+
+    def test_rename(self):
+        self.mfs.add_entries({'/a/x': 'x', '/a/sub/y': 'y', '/b/z': 'z'})
+        mtime = os.path.getmtime('/a/x')
+        # Warm the index so that stale paths would be noticed
+        self.assertTrue(os.path.exists('/a/sub/y'))
+        os.rename('/a/x', '/b/x')
+        self.assertFalse(os.path.exists('/a/x'))
+        self.assertEqual(self.mfs.read('/b/x'), 'x')
+        self.assertEqual(os.path.getmtime('/b/x'), mtime)
+        snapshot = self.mfs.snapshot()
+        os.rename('/a', '/c')
+        self.assertFalse(os.path.exists('/a/sub/y'))
+        self.assertEqual(self.mfs.read('/c/sub/y'), 'y')
+        self.mfs.add_entries({'/c/sub/y': 'changed'})
+        self.mfs.restore(snapshot)
+        self.assertEqual(self.mfs.read('/a/sub/y'), 'y')
+        self.assertFalse(os.path.exists('/c'))
+
+    def test_rename_errors(self):
+        self.mfs.add_entries({'/a/x': 'x', '/a/y': 'y', '/d/f': '', '/e': {}})
+        os.rename('/a/x', '/a/x')
+        os.replace('/a/x', '/a/y')
+        self.assertEqual(os.listdir('/a'), ['y'])
+        self.assertEqual(self.mfs.read('/a/y'), 'x')
+        for src, dst, err in (
+            ('/missing', '/a/z', errno.ENOENT),
+            ('/a/y', '/missing/z', errno.ENOENT),
+            ('/a/y', '/e', errno.EISDIR),
+            ('/e', '/a/y', errno.ENOTDIR),
+            ('/a', '/d', errno.ENOTEMPTY),
+            ('/a', '/a/sub', errno.EINVAL),
+        ):
+            with self.assertRaises(OSError) as ctx:
+                os.rename(src, dst)
+            self.assertEqual(ctx.exception.errno, err)
+        os.rename('/a', '/e')
+        self.assertEqual(os.listdir('/e'), ['y'])
+
+    def test_move(self):
+        self.mfs.add_entries({'/src/x': 'x', '/dst': {}, '/file': ''})
+        self.assertEqual(shutil.move('/src', '/dst'), '/dst/src')
+        self.assertEqual(self.mfs.read('/dst/src/x'), 'x')
+        self.assertEqual(shutil.move('/file', '/renamed'), '/renamed')
+        self.mfs.add_entries({'/file': '', '/dst/file': ''})
+        self.assertRaises(shutil.Error, shutil.move, '/file', '/dst')
+        self.assertRaises(shutil.Error, shutil.move, '/dst', '/dst/src')
+
+    def test_journal(self):
+        self.mfs.add_entries({'/keep/a': 'a', '/keep/b': 'b', '/tree/x/y': 'y'})
+        self.assertRaises(ValueError, self.mfs.changes_since)
+        self.mfs.enable_journal()
+        mark = self.mfs.journal_mark()
+        with open('/keep/a', 'w', encoding='utf-8') as fh:
+            fh.write('changed')
+        with open('/keep/new', 'w', encoding='utf-8') as fh:
+            fh.write('new')
+        os.remove('/keep/b')
+        os.makedirs('/made/deep')
+        self.mfs.add_entries({'/tmp/scratch': ''})
+        os.remove('/tmp/scratch')
+        self.mfs.add_entries({'/tree/x/z': 'z'})
+        shutil.rmtree('/tree')
+        self.mfs.copytree('/keep', '/copy')
+        os.rename('/copy', '/moved')
+        self.assertEqual(
+            self.mfs.changes_since(mark),
+            {
+                '/keep/a': 'modified',
+                '/keep/new': 'created',
+                '/keep/b': 'deleted',
+                '/made': 'created',
+                '/made/deep': 'created',
+                '/tmp': 'created',
+                '/tree': 'deleted',
+                '/moved': 'created',
+            },
+        )
+        mark = self.mfs.journal_mark()
+        self.mfs.add_entries({'/keep/b': 'again'})
+        self.assertEqual(self.mfs.changes_since(mark), {'/keep/b': 'created'})
+        self.assertEqual(self.mfs.changes_since()['/keep/b'], 'modified')
+
+    def test_journal_changes_below_a_new_subtree(self):
+        self.mfs.add_entries({'/src/f': 'f'})
+        self.mfs.enable_journal()
+        mark = self.mfs.journal_mark()
+        self.mfs.copytree('/src', '/dst')
+        with open('/dst/f', 'w', encoding='utf-8') as fh:
+            fh.write('changed')
+        self.assertEqual(
+            self.mfs.changes_since(mark), {'/dst': 'created', '/dst/f': 'created'}
+        )
+
+    def test_journal_changes_below_a_replaced_subtree(self):
+        self.mfs.add_entries({'/a/x': 'x'})
+        self.mfs.enable_journal()
+        mark = self.mfs.journal_mark()
+        shutil.rmtree('/a')
+        self.mfs.add_entries({'/a/x': 'again'})
+        self.assertEqual(self.mfs.changes_since(mark), {'/a': 'modified'})
+
+    def test_journal_changes_below_a_renamed_subtree(self):
+        self.mfs.add_entries({'/a/f': 'f'})
+        self.mfs.enable_journal()
+        mark = self.mfs.journal_mark()
+        os.rename('/a', '/src')
+        os.rename('/src', '/a')
+        os.rename('/a', '/src')
+        os.remove('/src/f')
+        self.assertEqual(
+            self.mfs.changes_since(mark), {'/a': 'deleted', '/src': 'created'}
+        )
+
 
 def test_mockfs_context_manager():
     """Ensure that the context manager works as advertised"""
@@ -300,6 +1000,7 @@ def test_mockfs_context_manager():
     # Context manager scope ends: everything is back to normal now.
     assert not os.path.exists('/tmp/does/not/exist')
     assert not os.path.exists('/tmp/does/not/exist-2')
+    assert os.path.exists is mockfs.mfs.builtins['os.path.exists']
 
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+# subjects under test
+import os
+import unittest
+
+import mockfs
+from mockfs import stats, storage
+
+
+class StatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mfs = mockfs.replace_builtins()
+        self.mfs.add_entries({'/a/a': 'a\nb\n', '/a/b': 'b'})
+
+    def tearDown(self):
+        mockfs.restore_builtins()
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.mfs.stats(), {})
+        self.assertFalse('exists' in self.mfs.__dict__)
+        with open('/a/a') as fh:
+            self.assertIs(type(fh), storage.file)
+
+    def test_counts(self):
+        self.mfs.enable_stats()
+        os.path.exists('/a/a')
+        os.path.exists('/a/c')
+        os.listdir('/a')
+        result = self.mfs.stats()
+        self.assertEqual(result['exists']['count'], 2)
+        self.assertEqual(result['listdir']['count'], 1)
+        self.assertTrue(result['exists']['total'] >= 0.0)
+        self.assertEqual(sum(n for _, n in result['exists']['histogram']), 2)
+
+    def test_nested_calls_are_not_counted(self):
+        self.mfs.enable_stats()
+        with open('/a/a', 'r') as fh:
+            fh.read()
+        result = self.mfs.stats()
+        self.assertEqual(result['open']['count'], 1)
+        self.assertEqual(result['read']['count'], 1)
+        self.assertEqual(result['close']['count'], 1)
+        self.assertFalse('exists' in result)
+
+    def test_file_operations(self):
+        self.mfs.enable_stats()
+        with open('/a/c', 'w') as fh:
+            fh.write('a\n')
+            fh.write('b\n')
+        with open('/a/c', 'r') as fh:
+            lines = list(fh)
+        self.assertEqual(lines, ['a\n', 'b\n'])
+        result = self.mfs.stats()
+        self.assertEqual(result['open']['count'], 2)
+        self.assertEqual(result['write']['count'], 2)
+        self.assertEqual(result['next']['count'], 3)
+
+    def test_iterators(self):
+        self.mfs.enable_stats()
+        list(os.walk('/'))
+        self.assertEqual(self.mfs.stats()['walk']['count'], 1)
+
+    def test_reset(self):
+        self.mfs.enable_stats()
+        os.path.isdir('/a')
+        self.assertEqual(self.mfs.stats(reset=True)['isdir']['count'], 1)
+        self.assertEqual(self.mfs.stats(), {})
+        os.path.isdir('/a')
+        self.mfs.reset_stats()
+        self.assertEqual(self.mfs.stats(), {})
+
+    def test_disable(self):
+        self.mfs.enable_stats()
+        self.mfs.disable_stats()
+        os.path.exists('/a')
+        self.assertEqual(self.mfs.stats(), {})
+        self.assertFalse('exists' in self.mfs.__dict__)
+        with open('/a/a') as fh:
+            self.assertIs(type(fh), storage.file)
+
+    def test_histogram_buckets(self):
+        recorder = stats.Stats()
+        recorder.record('op', 0.0000005)
+        recorder.record('op', 0.000003)
+        recorder.record('op', 1e6)
+        histogram = recorder.report()['op']['histogram']
+        self.assertEqual(histogram, [(1, 1), (4, 1), (float('inf'), 1)])
+
+
+def test_enable_stats_argument():
+    with mockfs.MockFS(entries={'/tmp/a': 'a'}, enable_stats=True) as mfs:
+        assert os.path.isfile('/tmp/a')
+        assert mfs.stats()['isfile']['count'] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 # subjects under test
+import codecs
 import os
 import unittest
 
@@ -46,6 +47,18 @@ class StorageTestCase(unittest.TestCase):
             fh.close()
             self.assertEqual(data, expected)
 
+    def test_open_directory_for_writing(self):
+        self.mfs.add_entries({'/d/sub/x': 'x'})
+        for mode in ('w', 'a', 'wb'):
+            self.assertRaises(IsADirectoryError, open, '/d', mode)
+        self.assertTrue(os.path.isdir('/d'))
+        self.assertEqual(self.mfs.read('/d/sub/x'), 'x')
+
+    def test_open_directory_for_reading(self):
+        self.mfs.add_entries({'/d/sub/x': 'x'})
+        for mode in ('r', 'rb'):
+            self.assertRaises(IsADirectoryError, open, '/d', mode)
+
     def test_open_rw(self):
         self._mkfs()
         expected = 'just another pythonista'
@@ -75,9 +88,133 @@ class StorageTestCase(unittest.TestCase):
         self.assertEqual(len(data), 4)
         self.assertEqual(data, expected)
 
+    def test_readline(self):
+        self.mfs.add_entries({'/lines': 'one\ntwo\nthree'})
+        with open('/lines', 'r') as fh:
+            self.assertEqual(fh.readline(), 'one\n')
+            self.assertEqual(fh.readline(2), 'tw')
+            self.assertEqual(fh.readline(), 'o\n')
+            self.assertEqual(fh.readline(), 'three')
+            self.assertEqual(fh.readline(), '')
+
+    def test_readline_after_seek(self):
+        self.mfs.add_entries({'/lines': 'one\ntwo\nthree\n'})
+        with open('/lines', 'r') as fh:
+            fh.seek(5)
+            self.assertEqual(fh.readline(), 'wo\n')
+            fh.seek(0)
+            self.assertEqual(fh.readline(), 'one\n')
+
+    def test_iterate_lines(self):
+        self.mfs.add_entries({'/lines': 'one\ntwo\n\nthree'})
+        with open('/lines', 'r') as fh:
+            lines = list(fh)
+        self.assertEqual(lines, ['one\n', 'two\n', '\n', 'three'])
+
+    def test_iterate_lines_bytes(self):
+        self.mfs.add_entries({'/lines': b'one\ntwo\n'})
+        with open('/lines', 'rb') as fh:
+            lines = list(fh)
+        self.assertEqual(lines, [b'one\n', b'two\n'])
+
+    def test_readlines_hint(self):
+        self.mfs.add_entries({'/lines': 'one\ntwo\nthree\n'})
+        with open('/lines', 'r') as fh:
+            self.assertEqual(fh.readlines(5), ['one\n', 'two\n'])
+            self.assertEqual(fh.readlines(), ['three\n'])
+
+    def test_append(self):
+        self.mfs.add_entries({'/log': b'one\n'})
+        with open('/log', 'ab') as fh:
+            for idx in range(3):
+                fh.write(b'record\n')
+        with open('/log', 'rb') as fh:
+            data = fh.read()
+        self.assertEqual(data, b'one\n' + b'record\n' * 3)
+
+    def test_overwrite_in_place(self):
+        with open('/data', 'wb') as fh:
+            fh.write(b'abcdef')
+            fh.seek(1)
+            fh.write(b'XY')
+            fh.seek(0, 2)
+            fh.write(b'!')
+        self.assertEqual(self.mfs.read('/data'), b'aXYdef!')
+
+    def test_write_past_end(self):
+        with open('/data', 'wb') as fh:
+            fh.write(b'ab')
+            fh.seek(4)
+            fh.write(b'c')
+        self.assertEqual(self.mfs.read('/data'), b'ab\x00\x00c')
+
+    def test_flush(self):
+        fh = open('/data', 'wb')
+        fh.write(b'abc')
+        fh.flush()
+        self.assertEqual(self.mfs.read('/data'), b'abc')
+        fh.write(b'def')
+        fh.close()
+        self.assertEqual(self.mfs.read('/data'), b'abcdef')
+
+    def test_truncate_bytes(self):
+        with open('/data', 'wb') as fh:
+            fh.write(b'abcdef')
+            fh.truncate(3)
+        self.assertEqual(self.mfs.read('/data'), b'abc')
+
     def test_dir_not_exists(self):
         self.assertRaises(IOError, open, '/does/not/exist', 'w')
 
+    def test_read_binary_contents_with_encoding(self):
+        self.mfs.add_entries({'/latin': 'caf\xe9'.encode('latin-1')})
+        with open('/latin', 'r', encoding='latin-1') as fh:
+            self.assertEqual(fh.read(), 'caf\xe9')
+        with open('/latin', 'r', encoding='utf-8', errors='replace') as fh:
+            self.assertEqual(fh.read(), 'caf\ufffd')
+
+    def test_read_text_contents_as_binary(self):
+        self.mfs.add_entries({'/text': 'caf\xe9'})
+        with open('/text', 'rb') as fh:
+            self.assertEqual(fh.read(), 'caf\xe9'.encode('utf-8'))
+        with codecs.open('/text', 'r', 'utf-8') as fh:
+            self.assertEqual(fh.read(), 'caf\xe9')
+
+    def test_universal_newlines(self):
+        self.mfs.add_entries({'/lines': 'one\r\ntwo\rthree\n'})
+        with open('/lines', 'r') as fh:
+            self.assertEqual(list(fh), ['one\n', 'two\n', 'three\n'])
+        with open('/lines', 'r', newline='') as fh:
+            self.assertEqual(list(fh), ['one\r\n', 'two\r', 'three\n'])
+        with open('/lines', 'r', newline='\r\n') as fh:
+            self.assertEqual(list(fh), ['one\r\n', 'two\rthree\n'])
+
+    def test_write_newline(self):
+        with open('/default', 'w') as fh:
+            fh.write('a\nb\n')
+        self.assertEqual(self.mfs.read('/default'), 'a' + os.linesep + 'b' + os.linesep)
+        with open('/crlf', 'w', newline='\r\n') as fh:
+            fh.write('a\nb\n')
+        self.assertEqual(self.mfs.read('/crlf'), 'a\r\nb\r\n')
+        self.assertRaises(ValueError, open, '/bad', 'w', newline='x')
+
+    def test_views_are_reused(self):
+        self.mfs.add_entries({'/lines': 'one\r\ntwo\r\n'})
+        with open('/lines', 'r') as fh:
+            first = fh.read()
+        with open('/lines', 'r') as fh:
+            self.assertIs(fh.read(), first)
+
+    def test_views_belong_to_the_filesystem(self):
+        snapshot = self.mfs.snapshot()
+        self.mfs.add_entries({'/lines': 'one\r\ntwo\r\n'})
+        with open('/lines', 'r') as fh:
+            fh.read()
+        self.assertEqual(len(self.mfs.backend.views), 1)
+        self.assertEqual(len(mockfs.MockFS().backend.views), 0)
+        self.mfs.restore(snapshot)
+        self.assertEqual(len(self.mfs.backend.views), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,4 @@
+import threading
 import unittest
 
 from mockfs import util
@@ -48,6 +49,91 @@ class MockFSUtilTestCase(unittest.TestCase):
         util.merge_dicts(src, dst)
         self.assertEqual(dst['a']['b'], 'src')
 
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = util.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+    def test_lru_cache_info(self):
+        cache = util.LRUCache(4)
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('b')
+        cache.clear()
+        self.assertEqual(cache.info(), util.CacheInfo(1, 1, 4, 0))
+
+    def test_rwlock_allows_concurrent_readers(self):
+        lock = util.RWLock()
+        lock.acquire_read()
+        acquired = []
+
+        def reader():
+            lock.acquire_read()
+            acquired.append(True)
+            lock.release_read()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        thread.join(5)
+        lock.release_read()
+        self.assertEqual(acquired, [True])
+
+    def test_rwlock_writer_excludes_readers(self):
+        lock = util.RWLock()
+        lock.acquire_write()
+        acquired = threading.Event()
+
+        def reader():
+            lock.acquire_read()
+            acquired.set()
+            lock.release_read()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        lock.release_write()
+        self.assertTrue(acquired.wait(5))
+        thread.join(5)
+
+    def test_rwlock_is_reentrant(self):
+        lock = util.RWLock()
+        lock.acquire_write()
+        lock.acquire_write()
+        lock.acquire_read()
+        lock.release_read()
+        lock.release_write()
+        lock.release_write()
+        lock.acquire_read()
+        lock.acquire_read()
+        self.assertRaises(RuntimeError, lock.acquire_write)
+        lock.release_read()
+        lock.release_read()
+        lock.acquire_write()
+        lock.release_write()
+
+    def test_content_store_shares_equal_contents(self):
+        store = util.ContentStore()
+        first = store.add(''.join(['con', 'tent']))
+        second = store.add(''.join(['cont', 'ent']))
+        self.assertIs(first, second)
+        self.assertEqual(store.info(), util.ContentInfo(1, 2, 7))
+        store.discard(second)
+        self.assertEqual(len(store), 1)
+        store.discard(first)
+        self.assertEqual(len(store), 0)
+
+    def test_content_store_counts_same_object(self):
+        store = util.ContentStore()
+        value = store.add(b'data')
+        store.add(value)
+        store.discard(value)
+        self.assertEqual(store.info(), util.ContentInfo(1, 1, 4))
+
 
 if __name__ == '__main__':
     unittest.main()